@@ -1,22 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
+from datetime import datetime
+import asyncio
+import base64
+import json
+import logging
 
+from app.services.collections import LiveServices
 from app.services.embeddings import EmbeddingService
 from app.services.vectorstore import VectorStoreService
 from app.services.memory import MemoryService
 from app.services.llm import LLMService
+from app.services.answer_cache import AnswerKey
+from app.services.context_packer import ContextPacker, estimate_tokens
+from app.services.latest_document import LatestDocumentPointer
+from app.services.lexical import LexicalSearchService
+from app.services.retrieval import HybridRetriever, chunk_key
+from app.services.summarizer import ConversationSummarizer
 from app.db.session import get_db
 from app.db import models
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 # Services
-embedder = EmbeddingService()
-vectorstore = VectorStoreService()
+# Kept on the live collection by the collection manager (see app/main.py)
+services = LiveServices(EmbeddingService(), VectorStoreService())
 memory = MemoryService()
 llm = LLMService()
+lexical = LexicalSearchService()
+retriever = HybridRetriever(services, lexical)
+packer = ContextPacker()
+summarizer = ConversationSummarizer(memory, llm)
+latest_document = LatestDocumentPointer()
 
 
 class QueryRequest(BaseModel):
@@ -29,111 +53,89 @@ class QueryRequest(BaseModel):
 class QueryResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
-    document_context: Dict[str, Any] = None  # Info about which document was used
+    document_context: Optional[Dict[str, Any]] = None  # Info about which document was used
 
 
-@router.post("/query", response_model=QueryResponse)
-async def chat_query(request: QueryRequest, db: Session = Depends(get_db)) -> QueryResponse:
-    """
-    Handle conversational RAG queries with document prioritization.
-    """
-    document_context = None
-    
-    # Step 1: Determine target document(s)
-    target_document_ids = []
+def _resolve_target_documents(request: QueryRequest, db: Session) -> Tuple[List[int], Optional[Dict[str, Any]]]:
+    """Work out which document(s) the query should focus on."""
     if request.document_id:
         # User specified a document
-        target_document_ids = [request.document_id]
         doc = db.query(models.Document).filter(models.Document.id == request.document_id).first()
         if doc:
-            document_context = {"id": doc.id, "filename": doc.filename, "uploaded": doc.uploaded_at}
+            return [request.document_id], {"id": doc.id, "filename": doc.filename, "uploaded": doc.uploaded_at}
+        return [request.document_id], None
     elif request.use_latest_document:
-        # Use the most recently uploaded document
-        latest_doc = db.query(models.Document).order_by(models.Document.uploaded_at.desc()).first()
+        # Use the most recently uploaded document (cached; no query unless an upload or delete invalidated it)
+        latest_doc = latest_document.get(db)
         if latest_doc:
-            target_document_ids = [latest_doc.id]
-            document_context = {"id": latest_doc.id, "filename": latest_doc.filename, "uploaded": latest_doc.uploaded_at}
+            return [latest_doc["id"]], latest_doc
+    return [], None
 
-    # Step 2: Embed the query
-    query_embedding: List[float] = embedder.embed_texts([request.query])[0]
 
-    # Step 3: Retrieve from Qdrant with document filtering if specified
-    results: List[Dict[str, Any]] = []
-    context = ""
-    
-    if target_document_ids:
-        # First try to get results from target document(s)
-        all_results = vectorstore.query(query_embedding, top_k=10)  # Get more results
-        
-        # Filter results by target document(s)
-        filtered_results = []
-        for result in all_results:
-            if result.get("metadata", {}).get("document_id") in target_document_ids:
-                filtered_results.append(result)
-        
-        if len(filtered_results) >= 3:
-            results = filtered_results[:5]  # Use filtered results
-        else:
-            # Not enough results from target document, supplement with others but prioritize target
-            results = filtered_results + [r for r in all_results if r not in filtered_results][:5]
-    else:
-        # No document specified, search all documents
-        results = vectorstore.query(query_embedding, top_k=5)
-    
-    # Step 4: Build context from results
-    if results:
-        context = "\n".join([r["metadata"]["text"] for r in results])
-    else:
-        # Fallback: Search database for text containing keywords
-        query_keywords = request.query.lower().split()
-        
-        if target_document_ids:
-            # Search only in target document(s)
-            chunks = db.query(models.DocumentChunk).filter(
-                models.DocumentChunk.document_id.in_(target_document_ids)
-            ).all()
-        else:
-            chunks = db.query(models.DocumentChunk).all()
-        
-        relevant_chunks = []
-        for chunk in chunks:
-            chunk_text_lower = chunk.chunk_text.lower()
-            if any(keyword in chunk_text_lower for keyword in query_keywords):
-                relevant_chunks.append(chunk)
-        
-        if relevant_chunks:
-            context = "\n".join([chunk.chunk_text for chunk in relevant_chunks[:3]])
-            # Create mock results for response
-            results = [
-                {
-                    "id": f"chunk_{chunk.id}",
-                    "score": 0.8,
-                    "metadata": {
-                        "document_id": chunk.document_id,
-                        "chunk_id": chunk.id,
-                        "text": chunk.chunk_text
-                    }
-                }
-                for chunk in relevant_chunks[:3]
-            ]
-
-    # Step 5: Get history from Redis
-    history: List[Dict[str, str]] = memory.get_history(request.session_id)
-
-    # Step 6: Build enhanced prompt with document context
+async def _prepare_prompt(
+    request: QueryRequest, db: Session
+) -> Tuple[str, List[Dict[str, Any]], Optional[Dict[str, Any]], AnswerKey]:
+    """Run retrieval and build the LLM prompt; returns (prompt, sources, document_context, answer_key)."""
+    # Step 1: Determine target document(s)
+    target_document_ids, document_context = await run_in_threadpool(_resolve_target_documents, request, db)
+
+    # Step 2: Retrieve with vector and keyword search in parallel, fused by rank
+    query_embedding = retriever.embed_query(request.query)
+    results: List[Dict[str, Any]] = await retriever.retrieve(
+        request.query, top_k=5, document_ids=target_document_ids, query_embedding=query_embedding
+    )
+
+    if target_document_ids and len(results) < 3:
+        # Not enough results from target document, supplement with others but prioritize target
+        # Matched on the chunk, since the fused ID depends on which source ranked it first
+        seen_chunks = {chunk_key(r) for r in results}
+        others = await retriever.retrieve(request.query, top_k=5, query_embedding=query_embedding)
+        results = results + [r for r in others if chunk_key(r) not in seen_chunks][:5 - len(results)]
+
+    # Step 3: Get recent history and the summary of older turns from Redis
+    history, summary = await asyncio.gather(
+        memory.get_history_async(request.session_id), memory.get_summary_async(request.session_id)
+    )
+
+    # Step 4: Build enhanced prompt with document context
     if document_context:
         enhanced_query = f"Based on the document '{document_context['filename']}' uploaded on {document_context['uploaded']}: {request.query}"
     else:
         enhanced_query = request.query
+
+    # Step 5: Fill what the instructions, history and question leave of the token budget with context
+    reserved_tokens = estimate_tokens(llm.build_prompt(enhanced_query, "", history, summary))
+    context, results = packer.pack(results, reserved_tokens=reserved_tokens, priority_document_ids=target_document_ids)
     
-    prompt: str = llm.build_prompt(enhanced_query, context, history)
+    prompt: str = llm.build_prompt(enhanced_query, context, history, summary)
+    # Similar questions answered from the same chunks can reuse a cached answer
+    answer_key = AnswerKey.from_sources(await query_embedding, results)
+    return prompt, results, document_context, answer_key
+
+
+def _sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@router.post("/query", response_model=QueryResponse)
+async def chat_query(
+    request: QueryRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+) -> QueryResponse:
+    """
+    Handle conversational RAG queries with document prioritization.
 
-    # Step 7: Call LLM
-    answer: str = llm.call_llm(prompt)
+    All network I/O goes through async clients; the SQLAlchemy session has no
+    async driver here, so database work is offloaded to the thread pool.
+    """
+    prompt, results, document_context, answer_key = await _prepare_prompt(request, db)
+
+    # Step 6: Call LLM (or reuse a cached answer)
+    answer: str = await llm.call_llm_async(prompt, answer_key=answer_key)
 
-    # Step 8: Update Redis memory
-    memory.add_message(request.session_id, "user", request.query)
-    memory.add_message(request.session_id, "assistant", answer)
+    # Step 7: Update Redis memory; older turns are summarized after the response is sent
+    await memory.add_turn_async(request.session_id, request.query, answer)
+    background_tasks.add_task(summarizer.compact_async, request.session_id)
 
     return QueryResponse(
         answer=answer, 
@@ -142,24 +144,136 @@ async def chat_query(request: QueryRequest, db: Session = Depends(get_db)) -> Qu
     )
 
 
+@router.post("/query/stream")
+async def chat_query_stream(request: QueryRequest, db: Session = Depends(get_db)) -> StreamingResponse:
+    """
+    Stream the answer to a RAG query as Server-Sent Events.
+
+    Events, in order:
+      sources  {"sources": [...], "document_context": {...}}  as soon as retrieval is done
+      token    {"text": "..."}                                  one per generated piece
+      done     {"answer": "..."}                                after the answer is saved to memory
+    """
+    prompt, results, document_context, answer_key = await _prepare_prompt(request, db)
+
+    async def events() -> AsyncIterator[str]:
+        yield _sse("sources", {"sources": results, "document_context": document_context})
+
+        pieces: List[str] = []
+        async for text in llm.stream_llm(prompt, answer_key=answer_key):
+            pieces.append(text)
+            yield _sse("token", {"text": text})
+        answer = "".join(pieces).strip()
+
+        # Only a completed stream is remembered; a client that disconnects cancels the generator first
+        await memory.add_turn_async(request.session_id, request.query, answer)
+        yield _sse("done", {"answer": answer})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies (e.g. nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(summarizer.compact_async, request.session_id),
+    )
+
+
+@router.get("/history/{session_id}")
+async def get_history(
+    session_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Return a page of a session's chat history, oldest message first."""
+    total, messages = await memory.get_history_page_async(session_id, offset=offset, limit=limit)
+    summary = await memory.get_summary_async(session_id)
+    return {
+        "session_id": session_id,
+        "summary": summary,  # Turns older than `messages[0]` that were folded into a summary
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "messages": messages,
+    }
+
+
+@router.get("/stats")
+async def cache_stats():
+    """Expose hit/miss counters for the chat path caches and the health of the LLM models."""
+    return {
+        "embedding_cache": services.embedder.cache.stats() if services.embedder.cache else None,
+        "answer_cache": llm.answer_cache.stats() if llm.answer_cache else None,
+        "llm_models": llm.model_health.snapshot(),
+    }
+
+
+def _encode_cursor(uploaded_at: datetime, document_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{uploaded_at.isoformat()}|{document_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        uploaded_at, document_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(uploaded_at), int(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/documents")
-async def list_documents(db: Session = Depends(get_db)):
-    """List all uploaded documents."""
-    documents = db.query(models.Document).order_by(models.Document.uploaded_at.desc()).all()
+def list_documents(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="`X-Next-Cursor` header of the previous page"),
+    db: Session = Depends(get_db),
+):
+    """List uploaded documents, newest first, one page at a time.
+
+    The body stays a bare list; the cursor of the following page, if any, is
+    sent in the `X-Next-Cursor` header. Pages are keyed on (uploaded_at, id)
+    rather than an offset, so every page costs the same however deep it is,
+    and chunk counts come from a single GROUP BY over the page's documents
+    instead of loading their chunks.
+    """
+    query = db.query(
+        models.Document.id,
+        models.Document.filename,
+        models.Document.filetype,
+        models.Document.uploaded_at,
+    )
+    if cursor:
+        uploaded_at, document_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            models.Document.uploaded_at < uploaded_at,
+            and_(models.Document.uploaded_at == uploaded_at, models.Document.id < document_id),
+        ))
+    rows = query.order_by(models.Document.uploaded_at.desc(), models.Document.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+
+    chunk_counts: Dict[int, int] = {}
+    if page:
+        chunk_counts = dict(
+            db.query(models.DocumentChunk.document_id, func.count(models.DocumentChunk.id))
+            .filter(models.DocumentChunk.document_id.in_([row.id for row in page]))
+            .group_by(models.DocumentChunk.document_id)
+            .all()
+        )
+
+    if len(rows) > limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(page[-1].uploaded_at, page[-1].id)
     return [
         {
-            "id": doc.id,
-            "filename": doc.filename,
-            "filetype": doc.filetype,
-            "uploaded_at": doc.uploaded_at,
-            "chunk_count": len(doc.chunks) if hasattr(doc, 'chunks') else 0
+            "id": row.id,
+            "filename": row.filename,
+            "filetype": row.filetype,
+            "uploaded_at": row.uploaded_at,
+            "chunk_count": chunk_counts.get(row.id, 0),
         }
-        for doc in documents
+        for row in page
     ]
 
 
 @router.delete("/documents/{document_id}")
-async def delete_document(document_id: int, db: Session = Depends(get_db)):
+def delete_document(document_id: int, db: Session = Depends(get_db)):
     """Delete a document and all its chunks."""
     document = db.query(models.Document).filter(models.Document.id == document_id).first()
     if not document:
@@ -167,13 +281,15 @@ async def delete_document(document_id: int, db: Session = Depends(get_db)):
     
     # Delete from vector store (if implemented)
     try:
-        vectorstore.delete_by_document_id(document_id)
+        services.vectorstore.delete_by_document_id(document_id)
     except Exception as e:
         logger.warning(f"Could not delete from vector store: {e}")
+    lexical.remove_document(db, document_id)
     
     # Delete from database
     db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id == document_id).delete()
     db.delete(document)
     db.commit()
+    latest_document.invalidate()
     
     return {"message": f"Document {document_id} deleted successfully"}
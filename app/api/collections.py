@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.session import get_db
+from app.services.collections import CollectionManager, spec_of
+
+router = APIRouter(prefix="/collections", tags=["Collections"])
+
+# Bound to the chat and ingest services at startup (see app/main.py)
+manager = CollectionManager()
+
+
+def _collection_status(collection: models.VectorCollection) -> dict:
+    return {
+        "name": collection.name,
+        "model": spec_of(collection).model_id,
+        "dim": collection.dim,
+        "status": collection.status,
+        "chunks_total": collection.chunks_total,
+        "chunks_done": collection.chunks_done,
+        "complete": collection.completed_at is not None,
+        "error": collection.error,
+        "created_at": collection.created_at.isoformat() if collection.created_at else None,
+        "activated_at": collection.activated_at.isoformat() if collection.activated_at else None,
+        "completed_at": collection.completed_at.isoformat() if collection.completed_at else None,
+    }
+
+
+@router.get("")
+def list_collections(db: Session = Depends(get_db)) -> dict:
+    """List the vector collections with the progress of their re-embedding."""
+    collections = db.query(models.VectorCollection).order_by(models.VectorCollection.created_at.desc()).all()
+    live, _ = manager.live()
+    return {
+        "alias": manager.alias,
+        "live": live,
+        "configured_model": manager.configured.model_id,
+        "collections": [_collection_status(collection) for collection in collections],
+    }
+
+
+@router.post("/reembed", status_code=202)
+def reembed() -> dict:
+    """
+    Re-embed every chunk with the configured model into its own collection.
+
+    The live collection keeps serving while the new one is filled; when it is
+    complete every process moves to it. Poll `/collections` for progress. A no-op if the configured model is live.
+    """
+    try:
+        collection = manager.reembed()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not start re-embedding: {e}")
+    return _collection_status(collection)
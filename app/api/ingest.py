@@ -1,83 +1,151 @@
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-import os
 
-from app.services.chunking import ChunkingService
+from app.db import models
+from app.services.chunking import ChunkingService, load_tokenizer_length
+from app.services.collections import LiveServices
 from app.services.embeddings import EmbeddingService
 from app.services.vectorstore import VectorStoreService
+from app.services.ingestion import IngestionService
+from app.services.ingest_jobs import IngestJobQueue, IngestQueueFull
+from app.services.extraction import is_supported
 from app.db.session import get_db
-from app.db import models
-from PyPDF2 import PdfReader
 
 router = APIRouter(prefix="/ingest", tags=["Ingestion"])
 
 # Services
-chunker = ChunkingService()
-embedder = EmbeddingService()
-vectorstore = VectorStoreService()
-
+chunker = ChunkingService(length_function=load_tokenizer_length())
+# Kept on the live collection by the collection manager (see app/main.py)
+services = LiveServices(EmbeddingService(), VectorStoreService())
+ingestion = IngestionService(services)
+jobs = IngestJobQueue(ingestion, chunker)
 
-def extract_text_from_file(file: UploadFile) -> str:
-    """Extract text from .pdf or .txt file."""
-    if file.filename.endswith(".txt"):
-        return file.file.read().decode("utf-8")
 
-    elif file.filename.endswith(".pdf"):
-        pdf_reader = PdfReader(file.file)
-        text: str = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() or ""
-        return text
+@router.post("/upload", status_code=202)
+def upload_document(
+    file: UploadFile = File(...),
+    chunk_strategy: str = Form(..., description="Choose 'sliding' or 'sentence'"),
+    incremental: bool = Form(False, description="Update the latest document with the same filename, re-embedding only changed chunks"),
+    db: Session = Depends(get_db),
+) -> dict:
+    """
+    Queue a document for ingestion and return its job ID right away.
 
-    else:
+    A background worker chunks the document, stores the chunks in the DB and
+    indexes their embeddings in Qdrant; poll `/ingest/jobs/{job_id}` for the
+    stage, progress and resulting document ID.
+    """
+    if chunk_strategy not in ("sliding", "sentence"):
+        raise HTTPException(status_code=400, detail="Invalid chunk strategy. Use 'sliding' or 'sentence'.")
+    if not is_supported(file.filename):
         raise HTTPException(status_code=400, detail="Only .pdf and .txt files are supported.")
 
+    try:
+        job = jobs.submit(db, file.filename, file.content_type, chunk_strategy, incremental, file.file)
+    except IngestQueueFull:
+        raise HTTPException(status_code=503, detail="Too many documents are being processed. Please retry shortly.")
 
-@router.post("/upload")
-async def upload_document(
-    file: UploadFile = File(...),
+    return {
+        "message": "Document queued for processing",
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/ingest/jobs/{job.id}",
+    }
+
+
+@router.post("/upload-batch", status_code=202)
+def upload_batch(
+    files: List[UploadFile] = File(...),
     chunk_strategy: str = Form(..., description="Choose 'sliding' or 'sentence'"),
+    incremental: bool = Form(False, description="Update the latest document with the same filename, re-embedding only changed chunks"),
     db: Session = Depends(get_db),
 ) -> dict:
     """
-    Upload a document, chunk it, generate embeddings, and store in DB + Qdrant.
+    Queue many documents at once.
+
+    The files are ingested together, so their chunks share full-size
+    embedding batches and vector store upserts. Each file gets its own job;
+    unsupported files are rejected individually without failing the rest.
+    Poll `/ingest/batches/{batch_id}` for every file's outcome.
     """
-    # Step 1: Extract text
-    text: str = extract_text_from_file(file)
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-
-    # Step 2: Chunking
-    if chunk_strategy == "sliding":
-        chunks: List[str] = chunker.sliding_window_chunk(text)
-    elif chunk_strategy == "sentence":
-        chunks: List[str] = chunker.sentence_chunk(text)
-    else:
+    if chunk_strategy not in ("sliding", "sentence"):
         raise HTTPException(status_code=400, detail="Invalid chunk strategy. Use 'sliding' or 'sentence'.")
 
-    # Step 3: Save document metadata in Postgres
-    document = models.Document(filename=file.filename, filetype=file.content_type)
-    db.add(document)
-    db.commit()
-    db.refresh(document)
-
-    # Step 4: Save chunks in Postgres
-    chunk_records: List[models.DocumentChunk] = []
-    for chunk in chunks:
-        chunk_record = models.DocumentChunk(document_id=document.id, chunk_text=chunk)
-        db.add(chunk_record)
-        chunk_records.append(chunk_record)
-    db.commit()
-
-    # Step 5: Generate embeddings
-    embeddings: List[List[float]] = embedder.embed_texts(chunks)
-
-    # Step 6: Store embeddings in Qdrant with metadata
-    metadatas = [
-        {"document_id": document.id, "chunk_id": chunk.id, "text": chunk.chunk_text}
-        for chunk in chunk_records
+    accepted = [file for file in files if is_supported(file.filename)]
+    rejected = [
+        {"filename": file.filename, "error": "Only .pdf and .txt files are supported."}
+        for file in files if not is_supported(file.filename)
     ]
-    vectorstore.upsert_embeddings(embeddings, metadatas)
+    if not accepted:
+        raise HTTPException(status_code=400, detail="None of the files is a .pdf or .txt file.")
+
+    try:
+        batch_jobs = jobs.submit_batch(
+            db, [(file.filename, file.content_type, file.file) for file in accepted], chunk_strategy, incremental
+        )
+    except IngestQueueFull:
+        raise HTTPException(status_code=503, detail="Too many documents are being processed. Please retry shortly.")
+
+    batch_id = batch_jobs[0].batch_id
+    return {
+        "message": f"{len(batch_jobs)} documents queued for processing",
+        "batch_id": batch_id,
+        "jobs": [{"filename": job.filename, "job_id": job.id, "status": job.status} for job in batch_jobs],
+        "rejected": rejected,
+        "status_url": f"/api/ingest/batches/{batch_id}",
+    }
+
+
+def _job_status(job: models.IngestJob) -> dict:
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "stage": job.stage,
+        "attempts": job.attempts,
+        "progress": {
+            "pages_done": job.pages_done,
+            "pages_total": job.pages_total,
+            "chunks_indexed": job.chunks_indexed,
+        },
+        "document_id": job.document_id,
+        "chunks_added": job.chunks_added,
+        "chunks_unchanged": job.chunks_unchanged,
+        "chunks_removed": job.chunks_removed,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+@router.get("/jobs/{job_id}")
+def get_ingest_job(job_id: str, db: Session = Depends(get_db)) -> dict:
+    """Report the stage and progress of an ingestion job."""
+    job = db.get(models.IngestJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+
+@router.get("/batches/{batch_id}")
+def get_ingest_batch(batch_id: str, db: Session = Depends(get_db)) -> dict:
+    """Report the outcome of every file of a batch upload."""
+    batch_jobs = (
+        db.query(models.IngestJob)
+        .filter(models.IngestJob.batch_id == batch_id)
+        .order_by(models.IngestJob.created_at)
+        .all()
+    )
+    if not batch_jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
 
-    return {"message": "Document uploaded and processed successfully", "document_id": document.id}
+    counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+    for job in batch_jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return {
+        "batch_id": batch_id,
+        "total": len(batch_jobs),
+        **counts,
+        "jobs": [_job_status(job) for job in batch_jobs],
+    }
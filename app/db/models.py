@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Boolean, Column, Integer, LargeBinary, String, DateTime, ForeignKey, Text, Index, func, literal_column
+from sqlalchemy.orm import declarative_base, deferred, relationship
 from datetime import datetime
 
 Base = declarative_base()
@@ -18,6 +18,11 @@ class Document(Base):
     # Relationship with chunks
     chunks = relationship("DocumentChunk", back_populates="document")
 
+    __table_args__ = (
+        # Newest-first listing and the latest-document lookup
+        Index("ix_documents_uploaded_at_id", uploaded_at, id),
+    )
+
 
 class DocumentChunk(Base):
     """Stores individual chunks of a document."""
@@ -25,11 +30,90 @@ class DocumentChunk(Base):
     __tablename__ = "document_chunks"
 
     id: int = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    document_id: int = Column(Integer, ForeignKey("documents.id"))
+    document_id: int = Column(Integer, ForeignKey("documents.id"), index=True)
     chunk_text: str = Column(Text, nullable=False)
+    # sha256 of chunk_text, used to skip unchanged chunks on re-ingest
+    content_hash: str = Column(String(64), nullable=True)
+    # Quantized copy of the chunk's vector, so the vector store can be rebuilt without re-embedding
+    # (see app/services/stored_embeddings.py); deferred so ORM loads do not pull it in
+    embedding = deferred(Column(LargeBinary, nullable=True))
+    # float16 or int8
+    embedding_dtype: str = Column(String(8), nullable=True)
+    # "<provider>:<model>" that produced the vector, e.g. cohere:embed-english-v3.0
+    embedding_model: str = Column(String(128), nullable=True)
 
     document = relationship("Document", back_populates="chunks")
 
+    __table_args__ = (
+        # Full-text index for lexical retrieval; PostgreSQL only, other databases use the in-process BM25 index
+        Index(
+            "ix_document_chunks_fts",
+            func.to_tsvector(literal_column("'english'"), chunk_text),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+class IngestJob(Base):
+    """Tracks a queued document upload through the ingestion pipeline."""
+
+    __tablename__ = "ingest_jobs"
+
+    id: str = Column(String(36), primary_key=True)
+    # Shared by the files of one batch upload, which are ingested together
+    batch_id: str = Column(String(36), nullable=True, index=True)
+    filename: str = Column(String, nullable=False)
+    filetype: str = Column(String, nullable=False)
+    chunk_strategy: str = Column(String(16), nullable=False)
+    incremental: bool = Column(Boolean, nullable=False, default=False)
+    # Uploaded file kept on disk until the job finishes
+    spool_path: str = Column(String, nullable=False)
+    # queued, running, done or failed
+    status: str = Column(String(16), nullable=False, default="queued", index=True)
+    # queued, resuming, indexing, finalizing, done or failed
+    stage: str = Column(String(16), nullable=False, default="queued")
+    attempts: int = Column(Integer, nullable=False, default=0)
+    pages_done: int = Column(Integer, nullable=False, default=0)
+    pages_total: int = Column(Integer, nullable=True)
+    chunks_indexed: int = Column(Integer, nullable=False, default=0)
+    # Not a foreign key, so deleting the document keeps the job's history
+    document_id: int = Column(Integer, nullable=True)
+    # Set when the job created its document, which is deleted again if the job fails for good
+    document_created: bool = Column(Boolean, nullable=False, default=False)
+    # Highest chunk ID whose vector is known to be written; later rows are redone on resume
+    last_chunk_id: int = Column(Integer, nullable=True)
+    chunks_added: int = Column(Integer, nullable=True)
+    chunks_unchanged: int = Column(Integer, nullable=True)
+    chunks_removed: int = Column(Integer, nullable=True)
+    error: str = Column(Text, nullable=True)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow)
+    # Heartbeat while running; a running job not updated for a while is taken over
+    updated_at: datetime = Column(DateTime, default=datetime.utcnow)
+
+
+class VectorCollection(Base):
+    """A vector store collection holding every chunk's vector from one embedding model."""
+
+    __tablename__ = "vector_collections"
+
+    name: str = Column(String(255), primary_key=True)
+    provider: str = Column(String(32), nullable=False)
+    model: str = Column(String(128), nullable=False)
+    dim: int = Column(Integer, nullable=False)
+    # building (filled by a re-embed job while another collection serves), live, retired or failed
+    status: str = Column(String(16), nullable=False, default="building", index=True)
+    chunks_total: int = Column(Integer, nullable=True)
+    chunks_done: int = Column(Integer, nullable=False, default=0)
+    # Chunks up to this ID are in the collection; an interrupted fill resumes after it
+    last_chunk_id: int = Column(Integer, nullable=False, default=0)
+    error: str = Column(Text, nullable=True)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow)
+    # Heartbeat of the job filling the collection; None while no job holds it
+    updated_at: datetime = Column(DateTime, nullable=True)
+    activated_at: datetime = Column(DateTime, nullable=True)
+    # Set once every chunk is in the collection
+    completed_at: datetime = Column(DateTime, nullable=True)
+
 
 class Booking(Base):
     __tablename__ = "bookings"
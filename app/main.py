@@ -4,7 +4,7 @@ import logging
 import sys
 
 from app.db.session import init_db
-from app.api import ingest, chat, booking, marketplace
+from app.api import ingest, chat, booking, marketplace, collections
 
 # Configure logging
 logging.basicConfig(
@@ -32,6 +32,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor of the next page of GET /chat/documents
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Initialize DB (non-blocking - let app start even if DB connection fails initially)
@@ -46,8 +48,31 @@ except Exception as e:
 app.include_router(ingest.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
 app.include_router(booking.router, prefix="/api")
+app.include_router(collections.router, prefix="/api")
 app.include_router(marketplace.router)
 
+@app.on_event("startup")
+def start_vector_collections():
+    """Put chat and ingestion on the live vector collection and resume any re-embedding."""
+    collections.manager.bind(chat.services)
+    collections.manager.bind(ingest.services)
+    collections.manager.start()
+
+@app.on_event("startup")
+def start_ingest_workers():
+    """Start the ingestion workers and resume jobs interrupted by a restart."""
+    ingest.jobs.start()
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    """Release the async HTTP, Qdrant and Redis clients used by the chat path."""
+    ingest.jobs.stop()
+    collections.manager.stop()
+    await chat.services.embedder.aclose()
+    await chat.services.vectorstore.aclose()
+    await chat.memory.aclose()
+    await chat.llm.aclose()
+
 @app.get("/")
 async def root():
     return {
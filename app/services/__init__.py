@@ -3,6 +3,7 @@ from .embeddings import EmbeddingService
 from .vectorstore import VectorStoreService
 from .llm import LLMService
 from .memory import MemoryService
+from .ingestion import IngestionService
 
 __all__ = [
     "ChunkingService",
@@ -10,4 +11,5 @@ __all__ = [
     "VectorStoreService",
     "LLMService",
     "MemoryService",
+    "IngestionService",
 ]
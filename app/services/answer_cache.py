@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+import bisect
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+# Minimum cosine similarity between query embeddings for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+
+# Upper bounds of the similarity histogram buckets reported by stats()
+SIMILARITY_BUCKETS = [0.5, 0.8, 0.9, 0.95, 0.98, 1.0]
+
+
+@dataclass
+class AnswerKey:
+    """What a cached answer depends on: the query embedding and the chunks it was grounded on."""
+
+    embedding: List[float]
+    chunk_ids: FrozenSet
+
+    @classmethod
+    def from_sources(cls, embedding: List[float], sources: Iterable[dict]) -> "AnswerKey":
+        return cls(
+            embedding=embedding,
+            chunk_ids=frozenset(s.get("metadata", {}).get("chunk_id", s["id"]) for s in sources),
+        )
+
+    def context_key(self) -> str:
+        return hashlib.sha256(",".join(sorted(map(str, self.chunk_ids))).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    context_key: str
+    embedding: np.ndarray
+    answer: str
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    """In-process cache of LLM answers, matched by query similarity.
+
+    An answer is reused when a new query retrieved exactly the same chunks and
+    its embedding is within ANSWER_CACHE_THRESHOLD cosine similarity of a cached
+    query. Chunk IDs change whenever a document's content changes (and deleted
+    chunks are never retrieved), so stale answers age out on their own.
+    Chat history is not part of the key. Entries expire after a TTL, and the
+    least recently used entries are evicted beyond the size limit.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL, threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_context: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.similarity_counts = [0] * len(SIMILARITY_BUCKETS)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        siblings = self._by_context[entry.context_key]
+        siblings.discard(entry_id)
+        if not siblings:
+            del self._by_context[entry.context_key]
+
+    def get(self, key: AnswerKey) -> Optional[str]:
+        """Return a cached answer for a similar query over the same chunks, if any."""
+        query = self._normalize(key.embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_similarity = None, None
+            for entry_id in list(self._by_context.get(key.context_key(), ())):
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                if entry.embedding.shape != query.shape:
+                    continue
+                similarity = float(entry.embedding @ query)
+                if best_similarity is None or similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_similarity is not None:
+                bucket = bisect.bisect_left(SIMILARITY_BUCKETS, best_similarity)
+                self.similarity_counts[min(bucket, len(SIMILARITY_BUCKETS) - 1)] += 1
+            if best_similarity is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id].answer
+
+    def put(self, key: AnswerKey, answer: str) -> None:
+        """Cache an answer generated for this query and context."""
+        context_key = key.context_key()
+        entry = _Entry(context_key, self._normalize(key.embedding), answer, time.monotonic() + self.ttl)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_context.setdefault(context_key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, object]:
+        """Return hit/miss counters and the distribution of best-match similarities."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            lower = [None] + SIMILARITY_BUCKETS[:-1]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                # Best similarity found among same-context entries, per lookup that had any
+                "similarity_histogram": {
+                    (f"<{upper}" if low is None else f"{low}-{upper}"): count
+                    for low, upper, count in zip(lower, SIMILARITY_BUCKETS, self.similarity_counts)
+                },
+            }
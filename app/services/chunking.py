@@ -1,41 +1,205 @@
-from typing import List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from collections import deque
+import logging
+import os
 import re
 
+logger = logging.getLogger(__name__)
+
+try:
+    from tokenizers import Tokenizer
+    TOKENIZERS_AVAILABLE = True
+except ImportError:
+    TOKENIZERS_AVAILABLE = False
+
+# Hugging Face tokenizer used to measure chunk sizes in real tokens (words are counted when unset)
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER")
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?]) +')
+WORD = re.compile(r'\S+')
+
+# A document given as plain text segments (numbered from page 1) or as (page_number, text) pairs
+Segments = Iterable[Union[str, Tuple[int, str]]]
+
+
+@dataclass
+class Chunk:
+    """A chunk of a document with its position in the concatenated text."""
+
+    text: str
+    start: int       # character offset of the first character
+    end: int         # character offset just past the last character
+    page: int        # page the chunk starts on
+    end_page: int    # page the chunk ends on
+
+
+def load_tokenizer_length(name: Optional[str] = CHUNK_TOKENIZER) -> Optional[Callable[[str], int]]:
+    """Return a function counting a word's tokens with a Hugging Face tokenizer, or None."""
+    if not name:
+        return None
+    if not TOKENIZERS_AVAILABLE:
+        logger.warning("tokenizers not installed, chunk sizes are counted in words. Install with: pip install tokenizers")
+        return None
+    try:
+        tokenizer = Tokenizer.from_pretrained(name)
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer {name}, chunk sizes are counted in words: {e}")
+        return None
+
+    @lru_cache(maxsize=65536)
+    def token_length(word: str) -> int:
+        return max(1, len(tokenizer.encode(word, add_special_tokens=False).ids))
+
+    logger.info(f"Chunk sizes are measured with the {name} tokenizer")
+    return token_length
+
+
+class _PageMap:
+    """Maps character offsets to page numbers, forgetting pages behind the oldest open chunk."""
+
+    def __init__(self):
+        self._starts: deque = deque()  # (offset, page) of each page start
+
+    def add(self, offset: int, page: int) -> None:
+        self._starts.append((offset, page))
+
+    def page_at(self, offset: int) -> int:
+        page = self._starts[0][1] if self._starts else 1
+        for start, number in self._starts:
+            if start > offset:
+                break
+            page = number
+        return page
+
+    def forget_before(self, offset: int) -> None:
+        while len(self._starts) > 1 and self._starts[1][0] <= offset:
+            self._starts.popleft()
+
+
+def _numbered(segments: Segments) -> Iterator[Tuple[int, str]]:
+    for index, segment in enumerate(segments, start=1):
+        yield segment if isinstance(segment, tuple) else (index, segment)
+
+
 class ChunkingService:
-    """Provides multiple strategies for splitting text into chunks."""
+    """Provides multiple strategies for splitting text into chunks.
+
+    The `iter_*` methods are generators over a document given as segments
+    (typically one per PDF page), so only the current window of text is held
+    in memory. Segments are treated as if concatenated with no separator, so
+    the chunks match the list-returning methods run on the joined text.
+    With a `length_function` (see `load_tokenizer_length`), window sizes are
+    measured in tokens instead of words.
+    """
 
-    def __init__(self, token_size: int = 300, overlap: int = 50):
+    def __init__(self, token_size: int = 300, overlap: int = 50, length_function: Optional[Callable[[str], int]] = None):
         self.token_size = token_size
         self.overlap = overlap
+        self.length_function = length_function
 
     def sentence_chunk(self, text: str) -> List[str]:
         """Split text by sentences."""
-        sentences = re.split(r'(?<=[.!?]) +', text)
-        return [s.strip() for s in sentences if s.strip()]
+        return [chunk.text for chunk in self.iter_sentence_chunks([text])]
 
     def token_chunk(self, text: str) -> List[str]:
         """Split text into chunks of approx. `token_size` words."""
-        words = text.split()
-        chunks = []
-        for i in range(0, len(words), self.token_size):
-            chunk = " ".join(words[i:i+self.token_size])
-            chunks.append(chunk)
-        return chunks
+        return [chunk.text for chunk in self.iter_token_chunks([text])]
 
     def sliding_window_chunk(self, text: str) -> List[str]:
         """Split text using sliding window with overlap."""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), self.token_size - self.overlap):
-            chunk_words = words[i:i + self.token_size]
-            if len(chunk_words) == 0:
-                break
-            chunk = " ".join(chunk_words)
-            chunks.append(chunk)
-            #Checked for empty chunked tokens
-            # Break if we've reached the end
-            if i + self.token_size >= len(words):
-                break
-                
-        return chunks
+        return [chunk.text for chunk in self.iter_sliding_window_chunks([text])]
+
+    def iter_chunks(self, strategy: str, segments: Segments) -> Iterator[Chunk]:
+        """Dispatch to the generator for 'sentence', 'sliding' or 'token' chunking."""
+        if strategy == "sentence":
+            return self.iter_sentence_chunks(segments)
+        if strategy == "sliding":
+            return self.iter_sliding_window_chunks(segments)
+        if strategy == "token":
+            return self.iter_token_chunks(segments)
+        raise ValueError(f"Unknown chunk strategy: {strategy}")
+
+    def iter_sentence_chunks(self, segments: Segments) -> Iterator[Chunk]:
+        """Yield one chunk per sentence; only the unfinished sentence is carried between segments."""
+        pages = _PageMap()
+        carry = ""
+        carry_start = 0
+        for page, segment in _numbered(segments):
+            pages.add(carry_start + len(carry), page)
+            buffer = carry + segment
+            piece_start = 0
+            for match in SENTENCE_SPLIT.finditer(buffer):
+                yield from self._sentence(buffer[piece_start:match.start()], carry_start + piece_start, pages)
+                piece_start = match.end()
+            carry = buffer[piece_start:]
+            carry_start += piece_start
+            pages.forget_before(carry_start)
+        yield from self._sentence(carry, carry_start, pages)
+
+    @staticmethod
+    def _sentence(piece: str, offset: int, pages: _PageMap) -> Iterator[Chunk]:
+        text = piece.strip()
+        if text:
+            start = offset + len(piece) - len(piece.lstrip())
+            end = start + len(text)
+            yield Chunk(text, start, end, pages.page_at(start), pages.page_at(end - 1))
+
+    def iter_token_chunks(self, segments: Segments) -> Iterator[Chunk]:
+        """Yield back-to-back windows of `token_size` words (or tokens)."""
+        return self._iter_windows(segments, overlap=0)
+
+    def iter_sliding_window_chunks(self, segments: Segments) -> Iterator[Chunk]:
+        """Yield `token_size` windows that overlap by `overlap` words (or tokens)."""
+        return self._iter_windows(segments, overlap=self.overlap)
+
+    @staticmethod
+    def _words(segments: Segments, pages: _PageMap) -> Iterator[Tuple[str, int]]:
+        """Yield (word, offset) pairs, holding back a word that may continue in the next segment."""
+        carry = ""
+        carry_start = 0
+        for page, segment in _numbered(segments):
+            buffer_start = carry_start
+            pages.add(buffer_start + len(carry), page)
+            buffer = carry + segment
+            matches = list(WORD.finditer(buffer))
+            held = matches.pop() if matches and matches[-1].end() == len(buffer) else None
+            for match in matches:
+                yield match.group(), buffer_start + match.start()
+            if held is not None:
+                carry, carry_start = held.group(), buffer_start + held.start()
+            else:
+                carry, carry_start = "", buffer_start + len(buffer)
+        if carry:
+            yield carry, carry_start
+
+    def _iter_windows(self, segments: Segments, overlap: int) -> Iterator[Chunk]:
+        size_of = self.length_function or (lambda word: 1)
+        pages = _PageMap()
+        window: deque = deque()  # (word, offset, size) for each word in the window
+        window_size = 0
+        emitted = False
+
+        for word, offset in self._words(segments, pages):
+            if emitted:
+                # The full window went out; slide it so that only `overlap` remains
+                while window and window_size > overlap and window_size - window[0][2] >= overlap:
+                    window_size -= window.popleft()[2]
+                pages.forget_before(window[0][1] if window else offset)
+                emitted = False
+            size = size_of(word)
+            window.append((word, offset, size))
+            window_size += size
+            if window_size >= self.token_size:
+                yield self._window_chunk(window, pages)
+                emitted = True
+
+        if window and not emitted:
+            yield self._window_chunk(window, pages)
+
+    @staticmethod
+    def _window_chunk(window: deque, pages: _PageMap) -> Chunk:
+        start = window[0][1]
+        end = window[-1][1] + len(window[-1][0])
+        return Chunk(" ".join(word for word, _, _ in window), start, end, pages.page_at(start), pages.page_at(end - 1))
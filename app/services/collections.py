@@ -0,0 +1,512 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+import os
+import threading
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.session import SessionLocal
+from app.services.embeddings import EmbeddingService, EmbeddingSpec
+from app.services.stored_embeddings import EMBEDDING_STORE_DTYPE, STORE_DTYPES, decode_embedding, encode_embeddings
+from app.services.vectorstore import DEFAULT_COLLECTION, VectorStoreService
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the versioned collection names, and a Qdrant alias kept on the live collection for outside readers
+VECTOR_COLLECTION = os.getenv("VECTOR_COLLECTION", DEFAULT_COLLECTION)
+# Seconds before every process has moved to a newly activated collection
+COLLECTION_REFRESH_SECONDS = int(os.getenv("COLLECTION_REFRESH_SECONDS", 10))
+# Chunks re-embedded and upserted per step of a re-embed job
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", 256))
+# Start re-embedding at startup when the configured embedding model has no live collection
+REEMBED_ON_STARTUP = os.getenv("REEMBED_ON_STARTUP", "true").lower() == "true"
+# Seconds without a heartbeat after which a re-embed job is considered dead and resumed
+REEMBED_JOB_STALE_SECONDS = int(os.getenv("REEMBED_JOB_STALE_SECONDS", 120))
+
+BUILDING = "building"
+LIVE = "live"
+RETIRED = "retired"
+FAILED = "failed"
+
+
+class LiveServices:
+    """The embedder and vector store of the live collection, swapped as one pair.
+
+    CollectionManager replaces `pair` in a single assignment when another
+    collection goes live. Take the pair once per unit of work (a query, an
+    ingest batch) so vectors embedded with one model are searched in, or
+    written to, that model's collection.
+    """
+
+    def __init__(self, embedder: EmbeddingService, vectorstore: VectorStoreService):
+        self.pair: Tuple[EmbeddingService, VectorStoreService] = (embedder, vectorstore)
+
+    @property
+    def embedder(self) -> EmbeddingService:
+        return self.pair[0]
+
+    @property
+    def vectorstore(self) -> VectorStoreService:
+        return self.pair[1]
+
+    def switch(self, name: str, spec: EmbeddingSpec) -> None:
+        """Serve collection `name` with vectors of `spec`."""
+        embedder, vectorstore = self.pair
+        if embedder.spec == spec and vectorstore.collection_name == name:
+            return
+        # Built aside and swapped in whole; threads holding the old pair finish with it
+        self.pair = (embedder.with_spec(spec), vectorstore.with_collection(name, spec.dim))
+
+
+def spec_of(collection: models.VectorCollection) -> EmbeddingSpec:
+    return EmbeddingSpec(collection.provider, collection.model, collection.dim)
+
+
+def iter_stored_chunks(
+    db: Session, after_chunk_id: int = 0, batch_size: int = REEMBED_BATCH_SIZE, model_id: Optional[str] = None
+) -> Iterator[list]:
+    """Yield pages of chunk rows, in ID order, with their stored embedding and vector payload fields.
+
+    With `model_id`, only chunks holding a stored vector of that model are
+    returned. Pages are keyed on the chunk ID, so each query is an index
+    range scan and only one page is held in memory.
+    """
+    while True:
+        query = (
+            db.query(
+                models.DocumentChunk.id,
+                models.DocumentChunk.document_id,
+                models.DocumentChunk.chunk_text,
+                models.DocumentChunk.embedding,
+                models.DocumentChunk.embedding_dtype,
+                models.DocumentChunk.embedding_model,
+                models.Document.filetype,
+                models.Document.uploaded_at,
+            )
+            .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+            .filter(models.DocumentChunk.id > after_chunk_id)
+        )
+        if model_id is not None:
+            query = query.filter(
+                models.DocumentChunk.embedding_model == model_id,
+                models.DocumentChunk.embedding.isnot(None),
+            )
+        rows = query.order_by(models.DocumentChunk.id).limit(batch_size).all()
+        if not rows:
+            return
+        after_chunk_id = rows[-1].id
+        yield rows
+
+
+def chunk_payload(row) -> Dict[str, object]:
+    """Vector payload of a chunk row from `iter_stored_chunks`, as IngestionService writes it."""
+    return {
+        "document_id": row.document_id,
+        "chunk_id": row.id,
+        "text": row.chunk_text,
+        "filetype": row.filetype,
+        "uploaded_at": row.uploaded_at.timestamp(),
+    }
+
+
+class CollectionManager:
+    """Keeps the embedding and vector store services on the live collection, and re-embeds into new ones.
+
+    Every embedding (provider, model, dimension) gets a collection of its own,
+    recorded as a `VectorCollection` row, so vectors of different models never
+    meet. One row is live: bound services embed with its spec and search its
+    collection, and move to a newly activated one within
+    COLLECTION_REFRESH_SECONDS. Serving follows this row, not a Qdrant alias,
+    since a process has to change its embedding model together with the
+    collection it searches.
+
+    When the configured model has no collection yet, a background job fills a
+    new one while the live collection keeps serving. Chunks are paged by ID; a
+    stored vector of the target model is reused, anything else is embedded
+    again (and stored). Once every chunk is in, the collection is activated,
+    the job waits for all processes to switch, catches up on chunks written to
+    the old collection meanwhile, drops points of deleted chunks and refreshes
+    the payload of documents re-uploaded during the fill. The old collection
+    is kept, marked retired. Finally the VECTOR_COLLECTION alias is moved to
+    the new collection for readers outside the app; an adopted unversioned
+    collection is first moved to its versioned name, since the alias takes
+    over its name. Progress is checkpointed by chunk ID, so a job cut off by a
+    restart resumes where it stopped.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, alias: str = VECTOR_COLLECTION):
+        self.session_factory = session_factory
+        self.alias = alias
+        self.configured = EmbeddingService().spec
+        self._bound: List[LiveServices] = []
+        self._live: Optional[Tuple[str, EmbeddingSpec]] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._jobs: Dict[str, threading.Thread] = {}
+
+    # -- serving -----------------------------------------------------------------
+
+    def bind(self, services: LiveServices) -> None:
+        """Keep an embedder and vector store pair on the live collection."""
+        self.live()
+        with self._lock:
+            self._bound.append(services)
+            services.switch(*self._live)
+
+    def live(self) -> Tuple[str, EmbeddingSpec]:
+        """Name and embedding spec of the live collection."""
+        if self._live is None:
+            self.refresh()
+        return self._live
+
+    def refresh(self) -> None:
+        """Look up the live collection and move the bound services over if it changed."""
+        db = self.session_factory()
+        try:
+            collection = (
+                db.query(models.VectorCollection)
+                .filter(models.VectorCollection.status == LIVE)
+                .order_by(models.VectorCollection.activated_at.desc())
+                .first()
+            )
+            if collection is None:
+                collection = self._bootstrap(db)
+            live = (collection.name, spec_of(collection))
+        except Exception as e:
+            logger.warning(f"Could not look up the live vector collection: {e}")
+            if self._live is None:
+                # Until the registry can be read, serve the unversioned collection with the configured model
+                self._live = (self.alias, self.configured)
+            return
+        finally:
+            db.close()
+
+        with self._lock:
+            if live == self._live:
+                return
+            self._live = live
+            name, spec = live
+            logger.info(f"Live vector collection: {name} ({spec.model_id}, {spec.dim} dimensions)")
+            for services in self._bound:
+                services.switch(name, spec)
+
+    def _bootstrap(self, db: Session) -> models.VectorCollection:
+        """Register the first live collection.
+
+        The unversioned collection is adopted when its vectors fit the
+        configured model; otherwise the model's own collection goes live and
+        is filled in the background.
+        """
+        spec = self.configured
+        now = datetime.utcnow()
+        max_chunk_id = db.query(func.max(models.DocumentChunk.id)).scalar() or 0
+        if VectorStoreService(collection_name=self.alias).existing_vector_size() == spec.dim:
+            name, completed_at, last_chunk_id = self.alias, now, max_chunk_id
+        else:
+            name, last_chunk_id = spec.collection_name(self.alias), 0
+            completed_at = now if not max_chunk_id else None
+
+        collection = models.VectorCollection(
+            name=name,
+            provider=spec.provider,
+            model=spec.model,
+            dim=spec.dim,
+            status=LIVE,
+            chunks_done=0,
+            last_chunk_id=last_chunk_id,
+            created_at=now,
+            activated_at=now,
+            completed_at=completed_at,
+        )
+        try:
+            collection = db.merge(collection)
+            db.commit()
+        except IntegrityError:
+            # Another process registered it first
+            db.rollback()
+            collection = db.get(models.VectorCollection, name)
+        logger.info(f"Registered {name} as the live vector collection")
+        return collection
+
+    # -- re-embedding --------------------------------------------------------------
+
+    def start(self) -> None:
+        """Resolve the live collection, start or resume re-embedding, and follow activations from now on."""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name="vector-collections", daemon=True)
+        self.refresh()
+        if REEMBED_ON_STARTUP:
+            try:
+                self.reembed()
+            except Exception as e:
+                logger.warning(f"Could not start re-embedding for {self.configured.model_id}: {e}")
+        self.resume()
+        self._watcher.start()
+
+    def stop(self) -> None:
+        """Stop following activations; a running job stops after its batch and is resumed by the next process."""
+        self._stopping.set()
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(COLLECTION_REFRESH_SECONDS):
+            self.refresh()
+            self.resume()
+
+    def reembed(self, spec: Optional[EmbeddingSpec] = None) -> models.VectorCollection:
+        """Start filling the collection of `spec` (the configured model by default) unless it is live already."""
+        spec = spec or self.configured
+        db = self.session_factory()
+        try:
+            live = db.query(models.VectorCollection).filter(models.VectorCollection.status == LIVE).first()
+            if live is not None and spec_of(live) == spec:
+                return live
+
+            name = spec.collection_name(self.alias)
+            collection = db.get(models.VectorCollection, name)
+            if collection is None:
+                collection = models.VectorCollection(
+                    name=name, provider=spec.provider, model=spec.model, dim=spec.dim,
+                    status=BUILDING, chunks_done=0, last_chunk_id=0, created_at=datetime.utcnow(),
+                )
+                db.add(collection)
+            elif collection.status in (RETIRED, FAILED):
+                if collection.status == RETIRED:
+                    # It missed every change since it was retired
+                    collection.last_chunk_id = 0
+                    collection.chunks_done = 0
+                collection.status = BUILDING
+                collection.error = None
+                collection.completed_at = None
+                collection.updated_at = None
+            collection.chunks_total = db.query(func.count(models.DocumentChunk.id)).scalar()
+
+            # Only the newest target is filled; a job still working on an older one stops at its next batch
+            db.query(models.VectorCollection).filter(
+                models.VectorCollection.status == BUILDING, models.VectorCollection.name != name
+            ).update({"status": RETIRED, "error": f"Superseded by {name}"}, synchronize_session=False)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                collection = db.get(models.VectorCollection, name)
+            db.refresh(collection)
+            db.expunge(collection)
+        finally:
+            db.close()
+
+        self._start_job(name)
+        return collection
+
+    def resume(self) -> None:
+        """Pick up fills whose job is not running anywhere (never started, or its process died)."""
+        stale_before = datetime.utcnow() - timedelta(seconds=REEMBED_JOB_STALE_SECONDS)
+        db = self.session_factory()
+        try:
+            names = [
+                name for (name,) in db.query(models.VectorCollection.name).filter(
+                    models.VectorCollection.status.in_((BUILDING, LIVE)),
+                    models.VectorCollection.completed_at.is_(None),
+                    or_(models.VectorCollection.updated_at.is_(None), models.VectorCollection.updated_at < stale_before),
+                )
+            ]
+        except Exception as e:
+            logger.warning(f"Could not look for pending re-embed jobs: {e}")
+            return
+        finally:
+            db.close()
+        for name in names:
+            self._start_job(name)
+
+    def _start_job(self, name: str) -> None:
+        with self._lock:
+            running = self._jobs.get(name)
+            if running is not None and running.is_alive():
+                return
+            thread = threading.Thread(target=self._run_job, args=(name,), name=f"reembed-{name}", daemon=True)
+            self._jobs[name] = thread
+        thread.start()
+
+    def _claim(self, db: Session, name: str) -> bool:
+        """Atomically take a fill over, unless a live job holds it."""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=REEMBED_JOB_STALE_SECONDS)
+        claimed = db.execute(
+            update(models.VectorCollection)
+            .where(
+                models.VectorCollection.name == name,
+                models.VectorCollection.status.in_((BUILDING, LIVE)),
+                models.VectorCollection.completed_at.is_(None),
+                or_(models.VectorCollection.updated_at.is_(None), models.VectorCollection.updated_at < stale_before),
+            )
+            .values(updated_at=now)
+        ).rowcount
+        db.commit()
+        return claimed == 1
+
+    def _save(self, name: str, **fields) -> bool:
+        """Write fields (and the heartbeat) of a collection still being filled; False once it was superseded."""
+        db = self.session_factory()
+        try:
+            saved = db.query(models.VectorCollection).filter(
+                models.VectorCollection.name == name,
+                models.VectorCollection.status.in_((BUILDING, LIVE)),
+            ).update({"updated_at": datetime.utcnow(), **fields}, synchronize_session=False)
+            db.commit()
+            return saved == 1
+        finally:
+            db.close()
+
+    def _run_job(self, name: str) -> None:
+        db = self.session_factory()
+        collection = None
+        try:
+            if not self._claim(db, name):
+                return
+            collection = db.get(models.VectorCollection, name)
+            spec = spec_of(collection)
+            embedder = EmbeddingService.from_spec(spec)
+            if embedder.spec != spec:
+                raise ValueError(f"Cannot embed with {spec.model_id} here (check the provider's API key)")
+            target = VectorStoreService(collection_name=name, vector_size=spec.dim)
+            logger.info(f"Filling vector collection {name} from chunk {collection.last_chunk_id}")
+
+            if not self._fill(db, name, embedder, target):
+                return
+            self._prune(db, target)
+            if collection.status != LIVE:
+                self._activate(db, name)
+                # Processes keep writing to the old collection until their next refresh
+                if self._stopping.wait(2 * COLLECTION_REFRESH_SECONDS) or not self._fill(db, name, embedder, target):
+                    return
+                self._prune(db, target)
+                self._sync_payloads(db, target, collection.created_at)
+            self._free_alias_name(db)
+            target.point_alias(self.alias)
+            self._save(name, completed_at=datetime.utcnow(), error=None, updated_at=None)
+            logger.info(f"Vector collection {name} is complete and live")
+            self.refresh()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Filling vector collection {name} failed: {e}")
+            if collection is not None:
+                # A model that cannot be used fails for good; anything else is retried once the heartbeat goes stale
+                permanent = isinstance(e, ValueError) and collection.status == BUILDING
+                self._save(name, error=str(e)[:1000], **({"status": FAILED, "updated_at": None} if permanent else {}))
+        finally:
+            db.close()
+
+    def _fill(self, db: Session, name: str, embedder: EmbeddingService, target: VectorStoreService) -> bool:
+        """Add every chunk after the checkpoint to the collection; False if the job was stopped or superseded."""
+        collection = db.get(models.VectorCollection, name)
+        db.refresh(collection)
+        model_id = embedder.spec.model_id
+        for rows in iter_stored_chunks(db, collection.last_chunk_id, REEMBED_BATCH_SIZE):
+            vectors: List[Optional[List[float]]] = [
+                decode_embedding(row.embedding, row.embedding_dtype).tolist()
+                if row.embedding is not None and row.embedding_model == model_id else None
+                for row in rows
+            ]
+            # Hash vectors share one model ID whatever their dimension
+            vectors = [vector if vector is None or len(vector) == embedder.spec.dim else None for vector in vectors]
+            missing = [index for index, vector in enumerate(vectors) if vector is None]
+            if missing:
+                fresh, fresh_models = embedder.embed_texts_with_models([rows[index].chunk_text for index in missing])
+                fallbacks = sorted(set(fresh_models) - {model_id})
+                if fallbacks:
+                    raise RuntimeError(f"Embedding fell back to {', '.join(fallbacks)}, {name} only takes {model_id} vectors")
+                for index, vector in zip(missing, fresh):
+                    vectors[index] = vector
+                if EMBEDDING_STORE_DTYPE in STORE_DTYPES:
+                    # Keep the new vectors, so a resumed job or a rebuild does not pay for them again
+                    db.execute(update(models.DocumentChunk), [
+                        {"id": rows[index].id, "embedding": blob, "embedding_dtype": EMBEDDING_STORE_DTYPE, "embedding_model": model_id}
+                        for index, blob in zip(missing, encode_embeddings(fresh))
+                    ])
+                    db.commit()
+
+            target.upsert_embeddings(vectors, [chunk_payload(row) for row in rows], wait=True, raise_errors=True)
+            saved = self._save(
+                name,
+                last_chunk_id=rows[-1].id,
+                chunks_done=models.VectorCollection.chunks_done + len(rows),
+            )
+            if not saved or self._stopping.is_set():
+                logger.info(f"Stopped filling vector collection {name} at chunk {rows[-1].id}")
+                return False
+        return True
+
+    @staticmethod
+    def _prune(db: Session, target: VectorStoreService) -> None:
+        """Delete points whose chunk no longer exists, such as chunks of documents deleted during the fill."""
+        stale: List[int] = []
+        for chunk_ids in target.iter_chunk_ids():
+            existing = {
+                chunk_id for (chunk_id,) in
+                db.query(models.DocumentChunk.id).filter(models.DocumentChunk.id.in_(chunk_ids))
+            }
+            stale.extend(chunk_id for chunk_id in chunk_ids if chunk_id not in existing)
+        for start in range(0, len(stale), 1000):
+            target.delete_by_chunk_ids(stale[start:start + 1000])
+        if stale:
+            logger.info(f"Removed {len(stale)} points of deleted chunks from {target.collection_name}")
+
+    def _free_alias_name(self, db: Session) -> None:
+        """Move the retired unversioned collection to its versioned name, so the alias can take its name.
+
+        Its points are copied before it is deleted and its registry row is
+        renamed with it, so it is kept as a retired collection like any other.
+        """
+        retired = db.get(models.VectorCollection, self.alias)
+        if retired is None or retired.status != RETIRED:
+            return
+        source = VectorStoreService(collection_name=self.alias)
+        if not source.use_qdrant:
+            return
+        name = spec_of(retired).collection_name(self.alias)
+        if db.get(models.VectorCollection, name) is not None:
+            logger.warning(f"{name} is registered already, leaving the unversioned collection {self.alias} in place")
+            return
+        if source.existing_vector_size() is not None:
+            source.move_to(VectorStoreService(collection_name=name, vector_size=retired.dim))
+        fields = {column.name: getattr(retired, column.name) for column in models.VectorCollection.__table__.columns}
+        db.delete(retired)
+        db.flush()
+        db.add(models.VectorCollection(**{**fields, "name": name}))
+        db.commit()
+        logger.info(f"Renamed the retired vector collection {self.alias} to {name}")
+
+    @staticmethod
+    def _sync_payloads(db: Session, target: VectorStoreService, since: datetime) -> None:
+        """Refresh the payload of documents re-uploaded since `since`.
+
+        An incremental re-upload keeps unchanged chunks and only updates their
+        payload in the collection that was live at the time, so points the
+        fill had already copied still carry the old upload time.
+        """
+        documents = db.query(models.Document.id, models.Document.filetype, models.Document.uploaded_at).filter(
+            models.Document.uploaded_at >= since
+        ).all()
+        for document_id, filetype, uploaded_at in documents:
+            target.set_document_payload(document_id, {"filetype": filetype, "uploaded_at": uploaded_at.timestamp()})
+        if documents:
+            logger.info(f"Refreshed the payload of {len(documents)} re-uploaded documents in {target.collection_name}")
+
+    @staticmethod
+    def _activate(db: Session, name: str) -> None:
+        """Make a collection the live one and retire the previous one, in one transaction."""
+        now = datetime.utcnow()
+        db.query(models.VectorCollection).filter(
+            models.VectorCollection.status == LIVE, models.VectorCollection.name != name
+        ).update({"status": RETIRED}, synchronize_session=False)
+        db.query(models.VectorCollection).filter(models.VectorCollection.name == name).update(
+            {"status": LIVE, "activated_at": now, "updated_at": now}, synchronize_session=False
+        )
+        db.commit()
+        logger.info(f"Activated vector collection {name}")
@@ -0,0 +1,130 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+import math
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Tokens the whole prompt (instructions, history, question and context) may use
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 1500))
+# Overlaps shorter than this many words are treated as coincidence, not as a shared window
+MIN_OVERLAP_WORDS = 8
+# A chunk that does not fit is cut at a sentence boundary only if at least this much budget is left
+MIN_TRIM_TOKENS = 48
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: about 4 bytes of UTF-8 per token.
+
+    Counting bytes rather than characters keeps the estimate on the safe side
+    for Devanagari and other multi-byte scripts, which tokenize more densely.
+    """
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+
+def _overlap(previous: List[str], current: List[str]) -> int:
+    """Length of the longest suffix of `previous` that is also a prefix of `current`."""
+    for size in range(min(len(previous), len(current)), MIN_OVERLAP_WORDS - 1, -1):
+        if previous[-size:] == current[:size]:
+            return size
+    return 0
+
+
+class ContextPacker:
+    """Selects and trims retrieved chunks to fit the prompt's token budget.
+
+    Chunks are taken in retrieval-score order, those of the documents the
+    query targets first. Text already covered by a selected chunk of the same
+    document (sliding-window overlap, or a chunk contained in another) is
+    dropped, so the budget is only spent on new text.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET):
+        self.budget = budget
+
+    def pack(
+        self,
+        results: List[Dict[str, Any]],
+        reserved_tokens: int = 0,
+        priority_document_ids: Optional[Iterable[int]] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Return the packed context and the results that contributed to it.
+
+        `reserved_tokens` is what the rest of the prompt (instructions, history,
+        question) already uses; only the remainder of the budget goes to context.
+        Results from `priority_document_ids` are packed ahead of the others,
+        whose scores are not comparable when they come from a separate search.
+        """
+        remaining = self.budget - reserved_tokens
+        selected: List[Tuple[Dict[str, Any], List[str]]] = []
+        parts: List[str] = []
+        priority = set(priority_document_ids or ())
+        ranked = sorted(
+            results,
+            key=lambda r: (r["metadata"].get("document_id") not in priority, -(r.get("score") or 0.0)),
+        )
+
+        for result in ranked:
+            if remaining <= 0:
+                break
+            words = self._new_words(result, selected)
+            if not words:
+                continue
+
+            text = " ".join(words)
+            tokens = estimate_tokens(text)
+            if tokens > remaining:
+                if remaining < MIN_TRIM_TOKENS:
+                    continue
+                text = self._trim_to_sentences(text, remaining)
+                if not text:
+                    continue
+                tokens = estimate_tokens(text)
+
+            selected.append((result, result["metadata"]["text"].split()))
+            parts.append(text)
+            remaining -= tokens
+
+        logger.info(
+            f"Packed {len(parts)}/{len(results)} chunks into the prompt "
+            f"({self.budget - reserved_tokens - remaining} context tokens, {reserved_tokens} reserved)"
+        )
+        return "\n\n".join(parts), [result for result, _ in selected]
+
+    @staticmethod
+    def _new_words(result: Dict[str, Any], selected: List[Tuple[Dict[str, Any], List[str]]]) -> List[str]:
+        """Words of a chunk that are not already covered by selected chunks of its document."""
+        original = result["metadata"]["text"].split()
+        words = original
+        document_id = result["metadata"].get("document_id")
+        for other, other_words in selected:
+            if other["metadata"].get("document_id") != document_id or not words:
+                continue
+            if f" {' '.join(words)} " in f" {' '.join(other_words)} ":
+                return []
+            head = _overlap(other_words, words)
+            if head:
+                words = words[head:]
+            tail = _overlap(words, other_words)
+            if tail:
+                words = words[:-tail]
+        if len(words) < len(original) and len(words) < MIN_OVERLAP_WORDS:
+            # Only a sliver of new text is left; not worth a slot in the prompt
+            return []
+        return words
+
+    @staticmethod
+    def _trim_to_sentences(text: str, budget: int) -> str:
+        """Longest run of leading whole sentences that fits in `budget` tokens."""
+        kept: List[str] = []
+        used = 0
+        for sentence in SENTENCE_BOUNDARY.split(text):
+            cost = estimate_tokens(sentence) + 1
+            if used + cost > budget:
+                break
+            kept.append(sentence)
+            used += cost
+        return " ".join(kept)
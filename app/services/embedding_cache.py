@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+
+from app.services.memory import REDIS_URL, REDIS_HOST, REDIS_PORT, REDIS_DB
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 5000))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 7 * 24 * 3600))
+
+# How long to stop talking to Redis after it errors, so an outage costs one timeout, not one per call
+REDIS_RETRY_AFTER = 30
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: a bounded in-process LRU in front of Redis with a TTL.
+
+    Keys are content addressed on (provider, model, input_type, sha256(text)).
+    Vectors are held as float32 arrays locally and as raw float32 bytes in Redis.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, ttl: int = EMBEDDING_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+        # Separate clients from MemoryService: vectors are binary and must not be decoded
+        timeouts = {"socket_timeout": 0.5, "socket_connect_timeout": 0.5}
+        if REDIS_URL:
+            self.redis_client = redis.from_url(REDIS_URL, **timeouts)
+            self.async_redis_client = aioredis.from_url(REDIS_URL, **timeouts)
+        else:
+            self.redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, **timeouts)
+            self.async_redis_client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, **timeouts)
+
+    @staticmethod
+    def make_key(provider: str, model: str, input_type: str, text: str) -> str:
+        """Build the content-addressed cache key for one text."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"emb:{provider}:{model}:{input_type}:{digest}"
+
+    def _get_local(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._local.get(key)
+                if vector is not None:
+                    self._local.move_to_end(key)
+                    found[key] = vector.tolist()
+            self.hits_local += len(found)
+        return found
+
+    def _put_local(self, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._local[key] = np.asarray(vector, dtype=np.float32)
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning(f"Embedding cache Redis tier unavailable, using local tier only: {error}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+    def _collect_remote(self, keys: List[str], values: List[Optional[bytes]]) -> Dict[str, List[float]]:
+        found = {
+            key: np.frombuffer(value, dtype=np.float32).tolist()
+            for key, value in zip(keys, values) if value is not None
+        }
+        self._put_local(found)
+        with self._lock:
+            self.hits_redis += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _count_misses(self, count: int) -> None:
+        with self._lock:
+            self.misses += count
+
+    @staticmethod
+    def _encode(items: Dict[str, List[float]]) -> Dict[str, bytes]:
+        return {key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in items.items()}
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given keys, checking the local tier first."""
+        found = self._get_local(keys)
+        remaining = [key for key in keys if key not in found]
+        if not remaining:
+            return found
+        if not self._redis_available():
+            self._count_misses(len(remaining))
+            return found
+        try:
+            values = self.redis_client.mget(remaining)
+        except Exception as e:
+            self._mark_redis_down(e)
+            self._count_misses(len(remaining))
+            return found
+        found.update(self._collect_remote(remaining, values))
+        return found
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        """Store vectors in both tiers."""
+        if not items:
+            return
+        self._put_local(items)
+        if not self._redis_available():
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in self._encode(items).items():
+                pipe.set(key, value, ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self._mark_redis_down(e)
+
+    async def get_many_async(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Async variant of `get_many` using the async Redis client."""
+        found = self._get_local(keys)
+        remaining = [key for key in keys if key not in found]
+        if not remaining:
+            return found
+        if not self._redis_available():
+            self._count_misses(len(remaining))
+            return found
+        try:
+            values = await self.async_redis_client.mget(remaining)
+        except Exception as e:
+            self._mark_redis_down(e)
+            self._count_misses(len(remaining))
+            return found
+        found.update(self._collect_remote(remaining, values))
+        return found
+
+    async def set_many_async(self, items: Dict[str, List[float]]) -> None:
+        """Async variant of `set_many` using the async Redis client."""
+        if not items:
+            return
+        self._put_local(items)
+        if not self._redis_available():
+            return
+        try:
+            pipe = self.async_redis_client.pipeline(transaction=False)
+            for key, value in self._encode(items).items():
+                pipe.set(key, value, ex=self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            self._mark_redis_down(e)
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for both tiers."""
+        with self._lock:
+            lookups = self.hits_local + self.hits_redis + self.misses
+            return {
+                "hits_local": self.hits_local,
+                "hits_redis": self.hits_redis,
+                "misses": self.misses,
+                "hit_ratio": (self.hits_local + self.hits_redis) / lookups if lookups else 0.0,
+                "local_entries": len(self._local),
+                "max_local_entries": self.max_entries,
+            }
+
+    async def aclose(self) -> None:
+        """Close the async Redis connection pool."""
+        await self.async_redis_client.close()
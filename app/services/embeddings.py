@@ -1,24 +1,115 @@
 # app/services/embeddings.py
 from dotenv import load_dotenv
 import os
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import requests
+import httpx
+import asyncio
+import copy
 import logging
 import hashlib
 import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from app.services.embedding_cache import EmbeddingCache, EMBEDDING_CACHE_ENABLED
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+COHERE_EMBED_MODELS = ["embed-english-v3.0", "embed-english-v2.0", "embed-english-light-v3.0"]
+COHERE_EMBED_DIMENSIONS = {"embed-english-v3.0": 1024, "embed-english-v2.0": 4096, "embed-english-light-v3.0": 384}
+HF_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+HF_EMBED_DIMENSION = 384
+HASH_EMBED_MODEL = "sha256"
+
+# Cohere embedding model; values that are not Cohere models (e.g. the HuggingFace model in .env.template) are ignored
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "embed-english-v3.0")
+DEFAULT_COHERE_MODEL = EMBEDDING_MODEL if EMBEDDING_MODEL in COHERE_EMBED_DIMENSIONS else "embed-english-v3.0"
+
+# Cohere accepts at most 96 texts per embed request; the char cap keeps request bodies small
+COHERE_EMBED_BATCH_SIZE = int(os.getenv("COHERE_EMBED_BATCH_SIZE", 96))
+COHERE_EMBED_BATCH_CHARS = int(os.getenv("COHERE_EMBED_BATCH_CHARS", 96 * 2048))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", 4))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 3))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", 1.0))
+# Longest wait between retries, whatever Retry-After asks for
+EMBED_RETRY_MAX_DELAY = float(os.getenv("EMBED_RETRY_MAX_DELAY", 30.0))
+
+
+class _RetryableEmbeddingError(Exception):
+    """Transient provider failure (rate limit, 5xx, network); the batch may be retried."""
+
+    def __init__(self, message: str, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class _ModelUnavailableError(Exception):
+    """The provider rejected the model itself; try the next model in the cascade."""
+
+
+@dataclass(frozen=True)
+class EmbeddingSpec:
+    """What makes vectors comparable: the provider, the model and the vector dimension."""
+
+    provider: str
+    model: str
+    dim: int
+
+    @property
+    def model_id(self) -> str:
+        """"<provider>:<model>" as stored with each chunk's embedding; hash embeddings are "hash"."""
+        return "hash" if self.provider == "hash" else f"{self.provider}:{self.model}"
+
+    def collection_name(self, prefix: str) -> str:
+        """Vector store collection holding this spec's vectors, e.g. documents__cohere__embed-english-v3-0__1024."""
+        model = re.sub(r"[^A-Za-z0-9_-]+", "-", self.model)
+        return f"{prefix}__{self.provider}__{model}__{self.dim}"
+
+
 class EmbeddingService:
-    def __init__(self, model_name: str = "embed-english-v3.0") -> None:
+    def __init__(self, model_name: str = DEFAULT_COHERE_MODEL, provider: Optional[str] = None, dimension: Optional[int] = None) -> None:
+        # Only API-backed embeddings are worth caching; created by _configure for those providers
+        self.cache: Optional[EmbeddingCache] = None
+        # Shared async HTTP client for the chat path, created lazily inside the event loop
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._configure(model_name, provider, dimension)
+
+    @classmethod
+    def from_spec(cls, spec: EmbeddingSpec) -> "EmbeddingService":
+        """Embedding service producing vectors of `spec`, whatever the environment selects."""
+        return cls(model_name=spec.model, provider=spec.provider, dimension=spec.dim)
+
+    def with_spec(self, spec: EmbeddingSpec) -> "EmbeddingService":
+        """Copy of this service producing vectors of `spec`, e.g. when a re-embedded collection goes live.
+
+        The copy shares the cache and HTTP clients. This service is left as it
+        is, so work already under way with it keeps embedding with one model.
+        """
+        if spec == self.spec:
+            return self
+        service = copy.copy(self)
+        service._configure(spec.model, spec.provider, spec.dim)
+        if service.spec != spec:
+            logger.error(f"Cannot embed with {spec.model_id} ({spec.dim}-d) here, using {service.spec.model_id}")
+        return service
+
+    def _configure(self, model_name: str, provider: Optional[str], dimension: Optional[int]) -> None:
+        """Select the provider (from the environment unless `provider` is given), model and dimension."""
         self.model_name = model_name
-        self.embedding_dim = 1024  # Cohere embedding dimension 
-        #Initialized the cohere dimesnions at 1024dimensions
-        
+
         # Check if we should use Cohere
-        self.use_cohere = os.getenv("USE_COHERE", "false").lower() == "true"
+        if provider is None:
+            self.use_cohere = os.getenv("USE_COHERE", "false").lower() == "true"
+        else:
+            self.use_cohere = provider == "cohere"
         self.cohere_api_key = os.getenv("COHERE_API_KEY")
+        self.use_huggingface = False
         
         if self.use_cohere and self.cohere_api_key:
             self.cohere_url = "https://api.cohere.ai/v1/embed"
@@ -26,86 +117,355 @@ class EmbeddingService:
                 "Authorization": f"Bearer {self.cohere_api_key}",
                 "Content-Type": "application/json"
             }
+            # Keep-alive session shared by the batch worker threads
+            self._http = requests.Session()
             logger.info(f"Using Cohere API for embeddings: {model_name}")
         else:
             # Fallback to HuggingFace
-            self.use_huggingface = os.getenv("HF_API_KEY") is not None
+            self.use_huggingface = provider in (None, "huggingface") and os.getenv("HF_API_KEY") is not None
             if self.use_huggingface:
                 self.hf_api_key = os.getenv("HF_API_KEY")
-                self.hf_url = f"https://api-inference.huggingface.co/models/sentence-transformers/all-MiniLM-L6-v2"
+                self.hf_url = f"https://api-inference.huggingface.co/models/{HF_EMBED_MODEL}"
                 self.hf_headers = {"Authorization": f"Bearer {self.hf_api_key}"}
                 logger.info("Using HuggingFace API for embeddings (Cohere disabled)")
             else:
                 logger.info("Using hash-based embeddings (no API keys provided)")
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts."""
+        if self.provider == "cohere":
+            self.embedding_dim = COHERE_EMBED_DIMENSIONS.get(self.model_name, 1024)
+        elif self.provider == "huggingface":
+            self.embedding_dim = HF_EMBED_DIMENSION
+        else:
+            # Hash embeddings match the dimension of the provider that was asked for
+            self.embedding_dim = dimension or (1024 if self.use_cohere else 384)
+
+        # Hash embeddings are cheaper than a lookup
+        if EMBEDDING_CACHE_ENABLED and self.provider != "hash" and self.cache is None:
+            self.cache = EmbeddingCache()
+
+    @property
+    def provider(self) -> str:
+        """Name of the embedding provider in use."""
+        if self.use_cohere and self.cohere_api_key:
+            return "cohere"
+        elif self.use_huggingface:
+            return "huggingface"
+        return "hash"
+
+    @property
+    def spec(self) -> EmbeddingSpec:
+        """Provider, model and dimension of the vectors this service produces."""
+        model = HASH_EMBED_MODEL if self.provider == "hash" else self._primary_model()
+        return EmbeddingSpec(self.provider, model, self.embedding_dim)
+
+    def _cohere_models(self) -> List[str]:
+        """Cohere models to try, starting with the configured one.
+
+        Fallbacks are limited to models of the same dimension, since every
+        vector has to fit the collection it is written to or searched in.
+        """
+        return [self.model_name] + [
+            m for m in COHERE_EMBED_MODELS
+            if m != self.model_name and COHERE_EMBED_DIMENSIONS[m] == self.embedding_dim
+        ]
+
+    def _primary_model(self) -> str:
+        return self._cohere_models()[0] if self.provider == "cohere" else HF_EMBED_MODEL
+
+    def model_id(self, model: Optional[str]) -> str:
+        """Identify the model behind a vector as "<provider>:<model>"; None (hash fallback) is "hash"."""
+        return f"{self.provider}:{model}" if model else "hash"
+
+    @property
+    def active_model_id(self) -> str:
+        """`model_id` of the configured model, which vectors come from unless a fallback kicked in."""
+        return self.spec.model_id
+
+    def _cache_keys(self, texts: List[str], input_type: str) -> List[str]:
+        return [EmbeddingCache.make_key(self.provider, self._primary_model(), input_type, text) for text in texts]
+
+    def _get_async_http(self) -> httpx.AsyncClient:
+        """Return the shared async HTTP client, creating it on first use."""
+        if self._async_http is None or self._async_http.is_closed:
+            self._async_http = httpx.AsyncClient(timeout=30)
+        return self._async_http
+
+    async def aclose(self) -> None:
+        """Close the async HTTP client and the cache's Redis pool."""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+        if self.cache is not None:
+            await self.cache.aclose()
+
+    def embed_texts(self, texts: List[str], input_type: str = "search_document") -> List[List[float]]:
+        """Generate embeddings for a list of texts, embedding only cache misses."""
+        return self.embed_texts_with_models(texts, input_type)[0]
+
+    def embed_texts_with_models(self, texts: List[str], input_type: str = "search_document") -> Tuple[List[List[float]], List[str]]:
+        """Like `embed_texts`, also returning the `model_id` of each vector.
+
+        Cached vectors come from the configured model, while a miss may have
+        been served by a fallback model of the cascade or the hash fallback.
+        """
+        if not texts:
+            return [], []
+
+        if self.cache is None:
+            vectors, model = self._embed_uncached(texts, input_type)
+            return vectors, [self.model_id(model)] * len(vectors)
+
+        keys = self._cache_keys(texts, input_type)
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        misses = self._unique_misses(texts, keys, found)
+        fresh_models: Dict[str, str] = {}
+        if misses:
+            vectors, model = self._embed_uncached(list(misses.values()), input_type)
+            self.cache.set_many(self._stitch_misses(misses, vectors, model, input_type, found))
+            fresh_models = dict.fromkeys(misses, self.model_id(model))
+        return [found[key] for key in keys], [fresh_models.get(key, self.active_model_id) for key in keys]
+
+    async def embed_texts_async(self, texts: List[str], input_type: str = "search_document") -> List[List[float]]:
+        """Generate embeddings for a list of texts without blocking the event loop."""
         if not texts:
             return []
-        
-        if self.use_cohere and self.cohere_api_key:
-            return self._embed_with_cohere(texts)
-        elif hasattr(self, 'use_huggingface') and self.use_huggingface:
-            return self._embed_with_huggingface(texts)
+
+        if self.cache is None:
+            return (await self._embed_uncached_async(texts, input_type))[0]
+
+        keys = self._cache_keys(texts, input_type)
+        found = await self.cache.get_many_async(list(dict.fromkeys(keys)))
+        misses = self._unique_misses(texts, keys, found)
+        if misses:
+            vectors, model = await self._embed_uncached_async(list(misses.values()), input_type)
+            await self.cache.set_many_async(self._stitch_misses(misses, vectors, model, input_type, found))
+        return [found[key] for key in keys]
+
+    @staticmethod
+    def _unique_misses(texts: List[str], keys: List[str], found: Dict[str, List[float]]) -> Dict[str, str]:
+        """Map each missing cache key to its text, embedding duplicates only once."""
+        return {key: text for key, text in zip(keys, texts) if key not in found}
+
+    def _stitch_misses(self, misses: Dict[str, str], vectors: List[List[float]], model: Optional[str],
+                       input_type: str, found: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        """Put freshly embedded vectors into `found` and return the ones that may be cached."""
+        fresh = {}
+        for (key, text), vector in zip(misses.items(), vectors):
+            found[key] = vector
+            # Hash fallbacks (model is None) must never be cached under a provider key
+            if model is not None:
+                fresh[EmbeddingCache.make_key(self.provider, model, input_type, text)] = vector
+        return fresh
+
+    def _embed_uncached(self, texts: List[str], input_type: str) -> Tuple[List[List[float]], Optional[str]]:
+        """Embed with the configured provider; returns the vectors and the model that produced them."""
+        if self.provider == "cohere":
+            embeddings, model = self._embed_with_cohere(texts, input_type)
+        elif self.provider == "huggingface":
+            embeddings, model = self._embed_with_huggingface(texts), HF_EMBED_MODEL
+        else:
+            embeddings, model = None, None
+        if embeddings is None:
+            return self._embed_with_hash(texts), None
+        return embeddings, model
+
+    async def _embed_uncached_async(self, texts: List[str], input_type: str) -> Tuple[List[List[float]], Optional[str]]:
+        """Async variant of `_embed_uncached`."""
+        if self.provider == "cohere":
+            embeddings, model = await self._embed_with_cohere_async(texts, input_type)
+        elif self.provider == "huggingface":
+            embeddings, model = await self._embed_with_huggingface_async(texts), HF_EMBED_MODEL
         else:
-            return self._embed_with_hash(texts)
+            embeddings, model = None, None
+        if embeddings is None:
+            return self._embed_with_hash(texts), None
+        return embeddings, model
+
+    @staticmethod
+    def _clean_texts(texts: List[str]) -> List[str]:
+        # Keep one entry per input so results stay aligned with the caller's list
+        return [text.strip()[:2048] or " " for text in texts]
+
+    def _make_batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """Split texts into [start, end) ranges that respect the provider's count and size limits."""
+        batches = []
+        start, chars = 0, 0
+        for i, text in enumerate(texts):
+            if i > start and (i - start >= COHERE_EMBED_BATCH_SIZE or chars + len(text) > COHERE_EMBED_BATCH_CHARS):
+                batches.append((start, i))
+                start, chars = i, 0
+            chars += len(text)
+        batches.append((start, len(texts)))
+        return batches
+
+    @staticmethod
+    def _retry_delay(attempt: int, response=None) -> float:
+        """Exponential backoff with jitter, honouring Retry-After when the provider sends it, up to EMBED_RETRY_MAX_DELAY."""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), EMBED_RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+        return min(EMBED_RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, EMBED_RETRY_BACKOFF), EMBED_RETRY_MAX_DELAY)
+
+    def _check_cohere_response(self, response, model: str, expected: int) -> List[List[float]]:
+        """Turn a Cohere embed response into vectors or raise a classified error."""
+        if response.status_code == 200:
+            embeddings = response.json().get("embeddings", [])
+            if embeddings and len(embeddings) == expected:
+                return embeddings
+            raise _RetryableEmbeddingError(f"Invalid embeddings response from {model}")
+        if response.status_code == 429 or response.status_code >= 500:
+            raise _RetryableEmbeddingError(f"Cohere API error with {model}: {response.status_code}", response)
+        raise _ModelUnavailableError(f"Cohere API error with {model}: {response.status_code} - {response.text}")
+
+    def _post_cohere_batch(
+        self, texts: List[str], model: str, input_type: str, cancelled: Optional[threading.Event] = None
+    ) -> List[List[float]]:
+        """Embed one batch with one model, retrying transient failures with backoff.
+
+        Setting `cancelled` stops the retries, once another batch of the same
+        call has failed for good and this one's result would be thrown away.
+        """
+        payload = {
+            "texts": texts,
+            "model": model,
+            "input_type": input_type,  # search_document for ingest, search_query for chat
+            "truncate": "END"
+        }
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            if cancelled is not None and cancelled.is_set():
+                raise _RetryableEmbeddingError(f"Batch cancelled with {model}")
+            response = None
+            try:
+                response = self._http.post(self.cohere_url, headers=self.headers, json=payload, timeout=30)
+                return self._check_cohere_response(response, model, len(texts))
+            except _ModelUnavailableError:
+                raise
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise _RetryableEmbeddingError(f"{e} (gave up after {attempt + 1} attempts)")
+                delay = self._retry_delay(attempt, getattr(e, "response", response))
+                logger.warning(f"Embedding batch failed with {model}: {e}, retrying in {delay:.1f}s")
+                if cancelled is not None:
+                    cancelled.wait(delay)
+                else:
+                    time.sleep(delay)
+
+    async def _post_cohere_batch_async(self, texts: List[str], model: str, input_type: str) -> List[List[float]]:
+        """Async variant of `_post_cohere_batch`."""
+        payload = {
+            "texts": texts,
+            "model": model,
+            "input_type": input_type,
+            "truncate": "END"
+        }
+        client = self._get_async_http()
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            response = None
+            try:
+                response = await client.post(self.cohere_url, headers=self.headers, json=payload)
+                return self._check_cohere_response(response, model, len(texts))
+            except _ModelUnavailableError:
+                raise
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise _RetryableEmbeddingError(f"{e} (gave up after {attempt + 1} attempts)")
+                delay = self._retry_delay(attempt, getattr(e, "response", response))
+                logger.warning(f"Embedding batch failed with {model}: {e}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
 
-    def _embed_with_cohere(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings using Cohere API."""
+    def _embed_with_cohere(self, texts: List[str], input_type: str) -> Tuple[Optional[List[List[float]]], Optional[str]]:
+        """Generate embeddings using Cohere API.
+
+        The first batch picks the model by walking the cascade; every other batch
+        is pinned to that model and dispatched concurrently, so one call never
+        mixes vectors from different models. If any batch still fails after its
+        retries the whole call falls back rather than returning a mixed result.
+        """
+        cleaned_texts = self._clean_texts(texts)
+        batches = self._make_batches(cleaned_texts)
+        first_start, first_end = batches[0]
+
+        model = None
+        first_vectors = None
+        for candidate in self._cohere_models():
+            try:
+                first_vectors = self._post_cohere_batch(cleaned_texts[first_start:first_end], candidate, input_type)
+                model = candidate
+                break
+            except Exception as model_error:
+                logger.warning(f"Error with Cohere model {candidate}: {model_error}")
+        if model is None:
+            logger.warning("All Cohere models failed, falling back to hash embeddings")
+            return None, None
+
+        embeddings: List[Optional[List[float]]] = [None] * len(cleaned_texts)
+        embeddings[first_start:first_end] = first_vectors
+        cancelled = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=EMBED_MAX_IN_FLIGHT)
         try:
-            # Clean and prepare texts
-            cleaned_texts = [text.strip()[:2048] for text in texts if text.strip()]
-            
-            # Try different Cohere models
-            models_to_try = ["embed-english-v3.0", "embed-english-v2.0", "embed-english-light-v3.0"]
-            
-            for model in models_to_try:
-                try:
-                    payload = {
-                        "texts": cleaned_texts,
-                        "model": model,
-                        "input_type": "search_document",  # Optimized for RAG
-                        "truncate": "END"
-                    }
-                    
-                    response = requests.post(
-                        self.cohere_url,
-                        headers=self.headers,
-                        json=payload,
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        embeddings = result.get("embeddings", [])
-                        
-                        if embeddings and len(embeddings) == len(cleaned_texts):
-                            logger.info(f"Generated {len(embeddings)} embeddings via Cohere {model}")
-                            return embeddings
-                        else:
-                            logger.warning(f"Invalid embeddings response from {model}")
-                    
-                    elif response.status_code == 429:  # Rate limit
-                        logger.warning(f"Rate limit hit with {model}, waiting...")
-                        import time
-                        time.sleep(2)
-                        continue
-                    else:
-                        logger.warning(f"Cohere API error with {model}: {response.status_code} - {response.text}")
-                        
-                except Exception as model_error:
-                    logger.warning(f"Error with Cohere model {model}: {model_error}")
-                    continue
-            
-            # All Cohere models failed
+            futures = {
+                pool.submit(self._post_cohere_batch, cleaned_texts[start:end], model, input_type, cancelled): (start, end)
+                for start, end in batches[1:]
+            }
+            for future in as_completed(futures):
+                start, end = futures[future]
+                embeddings[start:end] = future.result()
+        except Exception as e:
+            logger.error(f"Cohere batch failed with {model}: {e}, falling back to hash embeddings")
+            # The call's result is discarded: drop queued batches and stop the running ones' retries
+            cancelled.set()
+            return None, None
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        logger.info(f"Generated {len(embeddings)} embeddings via Cohere {model} in {len(batches)} batches")
+        return embeddings, model
+
+    async def _embed_with_cohere_async(self, texts: List[str], input_type: str) -> Tuple[Optional[List[List[float]]], Optional[str]]:
+        """Async variant of `_embed_with_cohere` bounded by a semaphore instead of a thread pool."""
+        cleaned_texts = self._clean_texts(texts)
+        batches = self._make_batches(cleaned_texts)
+        first_start, first_end = batches[0]
+
+        model = None
+        first_vectors = None
+        for candidate in self._cohere_models():
+            try:
+                first_vectors = await self._post_cohere_batch_async(cleaned_texts[first_start:first_end], candidate, input_type)
+                model = candidate
+                break
+            except Exception as model_error:
+                logger.warning(f"Error with Cohere model {candidate}: {model_error}")
+        if model is None:
             logger.warning("All Cohere models failed, falling back to hash embeddings")
-            return self._embed_with_hash(texts)
-            
+            return None, None
+
+        embeddings: List[Optional[List[float]]] = [None] * len(cleaned_texts)
+        embeddings[first_start:first_end] = first_vectors
+        in_flight = asyncio.Semaphore(EMBED_MAX_IN_FLIGHT)
+
+        async def run_batch(start: int, end: int) -> None:
+            async with in_flight:
+                embeddings[start:end] = await self._post_cohere_batch_async(cleaned_texts[start:end], model, input_type)
+
+        tasks = [asyncio.ensure_future(run_batch(start, end)) for start, end in batches[1:]]
+        try:
+            await asyncio.gather(*tasks)
         except Exception as e:
-            logger.error(f"Error with Cohere API: {e}, falling back to hash embeddings")
-            return self._embed_with_hash(texts)
+            logger.error(f"Cohere batch failed with {model}: {e}, falling back to hash embeddings")
+            return None, None
+        finally:
+            # Also on failure or cancellation of the caller: the other batches' results would be thrown away
+            for task in tasks:
+                task.cancel()
 
-    def _embed_with_huggingface(self, texts: List[str]) -> List[List[float]]:
+        logger.info(f"Generated {len(embeddings)} embeddings via Cohere {model} in {len(batches)} batches")
+        return embeddings, model
+
+    def _embed_with_huggingface(self, texts: List[str]) -> Optional[List[List[float]]]:
         """Generate embeddings using HuggingFace API."""
         try:
             response = requests.post(
@@ -121,11 +481,32 @@ class EmbeddingService:
                 return embeddings
             else:
                 logger.warning(f"HuggingFace API error: {response.status_code}, falling back to hash embeddings")
-                return self._embed_with_hash(texts)
+                return None
                 
         except Exception as e:
             logger.error(f"Error with HuggingFace API: {e}, falling back to hash embeddings")
-            return self._embed_with_hash(texts)
+            return None
+
+    async def _embed_with_huggingface_async(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Generate embeddings using HuggingFace API over the async HTTP client."""
+        try:
+            response = await self._get_async_http().post(
+                self.hf_url,
+                headers=self.hf_headers,
+                json={"inputs": texts, "options": {"wait_for_model": True}},
+            )
+
+            if response.status_code == 200:
+                embeddings = response.json()
+                logger.info(f"Generated {len(embeddings)} embeddings via HuggingFace API")
+                return embeddings
+            else:
+                logger.warning(f"HuggingFace API error: {response.status_code}, falling back to hash embeddings")
+                return None
+
+        except Exception as e:
+            logger.error(f"Error with HuggingFace API: {e}, falling back to hash embeddings")
+            return None
 
     def _embed_with_hash(self, texts: List[str]) -> List[List[float]]:
         """Generate simple hash-based embeddings for texts."""
@@ -142,8 +523,8 @@ class EmbeddingService:
                 value = (int(hex_pair, 16) / 255.0) - 0.5  # Normalize to [-0.5, 0.5]
                 embedding.append(value)
             
-            # Pad or truncate to desired dimension
-            target_dim = 1024 if self.use_cohere else 384  # Match API dimensions
+            # Pad or truncate to the dimension of the provider's vectors
+            target_dim = self.embedding_dim
             while len(embedding) < target_dim:
                 embedding.extend(embedding[:min(len(embedding), target_dim - len(embedding))])
             
@@ -0,0 +1,171 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple
+import codecs
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import threading
+
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PdfReadError
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a .txt file decoded per segment
+TEXT_READ_SIZE = 64 * 1024
+# Processes extracting PDF pages in parallel (shared by all ingest jobs); 0 extracts in the calling thread
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Seconds one PDF page may take before it is skipped as malformed
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", 30))
+# Pages handed to a worker process per task
+PDF_PAGES_PER_TASK = 8
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class PageTimeout(Exception):
+    """Raised inside a worker process when a page exceeds PDF_PAGE_TIMEOUT."""
+
+
+def is_supported(filename: str) -> bool:
+    return filename.endswith(SUPPORTED_EXTENSIONS)
+
+
+def open_pages(filename: str, source: BinaryIO) -> Tuple[int, Iterator[Tuple[int, str]]]:
+    """Return the number of segments in a document and an iterator over (page_number, text).
+
+    A .pdf is read page by page and a .txt block by block, so callers can
+    process documents larger than memory one segment at a time. PDF pages
+    are numbered from 1, and every block of a .txt is page 1. PDFs backed
+    by a file on disk (such as spooled uploads) are extracted by a pool of
+    worker processes, in page order.
+    """
+    if filename.endswith(".txt"):
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+        return max(1, math.ceil(size / TEXT_READ_SIZE)), _iter_text_blocks(source)
+
+    if filename.endswith(".pdf"):
+        try:
+            pdf_reader = PdfReader(source)
+            total = len(pdf_reader.pages)
+        except PdfReadError as e:
+            # A corrupt upload will not get better on retry
+            raise ValueError(f"Could not read PDF: {e}")
+        path = getattr(source, "name", None)
+        if PDF_EXTRACT_WORKERS > 0 and isinstance(path, str) and os.path.isfile(path):
+            return total, _iter_pdf_pages_parallel(path, pdf_reader, total)
+        return total, _iter_pdf_pages(pdf_reader, 0, total)
+
+    raise ValueError("Only .pdf and .txt files are supported.")
+
+
+def _iter_text_blocks(source: BinaryIO) -> Iterator[Tuple[int, str]]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        block = source.read(TEXT_READ_SIZE)
+        if not block:
+            break
+        yield 1, decoder.decode(block)
+    # Raises on a truncated multi-byte character at the very end
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield 1, tail
+
+
+def _iter_pdf_pages(pdf_reader: PdfReader, start: int, stop: int) -> Iterator[Tuple[int, str]]:
+    for index in range(start, stop):
+        try:
+            yield index + 1, pdf_reader.pages[index].extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Could not extract PDF page {index + 1}: {e}")
+            yield index + 1, ""
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: the server process runs threads that must not be copied mid-operation
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _iter_pdf_pages_parallel(path: str, pdf_reader: PdfReader, total: int) -> Iterator[Tuple[int, str]]:
+    """Yield page texts in order while worker processes extract the following page ranges."""
+    ranges = deque((start, min(start + PDF_PAGES_PER_TASK, total)) for start in range(0, total, PDF_PAGES_PER_TASK))
+    in_flight: Deque[Tuple[int, int, Future]] = deque()
+    pool = _get_pool()
+
+    def submit_next() -> None:
+        if ranges:
+            start, stop = ranges.popleft()
+            in_flight.append((start, stop, pool.submit(extract_page_range, path, start, stop, PDF_PAGE_TIMEOUT)))
+
+    try:
+        # Keep every worker busy plus one range queued each, so results are never waited on for long
+        for _ in range(2 * PDF_EXTRACT_WORKERS):
+            submit_next()
+        while in_flight:
+            start, stop, future = in_flight.popleft()
+            try:
+                texts = future.result()
+            except Exception as e:
+                # The pool broke (e.g. a worker was killed); finish the document in this thread
+                logger.warning(f"PDF worker pool failed on pages {start + 1}-{stop}, extracting serially: {e}")
+                _reset_pool()
+                yield from _iter_pdf_pages(pdf_reader, start, total)
+                return
+            submit_next()
+            yield from enumerate(texts, start=start + 1)
+    finally:
+        for _, _, future in in_flight:
+            future.cancel()
+
+
+def extract_page_range(path: str, start: int, stop: int, timeout: float = PDF_PAGE_TIMEOUT) -> List[str]:
+    """Extract pages [start, stop) of a PDF file; runs in a worker process.
+
+    A page that raises, or takes longer than `timeout` seconds, yields an
+    empty string so one malformed page cannot stall or fail the document.
+    """
+    pdf_reader = PdfReader(path)
+    use_alarm = timeout > 0 and hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_page_timeout)
+
+    texts: List[str] = []
+    for index in range(start, stop):
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            texts.append(pdf_reader.pages[index].extract_text() or "")
+        except PageTimeout:
+            logger.warning(f"Skipped page {index + 1} of {path}: extraction took over {timeout:g}s")
+            texts.append("")
+        except Exception as e:
+            logger.warning(f"Could not extract page {index + 1} of {path}: {e}")
+            texts.append("")
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    return texts
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeout()
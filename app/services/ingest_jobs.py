@@ -0,0 +1,405 @@
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Dict, Iterator, List, Set, Tuple
+import logging
+import os
+import queue
+import shutil
+import threading
+import uuid
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.session import SessionLocal
+from app.services.chunking import ChunkingService
+from app.services.extraction import open_pages
+from app.services.ingestion import IngestionService, IngestSource
+
+logger = logging.getLogger(__name__)
+
+# Documents ingested at the same time
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+# Jobs waiting for a worker before uploads are turned away
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 100))
+# Where uploads wait until their job finishes; share it between nodes to let them take over each other's jobs
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", os.path.join("data", "ingest_spool"))
+# Seconds without a heartbeat after which a running job is considered dead and resumed
+INGEST_JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", 120))
+# Runs of a job (the first try included) before it is marked failed
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 3))
+# Seconds between heartbeats of a running job
+HEARTBEAT_INTERVAL = max(1, INGEST_JOB_STALE_SECONDS // 4)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SPOOL_COPY_SIZE = 1024 * 1024
+
+
+class IngestQueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class IngestJobQueue:
+    """Runs document ingestion in a bounded pool of background workers.
+
+    An upload is spooled to disk and recorded as an `IngestJob` row, so the
+    request returns at once and the job's stage and progress can be polled.
+    The row is the source of truth: workers claim jobs with a conditional
+    update, report progress and a heartbeat, and checkpoint the last chunk
+    whose vector was written. A job whose worker died (no heartbeat for
+    INGEST_JOB_STALE_SECONDS) is picked up again by the periodic sweep, which
+    discards the unconfirmed chunks and resumes the document incrementally,
+    so already indexed chunks are not embedded twice.
+    """
+
+    def __init__(
+        self,
+        ingestion: IngestionService,
+        chunker: ChunkingService,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: int = INGEST_WORKERS,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        spool_dir: str = INGEST_SPOOL_DIR,
+    ):
+        self.ingestion = ingestion
+        self.chunker = chunker
+        self.session_factory = session_factory
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=queue_size)
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._threads: list = []
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        """Start the workers and pick up jobs left unfinished by a previous process."""
+        with self._lock:
+            if self._threads:
+                return
+            os.makedirs(self.spool_dir, exist_ok=True)
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"ingest-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {self.workers} ingest workers")
+        self.sweep()
+
+    def stop(self) -> None:
+        """Ask the workers to exit; a job still running is resumed by the next process."""
+        self._stopping.set()
+
+    def submit(self, db: Session, filename: str, filetype: str, chunk_strategy: str, incremental: bool, source: BinaryIO) -> models.IngestJob:
+        """Spool an upload and queue it; raises IngestQueueFull when the queue is full."""
+        return self.submit_batch(db, [(filename, filetype, source)], chunk_strategy, incremental, batch=False)[0]
+
+    def submit_batch(
+        self,
+        db: Session,
+        files: List[Tuple[str, str, BinaryIO]],
+        chunk_strategy: str,
+        incremental: bool,
+        batch: bool = True,
+    ) -> List[models.IngestJob]:
+        """Spool (filename, filetype, file) uploads as one batch of jobs that are ingested together.
+
+        Each file still gets its own job, so its outcome is reported separately.
+        The batch takes a single queue slot.
+        """
+        self.start()
+        if self._queue.full():
+            raise IngestQueueFull()
+
+        batch_id = str(uuid.uuid4()) if batch else None
+        jobs: List[models.IngestJob] = []
+        for filename, filetype, source in files:
+            job_id = str(uuid.uuid4())
+            spool_path = os.path.join(self.spool_dir, job_id + os.path.splitext(filename)[1])
+            with open(spool_path, "wb") as spool:
+                shutil.copyfileobj(source, spool, SPOOL_COPY_SIZE)
+            jobs.append(models.IngestJob(
+                id=job_id,
+                batch_id=batch_id,
+                filename=filename,
+                filetype=filetype,
+                chunk_strategy=chunk_strategy,
+                incremental=incremental,
+                spool_path=spool_path,
+                created_at=datetime.utcnow(),
+            ))
+        db.add_all(jobs)
+        db.commit()
+        for job in jobs:
+            db.refresh(job)
+
+        if jobs and not self._enqueue(jobs[0].id):
+            # The queue filled up meanwhile; the jobs stay queued and the sweep picks them up
+            logger.warning(f"Ingest queue full, job {jobs[0].id} waits for the next sweep")
+        return jobs
+
+    def sweep(self) -> None:
+        """Queue jobs that are waiting or whose worker stopped sending heartbeats."""
+        stale_before = datetime.utcnow() - timedelta(seconds=INGEST_JOB_STALE_SECONDS)
+        db = self.session_factory()
+        try:
+            rows = db.query(models.IngestJob.id, models.IngestJob.spool_path).filter(
+                or_(
+                    models.IngestJob.status == QUEUED,
+                    (models.IngestJob.status == RUNNING) & (models.IngestJob.updated_at < stale_before),
+                )
+            ).order_by(models.IngestJob.created_at).all()
+        except Exception as e:
+            logger.warning(f"Could not look for pending ingest jobs: {e}")
+            return
+        finally:
+            db.close()
+
+        for job_id, spool_path in rows:
+            # Jobs spooled on another node can only be taken over through a shared spool directory
+            if os.path.exists(spool_path) and not self._enqueue(job_id):
+                break
+
+    def _enqueue(self, job_id: str) -> bool:
+        with self._lock:
+            if job_id in self._pending:
+                return True
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                return False
+            self._pending.add(job_id)
+            return True
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job_id = self._queue.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                self.sweep()
+                continue
+            with self._lock:
+                self._pending.discard(job_id)
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logger.error(f"Ingest worker crashed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, db: Session, job_id: str) -> bool:
+        """Atomically move a job to running, unless another worker holds a live claim."""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=INGEST_JOB_STALE_SECONDS)
+        claimed = db.execute(
+            update(models.IngestJob)
+            .where(
+                models.IngestJob.id == job_id,
+                or_(
+                    models.IngestJob.status == QUEUED,
+                    (models.IngestJob.status == RUNNING) & (models.IngestJob.updated_at < stale_before),
+                ),
+            )
+            .values(status=RUNNING, attempts=models.IngestJob.attempts + 1, updated_at=now)
+        ).rowcount
+        db.commit()
+        return claimed == 1
+
+    def _save(self, job_id: str, **fields) -> None:
+        """Write job fields (and the heartbeat) in a short session of their own."""
+        db = self.session_factory()
+        try:
+            db.query(models.IngestJob).filter(models.IngestJob.id == job_id).update(
+                {**fields, "updated_at": datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, job_id: str) -> None:
+        db = self.session_factory()
+        try:
+            job = db.get(models.IngestJob, job_id)
+            if job is None:
+                return
+            candidates = [job_id]
+            if job.batch_id is not None:
+                # Files uploaded together are ingested together, sharing embedding batches and upserts
+                candidates = [
+                    sibling_id for (sibling_id,) in db.query(models.IngestJob.id)
+                    .filter(models.IngestJob.batch_id == job.batch_id)
+                    .order_by(models.IngestJob.created_at)
+                ]
+            claimed = [candidate for candidate in candidates if self._claim(db, candidate)]
+            db.expire_all()
+
+            jobs: List[models.IngestJob] = []
+            for claimed_id in claimed:
+                job = db.get(models.IngestJob, claimed_id)
+                if job.attempts > INGEST_MAX_ATTEMPTS:
+                    # Earlier attempts died without reporting back (e.g. the process was killed)
+                    self._fail(db, job, RuntimeError(f"Gave up after {job.attempts - 1} interrupted attempts"))
+                else:
+                    jobs.append(job)
+            if jobs:
+                self._ingest(db, jobs)
+        finally:
+            db.close()
+
+    def _ingest(self, db: Session, jobs: List[models.IngestJob]) -> None:
+        for job in jobs:
+            logger.info(f"Running ingest job {job.id} ({job.filename}, attempt {job.attempts})")
+            if job.document_id is not None:
+                # An earlier attempt was interrupted: drop chunks whose vectors may be missing, keep the rest
+                self._save(job.id, stage="resuming")
+                discarded = self.ingestion.discard_unconfirmed(db, job.document_id, job.last_chunk_id or 0)
+                logger.info(f"Resuming ingest job {job.id} on document {job.document_id}, discarded {discarded} unconfirmed chunks")
+
+        pages_done: Dict[str, int] = {job.id: 0 for job in jobs}
+        documents: Dict[str, int] = {}
+        sources = [self._source(job, pages_done, documents) for job in jobs]
+
+        def heartbeat() -> None:
+            for job_id, done in pages_done.items():
+                self._save(job_id, pages_done=done)
+
+        try:
+            with _Heartbeat(heartbeat):
+                results = self.ingestion.ingest_many(db, sources)
+        except Exception as e:
+            # The shared embedding or upsert step failed, so every job of the run is retried
+            db.rollback()
+            for job in jobs:
+                self._fail(db, job, e)
+            return
+
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                document_id = documents.get(job.id)
+                if document_id is not None and db.get(models.Document, document_id) is None:
+                    # The document was created by this attempt and rolled back with it; start afresh next time
+                    self._fail(
+                        db, job, result, document_id=None, document_created=False, last_chunk_id=None, chunks_indexed=0
+                    )
+                else:
+                    self._fail(db, job, result)
+                continue
+            self._save(
+                job.id,
+                status=DONE,
+                stage=DONE,
+                document_id=result.document_id,
+                chunks_added=result.chunks_added,
+                chunks_unchanged=result.chunks_unchanged,
+                chunks_removed=result.chunks_removed,
+                error=None,
+            )
+            self._remove_spool(job.spool_path)
+            logger.info(f"Ingest job {job.id} finished: document {result.document_id}")
+
+    def _source(self, job: models.IngestJob, pages_done: Dict[str, int], documents: Dict[str, int]) -> IngestSource:
+        """Describe a job's file as an ingest source whose chunks are read from the spool on demand."""
+        job_id = job.id
+
+        def chunks() -> Iterator[str]:
+            with open(job.spool_path, "rb") as source:
+                pages_total, pages = open_pages(job.filename, source)
+                self._save(job_id, stage="indexing", pages_total=pages_total, pages_done=0, chunks_indexed=0)
+
+                def counted_pages() -> Iterator[Tuple[int, str]]:
+                    for page in pages:
+                        yield page
+                        pages_done[job_id] += 1
+
+                empty = True
+                for chunk in self.chunker.iter_chunks(job.chunk_strategy, counted_pages()):
+                    empty = False
+                    yield chunk.text
+                if empty:
+                    raise ValueError("Uploaded file is empty.")
+                self._save(job_id, stage="finalizing", pages_done=pages_total)
+
+        def on_open(document_id: int, created: bool) -> None:
+            if created:
+                # Later attempts resume this document, so only the attempt that created it records that
+                self._save(job_id, document_id=document_id, document_created=True)
+
+        def on_progress(document_id: int, chunks_indexed: int, last_chunk_id: int) -> None:
+            documents[job_id] = document_id
+            self._save(
+                job_id,
+                document_id=document_id,
+                chunks_indexed=chunks_indexed,
+                last_chunk_id=last_chunk_id,
+                pages_done=pages_done[job_id],
+            )
+
+        return IngestSource(
+            filename=job.filename,
+            filetype=job.filetype,
+            chunks=chunks(),
+            incremental=job.incremental,
+            document_id=job.document_id,
+            on_progress=on_progress,
+            on_open=on_open,
+        )
+
+    def _fail(self, db: Session, job: models.IngestJob, error: Exception, **fields) -> None:
+        # Bad input fails for good; anything else (provider, network, database) is retried
+        retry = not isinstance(error, ValueError) and job.attempts < INGEST_MAX_ATTEMPTS
+        logger.error(f"Ingest job {job.id} failed on attempt {job.attempts}: {error}")
+        if retry:
+            self._save(job.id, status=QUEUED, stage=QUEUED, error=str(error)[:1000], **fields)
+            self._enqueue(job.id)
+        else:
+            self._abandon(db, job, fields)
+            self._save(job.id, status=FAILED, stage=FAILED, error=str(error)[:1000], **fields)
+            self._remove_spool(job.spool_path)
+
+    def _abandon(self, db: Session, job: models.IngestJob, fields: Dict[str, object]) -> None:
+        """Remove what a job that failed for good left of its document, so it is not served half-indexed.
+
+        A document the job created goes entirely; an existing one it was
+        updating only loses the chunks whose vectors may be missing.
+        """
+        # Progress is saved in sessions of their own, so reload it
+        db.refresh(job)
+        document_id = fields.get("document_id", job.document_id)
+        if document_id is None:
+            return
+        self.ingestion.abandon_document(db, document_id, job.last_chunk_id or 0, job.document_created)
+        logger.info(f"Removed the unfinished document {document_id} of failed ingest job {job.id}")
+
+    @staticmethod
+    def _remove_spool(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _Heartbeat:
+    """Calls `beat` every HEARTBEAT_INTERVAL seconds on a side thread while the block runs."""
+
+    def __init__(self, beat: Callable[[], None]):
+        self.beat = beat
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._done.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.beat()
+            except Exception as e:
+                logger.warning(f"Ingest heartbeat failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
@@ -0,0 +1,398 @@
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import hashlib
+import logging
+import os
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.services.collections import LiveServices
+from app.services.latest_document import LatestDocumentPointer
+from app.services.lexical import LexicalSearchService
+from app.services.stored_embeddings import EMBEDDING_STORE_DTYPE, STORE_DTYPES, encode_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Chunks persisted, embedded and upserted per pipeline step
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+
+# Called as (document_id, chunks_indexed, last_chunk_id) whenever a batch is durably indexed
+ProgressCallback = Callable[[int, int, int], None]
+# Called as (document_id, created) once the document row exists
+OpenCallback = Callable[[int, bool], None]
+
+
+def chunk_content_hash(text: str) -> str:
+    """Content hash used to recognise unchanged chunks across uploads."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IngestResult:
+    """Outcome of ingesting one document."""
+
+    document_id: int
+    chunks_added: int
+    chunks_unchanged: int
+    chunks_removed: int
+
+
+@dataclass
+class IngestSource:
+    """One document to ingest: its file details and a lazy stream of chunk texts."""
+
+    filename: str
+    filetype: str
+    chunks: Iterable[str]
+    incremental: bool = False
+    # Update this document instead of creating one (or looking it up by filename)
+    document_id: Optional[int] = None
+    on_progress: Optional[ProgressCallback] = None
+    on_open: Optional[OpenCallback] = None
+
+
+class _SourceState:
+    """Bookkeeping for one source while its chunks move through the shared pipeline."""
+
+    def __init__(self, source: IngestSource):
+        self.source = source
+        self.document_id: Optional[int] = None
+        self.created = False
+        self.payload: Dict[str, object] = {}
+        self.stored: Dict[str, List[int]] = {}
+        # Highest chunk ID of the document before this run; everything above it is new
+        self.base_chunk_id = 0
+        self.kept = 0
+        self.added = 0
+        self.indexed = 0
+        self.error: Optional[Exception] = None
+
+
+class IngestionService:
+    """Persists chunks in the database and indexes their embeddings in the vector store."""
+
+    def __init__(
+        self,
+        services: LiveServices,
+        lexical: Optional[LexicalSearchService] = None,
+        latest_document: Optional[LatestDocumentPointer] = None,
+    ):
+        self.services = services
+        self.lexical = lexical or LexicalSearchService()
+        self.latest_document = latest_document or LatestDocumentPointer()
+
+    def ingest(
+        self,
+        db: Session,
+        filename: str,
+        filetype: str,
+        chunks: Iterable[str],
+        incremental: bool = False,
+        document_id: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> IngestResult:
+        """Store a chunked document.
+
+        `chunks` is consumed lazily and indexed batch by batch, so memory stays
+        bounded by the batch size rather than the document size.
+
+        With `incremental`, the latest document with the same filename is
+        updated in place: chunks whose content hash is already stored keep their
+        rows and vectors, only new chunks are embedded and upserted, and chunks
+        that disappeared are removed from both stores. Passing `document_id`
+        updates that document the same way, which is how an interrupted ingest
+        resumes without re-embedding the chunks it already indexed.
+
+        `on_progress` is called once the document row exists and after every
+        batch whose vectors are written, with the highest chunk ID known to be
+        complete (see `discard_unconfirmed`).
+        """
+        source = IngestSource(filename, filetype, chunks, incremental, document_id, on_progress)
+        result = self.ingest_many(db, [source])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def ingest_many(self, db: Session, sources: Iterable[IngestSource]) -> List[Union[IngestResult, Exception]]:
+        """Store several chunked documents through one shared pipeline.
+
+        Chunks of consecutive documents are packed into the same full-size
+        batches, so a folder of small files costs as many embedding calls and
+        upserts as one large file. Returns a result per source, in order, or
+        the exception that made that source fail; a failed source's new chunks
+        and, if it was just created, its document are removed again. Errors of
+        the shared embedding or upsert steps are raised for the caller to retry.
+        """
+        states: List[_SourceState] = []
+
+        def items() -> Iterator[Tuple[_SourceState, str]]:
+            for source in sources:
+                state = _SourceState(source)
+                states.append(state)
+                try:
+                    self._open_document(db, state)
+                    for chunk in source.chunks:
+                        matches = state.stored.get(chunk_content_hash(chunk))
+                        if matches:
+                            matches.pop()
+                            state.kept += 1
+                        else:
+                            state.added += 1
+                            yield state, chunk
+                except Exception as e:
+                    db.rollback()
+                    state.error = e
+                    logger.warning(f"Could not ingest {source.filename}: {e}")
+
+        self._index_stream(db, items())
+
+        results: List[Union[IngestResult, Exception]] = []
+        for state in states:
+            if state.error is not None:
+                if state.document_id is not None:
+                    self.abandon_document(db, state.document_id, state.base_chunk_id, state.created)
+                results.append(state.error)
+            else:
+                results.append(self._close_document(db, state))
+        return results
+
+    def _open_document(self, db: Session, state: _SourceState) -> None:
+        """Create or look up the document of a source and load its stored chunk hashes."""
+        source = state.source
+        document: Optional[models.Document] = None
+        if source.document_id is not None:
+            document = db.get(models.Document, source.document_id)
+            if document is None:
+                raise ValueError(f"Document {source.document_id} no longer exists")
+        elif source.incremental:
+            document = (
+                db.query(models.Document)
+                .filter(models.Document.filename == source.filename)
+                .order_by(models.Document.uploaded_at.desc())
+                .first()
+            )
+
+        if document is None:
+            document = models.Document(filename=source.filename, filetype=source.filetype)
+            db.add(document)
+            state.created = True
+        else:
+            state.stored = self._stored_hashes(db, document.id)
+            document.filetype = source.filetype
+            document.uploaded_at = datetime.utcnow()
+        db.commit()
+        db.refresh(document)
+        # A new or re-uploaded document is now the latest one
+        self.latest_document.invalidate()
+
+        state.document_id = document.id
+        state.payload = {"filetype": document.filetype, "uploaded_at": document.uploaded_at.timestamp()}
+        # Rows that existed before this ingest already have their vectors
+        state.base_chunk_id = max((i for ids in state.stored.values() for i in ids), default=0)
+        if source.on_open is not None:
+            source.on_open(state.document_id, state.created)
+        if source.on_progress is not None:
+            source.on_progress(state.document_id, 0, state.base_chunk_id)
+
+    def _close_document(self, db: Session, state: _SourceState) -> IngestResult:
+        """Remove chunks that disappeared from an updated document and report the outcome."""
+        stale_ids = [chunk_id for ids in state.stored.values() for chunk_id in ids]
+        if stale_ids:
+            self.services.vectorstore.delete_by_chunk_ids(stale_ids)
+            self.lexical.remove_chunks(db, stale_ids)
+            db.query(models.DocumentChunk).filter(
+                models.DocumentChunk.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        if state.kept:
+            # Kept vectors stay as they are; only refresh the filterable upload time
+            self.services.vectorstore.set_document_payload(state.document_id, {"uploaded_at": state.payload["uploaded_at"]})
+
+        logger.info(
+            f"Ingested document {state.document_id}: {state.added} new, {state.kept} unchanged, {len(stale_ids)} removed chunks"
+        )
+        return IngestResult(
+            document_id=state.document_id,
+            chunks_added=state.added,
+            chunks_unchanged=state.kept,
+            chunks_removed=len(stale_ids),
+        )
+
+    def abandon_document(self, db: Session, document_id: int, after_chunk_id: int, created: bool) -> None:
+        """Undo what a failed ingest wrote: the document's chunks above `after_chunk_id`, and the document if it `created` it.
+
+        Other documents ingested in the same run are left intact.
+        """
+        try:
+            self.discard_unconfirmed(db, document_id, 0 if created else after_chunk_id)
+            if created:
+                db.query(models.Document).filter(models.Document.id == document_id).delete()
+                db.commit()
+                self.latest_document.invalidate()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not clean up document {document_id} after a failed ingest: {e}")
+
+    def discard_unconfirmed(self, db: Session, document_id: int, after_chunk_id: int) -> int:
+        """Remove a document's chunks above `after_chunk_id`, whose vectors may never have been written."""
+        chunk_ids = [
+            chunk_id for (chunk_id,) in db.query(models.DocumentChunk.id).filter(
+                models.DocumentChunk.document_id == document_id,
+                models.DocumentChunk.id > after_chunk_id,
+            )
+        ]
+        if chunk_ids:
+            self.services.vectorstore.delete_by_chunk_ids(chunk_ids)
+            self.lexical.remove_chunks(db, chunk_ids)
+            db.query(models.DocumentChunk).filter(
+                models.DocumentChunk.id.in_(chunk_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+        return len(chunk_ids)
+
+    def _index_stream(self, db: Session, items: Iterable[Tuple[_SourceState, str]]) -> None:
+        """Persist, embed and upsert chunks in a two-stage pipeline.
+
+        A single writer thread upserts batch N with `wait=False` while batch N+1
+        is persisted and embedded. At most one upsert is in flight, and the last
+        batch is written with `wait=True` as the consistency barrier. Once a
+        batch has landed, each of its documents reports progress.
+        """
+        in_flight: Optional[Future] = None
+        # (chunk count, last chunk ID) of each document in the in-flight batch
+        in_flight_checkpoints: Dict[_SourceState, Tuple[int, int]] = {}
+
+        def confirm() -> None:
+            in_flight.result()
+            for state, (count, last_chunk_id) in in_flight_checkpoints.items():
+                state.indexed += count
+                if state.source.on_progress is not None:
+                    state.source.on_progress(state.document_id, state.indexed, last_chunk_id)
+
+        batches = _batched(items, INGEST_BATCH_SIZE)
+        batch = next(batches, None)
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            while batch is not None:
+                next_batch = next(batches, None)
+
+                texts = [text for _, text in batch]
+                # One pair per batch: its vectors go to the collection of the model that embedded them
+                embedder, vectorstore = self.services.pair
+                # Embedded before the rows are written so a copy of each vector is stored with its chunk
+                embeddings, embedding_models = embedder.embed_texts_with_models(texts)
+                # A batch served by a fallback model would put two models' vectors in one document (and collection)
+                fallbacks = sorted(set(embedding_models) - {embedder.active_model_id})
+                if fallbacks:
+                    raise RuntimeError(
+                        f"Embedding fell back to {', '.join(fallbacks)} instead of {embedder.active_model_id}"
+                    )
+                chunk_ids = self._persist_chunks(
+                    db, [state.document_id for state, _ in batch], texts, embeddings, embedding_models
+                )
+                by_document: Dict[_SourceState, Tuple[List[int], List[str]]] = {}
+                for (state, text), chunk_id in zip(batch, chunk_ids):
+                    ids, document_texts = by_document.setdefault(state, ([], []))
+                    ids.append(chunk_id)
+                    document_texts.append(text)
+                for state, (ids, document_texts) in by_document.items():
+                    self.lexical.add_chunks(db, state.document_id, ids, document_texts)
+
+                metadatas = [
+                    {"document_id": state.document_id, "chunk_id": chunk_id, "text": text, **state.payload}
+                    for (state, text), chunk_id in zip(batch, chunk_ids)
+                ]
+
+                if in_flight is not None:
+                    confirm()
+                in_flight = writer.submit(
+                    vectorstore.upsert_embeddings, embeddings, metadatas, wait=next_batch is None
+                )
+                in_flight_checkpoints = {state: (len(ids), ids[-1]) for state, (ids, _) in by_document.items()}
+                batch = next_batch
+
+            if in_flight is not None:
+                confirm()
+
+    @staticmethod
+    def _persist_chunks(
+        db: Session,
+        document_ids: List[int],
+        texts: List[str],
+        embeddings: Optional[List[List[float]]] = None,
+        embedding_models: Optional[List[str]] = None,
+    ) -> List[int]:
+        """Insert chunk rows and return their IDs in input order.
+
+        Uses one bulk INSERT ... RETURNING, which SQLAlchemy sends as a few
+        multi-row statements, instead of building, flushing and expunging an
+        ORM object per chunk. Databases that cannot return IDs from a
+        multi-row insert fall back to the ORM. Given `embeddings`, a copy
+        quantized to EMBEDDING_STORE_DTYPE is stored with each row.
+        """
+        rows = [
+            {"document_id": document_id, "chunk_text": text, "content_hash": chunk_content_hash(text)}
+            for document_id, text in zip(document_ids, texts)
+        ]
+        if embeddings is not None and EMBEDDING_STORE_DTYPE in STORE_DTYPES:
+            for row, blob, model in zip(rows, encode_embeddings(embeddings), embedding_models):
+                row.update(embedding=blob, embedding_dtype=EMBEDDING_STORE_DTYPE, embedding_model=model)
+        if not db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+            return IngestionService._persist_chunk_objects(db, rows)
+
+        chunk_ids = list(db.scalars(
+            insert(models.DocumentChunk).returning(models.DocumentChunk.id, sort_by_parameter_order=True),
+            rows,
+        ))
+        db.commit()
+        return chunk_ids
+
+    @staticmethod
+    def _persist_chunk_objects(db: Session, rows: List[Dict[str, object]]) -> List[int]:
+        chunk_records = [models.DocumentChunk(**row) for row in rows]
+        db.add_all(chunk_records)
+        db.flush()
+        # Read IDs before commit expires the rows, which would reload each one
+        chunk_ids = [record.id for record in chunk_records]
+        db.commit()
+        # Detach the rows so the session's identity map does not grow with the document
+        for record in chunk_records:
+            db.expunge(record)
+        return chunk_ids
+
+    @staticmethod
+    def _stored_hashes(db: Session, document_id: int) -> Dict[str, List[int]]:
+        """Map content hash to the IDs of the document's stored chunks with that content."""
+        stored: Dict[str, List[int]] = defaultdict(list)
+        unhashed: List[int] = []
+        rows = db.query(models.DocumentChunk.id, models.DocumentChunk.content_hash).filter(
+            models.DocumentChunk.document_id == document_id
+        )
+        for chunk_id, content_hash in rows:
+            if content_hash:
+                stored[content_hash].append(chunk_id)
+            else:
+                unhashed.append(chunk_id)
+        if unhashed:
+            # Rows written before content hashes existed are hashed on the fly
+            legacy = db.query(models.DocumentChunk.id, models.DocumentChunk.chunk_text).filter(
+                models.DocumentChunk.id.in_(unhashed)
+            )
+            for chunk_id, chunk_text in legacy:
+                stored[chunk_content_hash(chunk_text)].append(chunk_id)
+        return stored
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of up to `size` items from an iterable."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
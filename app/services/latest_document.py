@@ -0,0 +1,132 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+import json
+import logging
+import threading
+import time
+
+import redis
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.services.embedding_cache import REDIS_RETRY_AFTER
+from app.services.memory import REDIS_URL, REDIS_HOST, REDIS_PORT, REDIS_DB
+
+logger = logging.getLogger(__name__)
+
+LATEST_DOCUMENT_KEY = "rag:latest_document"
+# Bumped on every invalidation; a cached pointer is only valid for the generation it was read under
+LATEST_DOCUMENT_GENERATION_KEY = "rag:latest_document:generation"
+# Upper bound on how long a pointer is served, in case an invalidation could not reach Redis
+LATEST_DOCUMENT_TTL = 300
+# Seconds the in-process copy is trusted while Redis is unreachable
+LATEST_DOCUMENT_LOCAL_TTL = 5
+
+# Shared by every pointer in the process, so an invalidation from the ingest side is seen by chat
+_local: Dict[str, Any] = {}
+_local_lock = threading.Lock()
+
+
+class LatestDocumentPointer:
+    """Cached pointer to the most recently uploaded document.
+
+    Chat requests that focus on the latest upload read the pointer from Redis
+    instead of sorting the documents table. Ingestion and deletes call
+    `invalidate()`, which bumps a generation counter: a pointer computed
+    before the bump (even one written back after it) is ignored and reloaded
+    from the database on the next read. An in-process copy covers short Redis
+    outages.
+    """
+
+    def __init__(self):
+        timeouts = {"socket_timeout": 0.5, "socket_connect_timeout": 0.5}
+        if REDIS_URL:
+            self.redis_client = redis.from_url(REDIS_URL, decode_responses=True, **timeouts)
+        else:
+            self.redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True, **timeouts)
+        self._redis_down_until = 0.0
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error: Exception) -> None:
+        logger.warning(f"Latest document pointer Redis unavailable, using the in-process copy: {error}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+    @staticmethod
+    def _load(db: Session) -> Optional[Dict[str, Any]]:
+        document = (
+            db.query(models.Document.id, models.Document.filename, models.Document.uploaded_at)
+            .order_by(models.Document.uploaded_at.desc(), models.Document.id.desc())
+            .first()
+        )
+        if document is None:
+            return None
+        return {"id": document.id, "filename": document.filename, "uploaded": document.uploaded_at}
+
+    @staticmethod
+    def _encode(generation: str, document: Optional[Dict[str, Any]]) -> str:
+        if document is not None:
+            uploaded = document["uploaded"]
+            document = {**document, "uploaded": uploaded.isoformat() if uploaded else None}
+        return json.dumps({"generation": generation, "document": document})
+
+    @staticmethod
+    def _decode(value: str) -> Dict[str, Any]:
+        entry = json.loads(value)
+        document = entry["document"]
+        if document is not None and document["uploaded"]:
+            document["uploaded"] = datetime.fromisoformat(document["uploaded"])
+        return entry
+
+    @staticmethod
+    def _get_local() -> Optional[Dict[str, Any]]:
+        with _local_lock:
+            if _local and _local["expires_at"] > time.monotonic():
+                return {"document": _local["document"]}
+        return None
+
+    @staticmethod
+    def _put_local(document: Optional[Dict[str, Any]]) -> None:
+        with _local_lock:
+            _local.update(document=document, expires_at=time.monotonic() + LATEST_DOCUMENT_LOCAL_TTL)
+
+    def get(self, db: Session) -> Optional[Dict[str, Any]]:
+        """Return {"id", "filename", "uploaded"} of the latest document, or None if there are none."""
+        if self._redis_available():
+            try:
+                generation, cached = self.redis_client.mget(LATEST_DOCUMENT_GENERATION_KEY, LATEST_DOCUMENT_KEY)
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+            else:
+                generation = generation or "0"
+                if cached:
+                    entry = self._decode(cached)
+                    if entry["generation"] == generation:
+                        self._put_local(entry["document"])
+                        return entry["document"]
+                document = self._load(db)
+                try:
+                    # Tagged with the generation read before the query, so a concurrent invalidation wins
+                    self.redis_client.set(LATEST_DOCUMENT_KEY, self._encode(generation, document), ex=LATEST_DOCUMENT_TTL)
+                except redis.RedisError as e:
+                    self._mark_redis_down(e)
+                self._put_local(document)
+                return document
+
+        local = self._get_local()
+        if local is not None:
+            return local["document"]
+        document = self._load(db)
+        self._put_local(document)
+        return document
+
+    def invalidate(self) -> None:
+        """Forget the pointer after a document was added, re-uploaded or deleted."""
+        with _local_lock:
+            _local.clear()
+        try:
+            self.redis_client.incr(LATEST_DOCUMENT_GENERATION_KEY)
+        except redis.RedisError as e:
+            # Other processes keep their pointer until LATEST_DOCUMENT_TTL runs out
+            self._mark_redis_down(e)
@@ -0,0 +1,201 @@
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+import heapq
+import logging
+import math
+import re
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+    "who", "why", "with",
+}
+
+# Any query term may match (like the old keyword fallback); ts_rank_cd orders by how well they match.
+# Normalization 1 divides the rank by 1 + log(document length) so long chunks do not dominate.
+POSTGRES_SEARCH_SQL = """
+    SELECT c.id, c.document_id, c.chunk_text,
+           ts_rank_cd(to_tsvector('english', c.chunk_text), q.query, 1) AS score
+    FROM document_chunks c,
+         (SELECT replace(plainto_tsquery('english', :query)::text, '&', '|')::tsquery AS query) q
+    WHERE to_tsvector('english', c.chunk_text) @@ q.query
+      {document_filter}
+    ORDER BY score DESC
+    LIMIT :top_k
+"""
+
+
+def tokenize(value: str) -> List[str]:
+    """Lowercased word tokens without stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(value.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring.
+
+    Used when the database has no full-text search of its own. Only chunk IDs
+    and term frequencies are kept in memory; texts are fetched for the top hits.
+    The index is per process, so writes made by other processes are only seen
+    after a restart.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.built = False
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._lengths: Dict[int, int] = {}
+        self._documents: Dict[int, int] = {}
+        self._total_length = 0
+
+    def build(self, db: Session) -> None:
+        """Load every stored chunk once, streaming rows from the database."""
+        with self._lock:
+            if self.built:
+                return
+            rows = db.query(
+                models.DocumentChunk.id, models.DocumentChunk.document_id, models.DocumentChunk.chunk_text
+            ).yield_per(1000)
+            for chunk_id, document_id, chunk_text in rows:
+                self._add(chunk_id, document_id, chunk_text)
+            self.built = True
+            logger.info(f"Built in-process BM25 index over {len(self._lengths)} chunks")
+
+    def _add(self, chunk_id: int, document_id: int, chunk_text: str) -> None:
+        terms = Counter(tokenize(chunk_text))
+        for term, tf in terms.items():
+            self._postings[term][chunk_id] = tf
+        length = sum(terms.values())
+        self._lengths[chunk_id] = length
+        self._documents[chunk_id] = document_id
+        self._total_length += length
+
+    def add(self, document_id: int, chunk_ids: List[int], texts: List[str]) -> None:
+        """Index new chunks (ignored until the index is built, since build reads them anyway)."""
+        with self._lock:
+            if not self.built:
+                return
+            for chunk_id, chunk_text in zip(chunk_ids, texts):
+                self._add(chunk_id, document_id, chunk_text)
+
+    def remove(self, chunk_ids: Iterable[int]) -> None:
+        """Drop chunks from the index."""
+        with self._lock:
+            doomed = {chunk_id for chunk_id in chunk_ids if chunk_id in self._lengths}
+            if not doomed:
+                return
+            for term in list(self._postings):
+                postings = self._postings[term]
+                for chunk_id in doomed & postings.keys():
+                    del postings[chunk_id]
+                if not postings:
+                    del self._postings[term]
+            for chunk_id in doomed:
+                self._total_length -= self._lengths.pop(chunk_id)
+                del self._documents[chunk_id]
+
+    def chunks_of(self, document_id: int) -> List[int]:
+        with self._lock:
+            return [chunk_id for chunk_id, doc_id in self._documents.items() if doc_id == document_id]
+
+    def search(self, query: str, top_k: int, document_ids: Optional[List[int]] = None) -> List[tuple]:
+        """Return (chunk_id, document_id, score) for the best `top_k` chunks."""
+        with self._lock:
+            count = len(self._lengths)
+            if not count:
+                return []
+            allowed = set(document_ids) if document_ids else None
+            average_length = self._total_length / count
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    if allowed is not None and self._documents[chunk_id] not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(chunk_id, self._documents[chunk_id], score) for chunk_id, score in best]
+
+
+# Shared by every LexicalSearchService in the process so ingest and chat see the same index
+_bm25_index = BM25Index()
+
+
+class LexicalSearchService:
+    """Ranked keyword retrieval over document chunks.
+
+    On PostgreSQL this uses full-text search backed by the GIN index on
+    `to_tsvector('english', chunk_text)`; other databases use the in-process
+    BM25 index. Results have the same shape as VectorStoreService.query.
+    """
+
+    def __init__(self, bm25_index: BM25Index = _bm25_index):
+        self.bm25 = bm25_index
+
+    @staticmethod
+    def _uses_postgres(db: Session) -> bool:
+        return db.get_bind().dialect.name == "postgresql"
+
+    def search(self, db: Session, query: str, top_k: int = 5, document_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Return the `top_k` chunks that best match the query terms."""
+        if not query.strip():
+            return []
+
+        if self._uses_postgres(db):
+            document_filter = "AND c.document_id = ANY(:document_ids)" if document_ids else ""
+            params = {"query": query, "top_k": top_k}
+            if document_ids:
+                params["document_ids"] = list(document_ids)
+            rows = db.execute(text(POSTGRES_SEARCH_SQL.format(document_filter=document_filter)), params).all()
+            hits = [(row.id, row.document_id, float(row.score), row.chunk_text) for row in rows]
+        else:
+            self.bm25.build(db)
+            ranked = self.bm25.search(query, top_k, document_ids)
+            texts = dict(
+                db.query(models.DocumentChunk.id, models.DocumentChunk.chunk_text)
+                .filter(models.DocumentChunk.id.in_([chunk_id for chunk_id, _, _ in ranked]))
+                .all()
+            ) if ranked else {}
+            hits = [
+                (chunk_id, document_id, score, texts[chunk_id])
+                for chunk_id, document_id, score in ranked if chunk_id in texts
+            ]
+
+        logger.info(f"Retrieved {len(hits)} results from lexical search")
+        return [
+            {
+                "id": f"chunk_{chunk_id}",
+                "score": score,
+                "metadata": {"document_id": document_id, "chunk_id": chunk_id, "text": chunk_text},
+            }
+            for chunk_id, document_id, score, chunk_text in hits
+        ]
+
+    def add_chunks(self, db: Session, document_id: int, chunk_ids: List[int], texts: List[str]) -> None:
+        """Index freshly stored chunks (PostgreSQL maintains its index itself)."""
+        if not self._uses_postgres(db):
+            self.bm25.add(document_id, chunk_ids, texts)
+
+    def remove_chunks(self, db: Session, chunk_ids: List[int]) -> None:
+        """Forget deleted chunks."""
+        if not self._uses_postgres(db):
+            self.bm25.remove(chunk_ids)
+
+    def remove_document(self, db: Session, document_id: int) -> None:
+        """Forget every chunk of a deleted document."""
+        if not self._uses_postgres(db):
+            self.bm25.remove(self.bm25.chunks_of(document_id))
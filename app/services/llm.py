@@ -1,7 +1,8 @@
 
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional
 import os
 import requests
+import httpx
 import logging
 import time
 
@@ -15,10 +16,23 @@ except ImportError:
     COHERE_AVAILABLE = False
     logger.warning("Cohere library not installed. Install with: pip install cohere")
 
+from app.services.answer_cache import ANSWER_CACHE_ENABLED, AnswerKey, SemanticAnswerCache
+from app.services.memory import CHAT_HISTORY_CONTEXT_MESSAGES
+from app.services.model_health import ModelHealthTracker, classify_error
+
 # Cohere API configuration
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 USE_COHERE = os.getenv("USE_COHERE", "false").lower() == "true"
 
+# Current working Cohere chat models (as of Sept 2025); the preferred order until health data says otherwise
+COHERE_CHAT_MODELS = [
+    "command-nightly",          # Fast and working
+    "command-a-03-2025",        # Latest flagship
+    "command-r7b-12-2024",      # Reliable option
+    "c4ai-aya-expanse-8b",      # Open source option
+    "command-r-08-2024",        # Stable release
+]
+
 # HuggingFace fallback configuration
 HF_API_KEY = os.getenv("HF_API_KEY")
 
@@ -29,6 +43,8 @@ class LLMService:
         if USE_COHERE and COHERE_API_KEY and COHERE_AVAILABLE:
             # Initialize Cohere client with current working models
             self.cohere_client = cohere.Client(api_key=COHERE_API_KEY)
+            # Async client for the chat path; the key is already validated by the sync client
+            self.async_cohere_client = cohere.AsyncClient(api_key=COHERE_API_KEY, check_api_key=False)
             self.cohere_headers = {
                 "Authorization": f"Bearer {COHERE_API_KEY}",
                 "Content-Type": "application/json"
@@ -46,16 +62,44 @@ class LLMService:
             self.hf_headers = None
             logger.warning("No API keys available, using fallback responses only")
 
-    def build_prompt(self, query: str, context: str, history: List[Dict[str, str]]) -> str:
-        """Combine query, context, and history into a single prompt."""
-        # Keep history short for better results
-        recent_history = history[-3:] if len(history) > 3 else history
+        # Shared async HTTP client for HuggingFace, created lazily inside the event loop
+        self._async_http: Optional[httpx.AsyncClient] = None
+
+        # Circuit breakers and rolling stats that order and skip the Cohere models
+        self.model_health = ModelHealthTracker()
+
+        # Answers generated by a provider, reused for near-identical questions over the same chunks
+        self.answer_cache: Optional[SemanticAnswerCache] = SemanticAnswerCache() if ANSWER_CACHE_ENABLED else None
+
+    def _get_async_http(self) -> httpx.AsyncClient:
+        """Return the shared async HTTP client, creating it on first use."""
+        if self._async_http is None or self._async_http.is_closed:
+            self._async_http = httpx.AsyncClient(timeout=20)
+        return self._async_http
+
+    async def aclose(self) -> None:
+        """Close the async Cohere and HTTP clients."""
+        if self.use_cohere:
+            await self.async_cohere_client.close()
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    def build_prompt(self, query: str, context: str, history: List[Dict[str, str]], summary: str = "") -> str:
+        """Combine query, context, and history into a single prompt.
+
+        `context` is used as given; size it with ContextPacker beforehand.
+        `summary` is the rolling summary of turns older than `history`.
+        """
+        # Older turns are covered by the summary
+        recent_history = history[-CHAT_HISTORY_CONTEXT_MESSAGES:] if CHAT_HISTORY_CONTEXT_MESSAGES > 0 else []
         history_text = "\n".join([f"{h['role']}: {h['message']}" for h in recent_history])
+        summary_text = f"\nEarlier in this conversation:\n{summary}\n" if summary else ""
         
         prompt = f"""You are a helpful assistant. Use the provided context to answer the question accurately.
 
-Context: {context[:1500]}
-
+Context: {context}
+{summary_text}
 Chat History:
 {history_text}
 
@@ -63,35 +107,136 @@ Question: {query}
 Answer:"""
         return prompt
 
-    def call_llm(self, prompt: str) -> str:
-        """Call LLM API with Cohere priority and HuggingFace fallback."""
+    def _cached_answer(self, answer_key: Optional[AnswerKey]) -> Optional[str]:
+        if answer_key is None or self.answer_cache is None:
+            return None
+        answer = self.answer_cache.get(answer_key)
+        if answer is not None:
+            logger.info("Answered from the semantic answer cache")
+        return answer
+
+    def _remember(self, answer_key: Optional[AnswerKey], answer: str) -> None:
+        # Only provider answers are cached; the built-in fallbacks must not outlive an outage
+        if answer_key is not None and self.answer_cache is not None:
+            self.answer_cache.put(answer_key, answer)
+
+    def call_llm(self, prompt: str, answer_key: Optional[AnswerKey] = None) -> str:
+        """Call LLM API with Cohere priority and HuggingFace fallback.
+
+        With an `answer_key`, a cached answer to a near-identical question over
+        the same chunks is returned without calling any provider.
+        """
+        cached = self._cached_answer(answer_key)
+        if cached is not None:
+            return cached
+
         if self.use_cohere:
             response = self._call_cohere_api(prompt)
             if response:
+                self._remember(answer_key, response)
                 return response
         
         # Try HuggingFace fallback
         if HF_API_KEY and self.hf_headers:
             response = self._call_huggingface_api(prompt)
             if response:
+                self._remember(answer_key, response)
                 return response
         
         # Use enhanced fallback
         return self._enhanced_fallback_response(prompt)
 
+    async def call_llm_async(self, prompt: str, answer_key: Optional[AnswerKey] = None) -> str:
+        """Async variant of `call_llm` that never blocks the event loop."""
+        cached = self._cached_answer(answer_key)
+        if cached is not None:
+            return cached
+
+        response = await self.complete_async(prompt)
+        if response:
+            self._remember(answer_key, response)
+            return response
+
+        return self._enhanced_fallback_response(prompt)
+
+    async def complete_async(self, prompt: str) -> Optional[str]:
+        """Ask the providers only (Cohere, then HuggingFace); None when none of them answered."""
+        if self.use_cohere:
+            response = await self._call_cohere_api_async(prompt)
+            if response:
+                return response
+
+        if HF_API_KEY and self.hf_headers:
+            response = await self._call_huggingface_api_async(prompt)
+            if response:
+                return response
+
+        return None
+
+    async def stream_llm(self, prompt: str, answer_key: Optional[AnswerKey] = None) -> AsyncIterator[str]:
+        """Yield the answer in pieces as the provider generates it.
+
+        Cohere is streamed token by token. Models are only switched while
+        nothing has been yielded yet; a stream that breaks part-way ends the
+        answer there. The HuggingFace and built-in fallbacks, like cached
+        answers, are not streamed and arrive as a single piece.
+        """
+        cached = self._cached_answer(answer_key)
+        if cached is not None:
+            yield cached
+            return
+
+        if self.use_cohere:
+            for model_name in self.model_health.ordered(COHERE_CHAT_MODELS):
+                if not self.model_health.acquire(model_name):
+                    continue
+                pieces: List[str] = []
+                start = time.perf_counter()
+                try:
+                    async for text in self._cohere_chat_stream(prompt, model_name):
+                        pieces.append(text)
+                        yield text
+                except Exception as e:
+                    self.model_health.record_failure(model_name, e)
+                    if pieces:
+                        logger.error(f"Cohere {model_name} stream broke off: {e}")
+                        return
+                    logger.warning(f"Error with Cohere {model_name} ({classify_error(e)}): {e}")
+                    continue
+                self.model_health.record_success(model_name, time.perf_counter() - start)
+                if pieces:
+                    logger.info(f"Successfully streamed response using Cohere {model_name}")
+                    self._remember(answer_key, "".join(pieces).strip())
+                    return
+
+        if HF_API_KEY and self.hf_headers:
+            response = await self._call_huggingface_api_async(prompt)
+            if response:
+                self._remember(answer_key, response)
+                yield response
+                return
+
+        yield self._enhanced_fallback_response(prompt)
+
+    async def _cohere_chat_stream(self, prompt: str, model: str) -> AsyncIterator[str]:
+        """Stream text from Cohere's Chat API using the official async client."""
+        stream = await self.async_cohere_client.chat(
+            message=prompt,
+            model=model,
+            temperature=0.7,
+            max_tokens=300,
+            stream=True
+        )
+        async for event in stream:
+            if event.event_type == "text-generation" and event.text:
+                yield event.text
+
     def _call_cohere_api(self, prompt: str) -> str:
         """Call Cohere API with current available models."""
         try:
-            # Current working models (as of Sept 2025)
-            models_to_try = [
-                "command-nightly",          # Fast and working
-                "command-a-03-2025",        # Latest flagship
-                "command-r7b-12-2024",      # Reliable option
-                "c4ai-aya-expanse-8b",      # Open source option
-                "command-r-08-2024",        # Stable release
-            ]
-            
-            for model_name in models_to_try:
+            for model_name in self.model_health.ordered(COHERE_CHAT_MODELS):
+                if not self.model_health.acquire(model_name):
+                    continue
                 try:
                     response = self._cohere_chat_api(prompt, model_name)
                     if response and len(response.strip()) > 10:
@@ -110,6 +255,7 @@ Answer:"""
 
     def _cohere_chat_api(self, prompt: str, model: str) -> str:
         """Call Cohere's Chat API using the official client."""
+        start = time.perf_counter()
         try:
             response = self.cohere_client.chat(
                 message=prompt,
@@ -117,18 +263,56 @@ Answer:"""
                 temperature=0.7,
                 max_tokens=300
             )
+            self.model_health.record_success(model, time.perf_counter() - start)
             
             return response.text.strip() if response.text else None
             
         except Exception as e:
-            # Check if it's a rate limit error
-            if "rate limit" in str(e).lower() or "429" in str(e):
-                logger.warning(f"Cohere rate limit hit with {model}")
-                time.sleep(2)
-                return None
-            else:
-                logger.warning(f"Error with Cohere {model}: {e}")
-                return None
+            # Rate-limited or removed models are benched by the health tracker instead of retried after a sleep
+            self.model_health.record_failure(model, e)
+            logger.warning(f"Error with Cohere {model} ({classify_error(e)}): {e}")
+            return None
+
+    async def _call_cohere_api_async(self, prompt: str) -> Optional[str]:
+        """Walk the Cohere model list using the async client."""
+        try:
+            for model_name in self.model_health.ordered(COHERE_CHAT_MODELS):
+                if not self.model_health.acquire(model_name):
+                    continue
+                try:
+                    response = await self._cohere_chat_api_async(prompt, model_name)
+                    if response and len(response.strip()) > 10:
+                        logger.info(f"Successfully generated response using Cohere {model_name}")
+                        return response.strip()
+
+                except Exception as model_error:
+                    logger.warning(f"Error with Cohere {model_name}: {model_error}")
+                    continue
+
+            return None
+
+        except Exception as e:
+            logger.error(f"Error calling Cohere API: {e}")
+            return None
+
+    async def _cohere_chat_api_async(self, prompt: str, model: str) -> Optional[str]:
+        """Call Cohere's Chat API using the official async client."""
+        start = time.perf_counter()
+        try:
+            response = await self.async_cohere_client.chat(
+                message=prompt,
+                model=model,
+                temperature=0.7,
+                max_tokens=300
+            )
+            self.model_health.record_success(model, time.perf_counter() - start)
+
+            return response.text.strip() if response.text else None
+
+        except Exception as e:
+            self.model_health.record_failure(model, e)
+            logger.warning(f"Error with Cohere {model} ({classify_error(e)}): {e}")
+            return None
 
     def _cohere_generate_api(self, prompt: str, model: str) -> str:
         """Generate API was removed September 15, 2025. Use chat API instead."""
@@ -177,6 +361,44 @@ Answer:"""
             logger.error(f"Error calling HuggingFace API: {e}")
             return None
 
+    async def _call_huggingface_api_async(self, prompt: str) -> Optional[str]:
+        """Call HuggingFace API as fallback using the async HTTP client."""
+        if not self.hf_headers:
+            return None
+
+        try:
+            models_to_try = [
+                "microsoft/DialoGPT-medium",
+                "facebook/blenderbot-400M-distill",
+                "google/flan-t5-base"
+            ]
+            client = self._get_async_http()
+
+            for model_name in models_to_try:
+                try:
+                    model_url = f"https://api-inference.huggingface.co/models/{model_name}"
+                    payload = {"inputs": prompt[-500:]}
+
+                    response = await client.post(model_url, headers=self.hf_headers, json=payload)
+
+                    if response.status_code == 200:
+                        result = response.json()
+                        if isinstance(result, list) and len(result) > 0:
+                            generated_text = result[0].get("generated_text", "")
+                            if len(generated_text.strip()) > 10:
+                                logger.info(f"Successfully generated response using HuggingFace {model_name}")
+                                return generated_text.replace(prompt[-500:], "").strip()
+
+                except Exception as model_error:
+                    logger.warning(f"Error with HuggingFace {model_name}: {model_error}")
+                    continue
+
+            return None
+
+        except Exception as e:
+            logger.error(f"Error calling HuggingFace API: {e}")
+            return None
+
     def _fallback_response(self, prompt: str) -> str:
         """Generate a basic fallback response by extracting context."""
         try:
@@ -0,0 +1,311 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: fall back to in-process locking only
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join("data", "local_index"))
+
+# Rewrite the files once more than this fraction of rows are deleted or superseded
+COMPACT_DEAD_RATIO = 0.5
+
+
+class LocalVectorIndex:
+    """Embedded brute-force cosine index over a memory-mapped float32 matrix.
+
+    Layout on disk (all under `path`):
+      index.json              {"dim": ..., "generation": ...}
+      vectors.<gen>.f32       normalized vectors, one row per point, append-only
+      log.<gen>.jsonl         one line per write: {"op": "add", "id", "row", "payload"} or {"op": "del", "id"}
+
+    Rows are only ever appended, so other processes pick up new writes by
+    replaying the log from their last offset. Each add names the row holding
+    its vector, and the log is written after the vectors, so only logged rows
+    are ever read. A write cut off part-way leaves unlogged rows or a torn last
+    log line behind; readers skip both and the next writer truncates them
+    before appending. Deletes are tombstones until the dead rows pass
+    COMPACT_DEAD_RATIO, at which point the live rows are copied into a new
+    generation and `index.json` is swapped atomically.
+    """
+
+    def __init__(self, path: str = LOCAL_INDEX_DIR):
+        self.path = path
+        self._lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self._reset_state()
+        os.makedirs(self.path, exist_ok=True)
+        self._refresh()
+
+    def _reset_state(self) -> None:
+        self._log_offset = 0
+        self._rows = 0
+        self._matrix: Optional[np.memmap] = None
+        self._row_of: Dict[Any, int] = {}
+        self._ids: List[Any] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._document_ids = np.zeros(0, dtype=np.int64)
+        self._uploaded_at = np.zeros(0, dtype=np.float64)
+
+    # -- files -----------------------------------------------------------------
+
+    def _file(self, name: str, generation: Optional[int] = None) -> str:
+        stem, ext = name.split(".")
+        return os.path.join(self.path, f"{stem}.{self.generation if generation is None else generation}.{ext}")
+
+    def _header_path(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    @contextmanager
+    def _file_lock(self):
+        """Cross-process lock for writers (in-process only where fcntl is unavailable)."""
+        with open(os.path.join(self.path, ".lock"), "a") as handle:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_header(self) -> Dict[str, Any]:
+        try:
+            with open(self._header_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_header(self) -> None:
+        tmp = self._header_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "generation": self.generation}, f)
+        os.replace(tmp, self._header_path())
+
+    def _refresh(self) -> None:
+        """Replay log lines written since the last refresh (by this or another process)."""
+        header = self._read_header()
+        if header.get("generation", 0) != self.generation or header.get("dim") != self.dim:
+            self.dim = header.get("dim")
+            self.generation = header.get("generation", 0)
+            self._reset_state()
+
+        log_path = self._file("log.jsonl")
+        if not os.path.exists(log_path) or os.path.getsize(log_path) == self._log_offset:
+            return
+
+        with open(log_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a writer is mid-line (or died there); see _repair
+                self._log_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping a corrupt line in {log_path}")
+                    continue
+                self._apply(entry)
+
+        if self._rows:
+            self._matrix = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+
+    def _apply(self, entry: Dict[str, Any]) -> None:
+        point_id = entry["id"]
+        previous = self._row_of.pop(point_id, None)
+        if previous is not None:
+            self._alive[previous] = False
+            self._payloads[previous] = None
+        if entry["op"] != "add":
+            return
+
+        # Entries written before rows were logged explicitly took the next row in order
+        row = entry.get("row", self._rows)
+        if row >= self._rows:
+            # Rows skipped over were never logged: nothing points at them
+            self._ids.extend([None] * (row + 1 - self._rows))
+            self._payloads.extend([None] * (row + 1 - self._rows))
+            self._rows = row + 1
+        if row >= len(self._alive):
+            grow = max(1024, len(self._alive), row + 1 - len(self._alive))
+            self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+            self._document_ids = np.concatenate([self._document_ids, np.full(grow, -1, dtype=np.int64)])
+            self._uploaded_at = np.concatenate([self._uploaded_at, np.zeros(grow, dtype=np.float64)])
+        payload = entry.get("payload") or {}
+        self._row_of[point_id] = row
+        self._ids[row] = point_id
+        self._payloads[row] = payload
+        self._alive[row] = True
+        self._document_ids[row] = payload.get("document_id", -1)
+        self._uploaded_at[row] = payload.get("uploaded_at", 0.0)
+
+    def _repair(self) -> None:
+        """Cut what an interrupted write left behind: a torn last log line and unlogged vector rows.
+
+        Called by writers with the file lock held (after `_refresh`), so no
+        write is in progress and everything past the replayed state is debris.
+        """
+        log_path = self._file("log.jsonl")
+        if os.path.exists(log_path) and os.path.getsize(log_path) > self._log_offset:
+            logger.warning(f"Truncating a torn line at the end of {log_path}")
+            os.truncate(log_path, self._log_offset)
+        vectors_path = self._file("vectors.f32")
+        if self.dim and os.path.exists(vectors_path):
+            logged_size = self._rows * self.dim * np.dtype(np.float32).itemsize
+            if os.path.getsize(vectors_path) > logged_size:
+                logger.warning(f"Truncating unlogged rows at the end of {vectors_path}")
+                os.truncate(vectors_path, logged_size)
+
+    def _append(self, vectors: Optional[np.ndarray], entries: List[Dict[str, Any]]) -> None:
+        """Append vectors, then the log lines naming their rows; a write only counts once it is logged."""
+        with self._file_lock():
+            self._refresh()
+            self._repair()
+            if vectors is not None and len(vectors):
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                    self._write_header()
+                elif vectors.shape[1] != self.dim:
+                    logger.warning(f"Local index holds {self.dim}-d vectors, skipping {vectors.shape[1]}-d upsert")
+                    return
+                with open(self._file("vectors.f32"), "ab") as f:
+                    f.write(vectors.tobytes())
+                entries = [{**entry, "row": self._rows + i} for i, entry in enumerate(entries)]
+            with open(self._file("log.jsonl"), "a") as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self._refresh()
+            self._maybe_compact()
+
+    # -- writes ----------------------------------------------------------------
+
+    def upsert(self, ids: List[Any], vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        """Insert or replace points."""
+        if not ids:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._append(matrix, [{"op": "add", "id": i, "payload": p} for i, p in zip(ids, payloads)])
+
+    def delete_where(self, document_id: Optional[int] = None, chunk_ids: Optional[Iterable[int]] = None) -> None:
+        """Delete points of a document and/or with the given chunk IDs."""
+        chunk_ids = set(chunk_ids or [])
+        with self._lock:
+            self._refresh()
+            doomed = [
+                point_id for point_id, row in self._row_of.items()
+                if (document_id is not None and self._payloads[row].get("document_id") == document_id)
+                or self._payloads[row].get("chunk_id") in chunk_ids
+            ]
+            if doomed:
+                self._append(None, [{"op": "del", "id": point_id} for point_id in doomed])
+
+    def set_payload(self, document_id: int, payload: Dict[str, Any]) -> None:
+        """Overwrite payload fields on every point of a document (re-logs the rows)."""
+        with self._lock:
+            self._refresh()
+            rows = [row for row in self._row_of.values() if self._payloads[row].get("document_id") == document_id]
+            if rows:
+                vectors = np.asarray(self._matrix[rows])
+                entries = [
+                    {"op": "add", "id": self._ids[row], "payload": {**self._payloads[row], **payload}}
+                    for row in rows
+                ]
+                self._append(vectors, entries)
+
+    def _maybe_compact(self) -> None:
+        """Copy live rows into a new generation once too many rows are dead (caller holds both locks)."""
+        live = len(self._row_of)
+        if self._rows < 1024 or (self._rows - live) / self._rows < COMPACT_DEAD_RATIO:
+            return
+
+        rows = sorted(self._row_of.values())
+        new_generation = self.generation + 1
+        with open(self._file("vectors.f32", new_generation), "wb") as f:
+            for start in range(0, len(rows), 4096):
+                f.write(np.asarray(self._matrix[rows[start:start + 4096]]).tobytes())
+        with open(self._file("log.jsonl", new_generation), "w") as f:
+            for new_row, row in enumerate(rows):
+                f.write(json.dumps({"op": "add", "id": self._ids[row], "row": new_row, "payload": self._payloads[row]}) + "\n")
+
+        old_generation = self.generation
+        self.generation = new_generation
+        self._write_header()
+        self._reset_state()
+        self._refresh()
+        for name in ("vectors.f32", "log.jsonl"):
+            try:
+                os.remove(self._file(name, old_generation))
+            except OSError:
+                pass
+        logger.info(f"Compacted local vector index to {live} rows")
+
+    # -- reads -----------------------------------------------------------------
+
+    def _mask(self, search_filter) -> np.ndarray:
+        mask = self._alive[:self._rows].copy()
+        if search_filter is None:
+            return mask
+        if search_filter.document_ids:
+            mask &= np.isin(self._document_ids[:self._rows], list(search_filter.document_ids))
+        if search_filter.uploaded_after:
+            mask &= self._uploaded_at[:self._rows] >= search_filter.uploaded_after.timestamp()
+        if search_filter.uploaded_before:
+            mask &= self._uploaded_at[:self._rows] <= search_filter.uploaded_before.timestamp()
+        if search_filter.filetype:
+            for row in np.flatnonzero(mask):
+                if self._payloads[row].get("filetype") != search_filter.filetype:
+                    mask[row] = False
+        return mask
+
+    def search(self, embedding: List[float], top_k: int = 5, search_filter=None) -> List[Dict[str, Any]]:
+        """Return the `top_k` most similar live points, in the same shape as VectorStoreService.query."""
+        with self._lock:
+            self._refresh()
+            if not self._rows or len(embedding) != self.dim:
+                return []
+
+            query = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+
+            rows = np.flatnonzero(self._mask(search_filter))
+            if not len(rows):
+                return []
+            if len(rows) == self._rows:
+                scores = self._matrix @ query
+            else:
+                scores = self._matrix[rows] @ query
+
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [
+                {"id": self._ids[rows[i]], "score": float(scores[i]), "metadata": self._payloads[rows[i]]}
+                for i in best
+            ]
+
+    def chunk_ids(self) -> List[int]:
+        """Chunk IDs of the live points."""
+        with self._lock:
+            self._refresh()
+            return [self._payloads[row].get("chunk_id") for row in self._row_of.values()]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
@@ -1,5 +1,6 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import redis
+import redis.asyncio as aioredis
 import os
 import json
 
@@ -9,23 +10,194 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 
+# Messages kept per session (older ones are trimmed on write)
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", 100))
+# Messages loaded for a prompt
+CHAT_HISTORY_CONTEXT_MESSAGES = int(os.getenv("CHAT_HISTORY_CONTEXT_MESSAGES", 6))
+# Idle seconds before a session's history expires; every new turn restarts the clock
+CHAT_HISTORY_TTL = int(os.getenv("CHAT_HISTORY_TTL", 7 * 24 * 3600))
+# Seconds a compaction may hold a session before another worker can take over
+COMPACTION_LOCK_TTL = 120
+
 class MemoryService:
-    """Handles chat memory using Redis."""
+    """Handles chat memory using Redis.
+
+    Each session is a Redis list under `chat:history:<session_id>` holding one
+    JSON message per item, so a turn is a constant-cost append (RPUSH + LTRIM
+    + EXPIRE in one round trip) and reads fetch only the messages they need.
+    Older turns can be folded into a rolling summary under
+    `chat:summary:<session_id>` (see ConversationSummarizer).
+    """
 
     def __init__(self):
         # Use REDIS_URL if available (Railway), otherwise use host/port (local)
         if REDIS_URL:
             self.redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+            self.async_redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
         else:
             self.redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+            self.async_redis_client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+
+    @staticmethod
+    def history_key(session_id: str) -> str:
+        return f"chat:history:{session_id}"
+
+    @staticmethod
+    def summary_key(session_id: str) -> str:
+        return f"chat:summary:{session_id}"
+
+    @staticmethod
+    def _encode(messages: List[Tuple[str, str]]) -> List[str]:
+        return [json.dumps({"role": role, "message": message}) for role, message in messages]
+
+    @staticmethod
+    def _decode(items: List[str]) -> List[Dict[str, str]]:
+        return [json.loads(item) for item in items]
+
+    def _queue_append(self, pipe, session_id: str, messages: List[Tuple[str, str]]) -> None:
+        key = self.history_key(session_id)
+        pipe.rpush(key, *self._encode(messages))
+        pipe.ltrim(key, -CHAT_HISTORY_MAX_MESSAGES, -1)
+        pipe.expire(key, CHAT_HISTORY_TTL)
+        pipe.expire(self.summary_key(session_id), CHAT_HISTORY_TTL)
 
-    def get_history(self, session_id: str) -> List[Dict[str, str]]:
-        """Return list of previous messages."""
-        data = self.redis_client.get(session_id)
-        return json.loads(data) if data else []
+    def _queue_legacy_migration(self, pipe, session_id: str, legacy: List[Dict[str, str]]) -> None:
+        self._queue_append(pipe, session_id, [(m["role"], m["message"]) for m in legacy])
+        pipe.delete(session_id)
+
+    @staticmethod
+    def _parse_legacy(data: str) -> List[Dict[str, str]]:
+        try:
+            legacy = json.loads(data) if data else []
+        except ValueError:
+            return []
+        return legacy if isinstance(legacy, list) else []
+
+    def get_history(self, session_id: str, limit: int = CHAT_HISTORY_CONTEXT_MESSAGES) -> List[Dict[str, str]]:
+        """Return the last `limit` messages, oldest first."""
+        items = self.redis_client.lrange(self.history_key(session_id), -limit, -1)
+        if items:
+            return self._decode(items)
+        legacy = self._migrate_legacy(session_id)
+        return legacy[-limit:]
+
+    def add_messages(self, session_id: str, messages: List[Tuple[str, str]]) -> None:
+        """Append (role, message) pairs atomically, trim the session and refresh its TTL."""
+        pipe = self.redis_client.pipeline(transaction=True)
+        self._queue_append(pipe, session_id, messages)
+        pipe.execute()
 
     def add_message(self, session_id: str, role: str, message: str) -> None:
         """Add a message to the Redis memory."""
-        history = self.get_history(session_id)
-        history.append({"role": role, "message": message})
-        self.redis_client.set(session_id, json.dumps(history))
+        self.add_messages(session_id, [(role, message)])
+
+    def add_turn(self, session_id: str, query: str, answer: str) -> None:
+        """Store a user question and the assistant's answer as one atomic append."""
+        self.add_messages(session_id, [("user", query), ("assistant", answer)])
+
+    def _migrate_legacy(self, session_id: str) -> List[Dict[str, str]]:
+        """Move history stored by older versions (one JSON string under the bare session ID) into a list."""
+        try:
+            data = self.redis_client.get(session_id)
+        except redis.ResponseError:  # the key holds something other than a string
+            return []
+        legacy = self._parse_legacy(data)
+        if legacy:
+            pipe = self.redis_client.pipeline(transaction=True)
+            self._queue_legacy_migration(pipe, session_id, legacy)
+            pipe.execute()
+        return legacy
+
+    def get_history_page(self, session_id: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, str]]]:
+        """Return (total, messages) for a page of the history, oldest first."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.llen(self.history_key(session_id))
+        pipe.lrange(self.history_key(session_id), offset, offset + limit - 1)
+        total, items = pipe.execute()
+        return total, self._decode(items)
+
+    async def get_history_async(self, session_id: str, limit: int = CHAT_HISTORY_CONTEXT_MESSAGES) -> List[Dict[str, str]]:
+        """Async variant of `get_history`."""
+        items = await self.async_redis_client.lrange(self.history_key(session_id), -limit, -1)
+        if items:
+            return self._decode(items)
+        legacy = await self._migrate_legacy_async(session_id)
+        return legacy[-limit:]
+
+    async def add_messages_async(self, session_id: str, messages: List[Tuple[str, str]]) -> None:
+        """Async variant of `add_messages`."""
+        pipe = self.async_redis_client.pipeline(transaction=True)
+        self._queue_append(pipe, session_id, messages)
+        await pipe.execute()
+
+    async def add_message_async(self, session_id: str, role: str, message: str) -> None:
+        """Add a message to the Redis memory using the async Redis client."""
+        await self.add_messages_async(session_id, [(role, message)])
+
+    async def add_turn_async(self, session_id: str, query: str, answer: str) -> None:
+        """Store a user question and the assistant's answer as one atomic append."""
+        await self.add_messages_async(session_id, [("user", query), ("assistant", answer)])
+
+    async def _migrate_legacy_async(self, session_id: str) -> List[Dict[str, str]]:
+        try:
+            data = await self.async_redis_client.get(session_id)
+        except redis.ResponseError:
+            return []
+        legacy = self._parse_legacy(data)
+        if legacy:
+            pipe = self.async_redis_client.pipeline(transaction=True)
+            self._queue_legacy_migration(pipe, session_id, legacy)
+            await pipe.execute()
+        return legacy
+
+    async def get_history_page_async(self, session_id: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, str]]]:
+        """Async variant of `get_history_page`."""
+        pipe = self.async_redis_client.pipeline(transaction=False)
+        pipe.llen(self.history_key(session_id))
+        pipe.lrange(self.history_key(session_id), offset, offset + limit - 1)
+        total, items = await pipe.execute()
+        return total, self._decode(items)
+
+    def get_summary(self, session_id: str) -> str:
+        """Return the rolling summary of the session's compacted turns ("" if none)."""
+        return self.redis_client.get(self.summary_key(session_id)) or ""
+
+    async def get_summary_async(self, session_id: str) -> str:
+        """Async variant of `get_summary`."""
+        return await self.async_redis_client.get(self.summary_key(session_id)) or ""
+
+    async def count_messages_async(self, session_id: str) -> int:
+        """Return how many raw messages the session holds."""
+        return await self.async_redis_client.llen(self.history_key(session_id))
+
+    async def get_compactable_async(self, session_id: str, keep: int) -> Tuple[str, List[Dict[str, str]]]:
+        """Return the current summary and every message except the newest `keep`."""
+        pipe = self.async_redis_client.pipeline(transaction=False)
+        pipe.get(self.summary_key(session_id))
+        pipe.lrange(self.history_key(session_id), 0, -keep - 1)
+        summary, items = await pipe.execute()
+        return summary or "", self._decode(items)
+
+    async def fold_into_summary_async(self, session_id: str, count: int, summary: str) -> None:
+        """Atomically store the new summary and drop the `count` oldest messages it covers.
+
+        Trimming by count from the head keeps any message appended after the
+        compactable messages were read.
+        """
+        pipe = self.async_redis_client.pipeline(transaction=True)
+        pipe.set(self.summary_key(session_id), summary, ex=CHAT_HISTORY_TTL)
+        pipe.ltrim(self.history_key(session_id), count, -1)
+        await pipe.execute()
+
+    async def acquire_compaction_lock_async(self, session_id: str) -> bool:
+        """Claim the session for compaction so concurrent turns do not summarize the same messages."""
+        return bool(await self.async_redis_client.set(
+            f"chat:compacting:{session_id}", "1", nx=True, ex=COMPACTION_LOCK_TTL
+        ))
+
+    async def release_compaction_lock_async(self, session_id: str) -> None:
+        await self.async_redis_client.delete(f"chat:compacting:{session_id}")
+
+    async def aclose(self) -> None:
+        """Close the async Redis connection pool."""
+        await self.async_redis_client.close()
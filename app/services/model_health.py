@@ -0,0 +1,181 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Consecutive ordinary failures before a model's circuit opens
+MODEL_FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", 3))
+# Seconds an opened circuit stays open; doubles after every failed probe, up to the max
+MODEL_COOLDOWN = float(os.getenv("MODEL_COOLDOWN", 30))
+MODEL_MAX_COOLDOWN = float(os.getenv("MODEL_MAX_COOLDOWN", 600))
+# Cooldown for models the provider reports as unknown, removed or deprecated
+MODEL_GONE_COOLDOWN = float(os.getenv("MODEL_GONE_COOLDOWN", 3600))
+# Weight of the newest observation in the rolling latency / error averages
+HEALTH_EWMA_ALPHA = 0.2
+# Latency assumed for a model that has not answered yet, so untried models keep their configured order
+DEFAULT_LATENCY = 2.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class ModelHealth:
+    """Circuit-breaker state and rolling statistics for one model."""
+
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    cooldown: float = MODEL_COOLDOWN
+    open_until: float = 0.0
+    probing: bool = False
+    probe_started: float = 0.0
+    latency: Optional[float] = None
+    error_rate: float = 0.0
+    successes: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+
+
+def classify_error(error: Exception) -> str:
+    """Sort a provider error into "rate_limited", "gone" or "error"."""
+    status = getattr(error, "http_status", None)
+    message = str(error).lower()
+    if status == 429 or "rate limit" in message or "429" in message:
+        return "rate_limited"
+    if status in (404, 410) or any(word in message for word in ("not found", "deprecated", "removed")):
+        return "gone"
+    return "error"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the error, if the provider sent one."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelHealthTracker:
+    """Per-model circuit breakers that decide which models to try, and in which order.
+
+    A model's circuit opens after MODEL_FAILURE_THRESHOLD consecutive errors,
+    immediately on a rate limit (for Retry-After or the base cooldown), and
+    for MODEL_GONE_COOLDOWN when the provider says the model does not exist.
+    While open, the model is skipped without a request. Once the cooldown
+    expires one request is let through as a probe (half-open): success
+    closes the circuit, failure reopens it with a doubled cooldown.
+
+    Available models are ordered by expected cost, the rolling latency divided
+    by the rolling success rate, so slow or flaky models drift to the back.
+    """
+
+    def __init__(self, failure_threshold: int = MODEL_FAILURE_THRESHOLD, cooldown: float = MODEL_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self._models: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def _health(self, model: str) -> ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = ModelHealth(cooldown=self.base_cooldown)
+        return health
+
+    def _expected_cost(self, health: ModelHealth) -> float:
+        latency = health.latency if health.latency is not None else DEFAULT_LATENCY
+        return latency / max(1.0 - health.error_rate, 0.05)
+
+    def ordered(self, models: List[str]) -> List[str]:
+        """Return the models worth trying now, cheapest first (ties keep the given order)."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                model for model in models
+                if not (self._health(model).state == OPEN and now < self._health(model).open_until)
+            ]
+            return sorted(candidates, key=lambda model: self._expected_cost(self._health(model)))
+
+    def acquire(self, model: str) -> bool:
+        """Check a model may be called right now; claims the single probe of an expired open circuit."""
+        now = time.monotonic()
+        with self._lock:
+            health = self._health(model)
+            if health.state == CLOSED:
+                return True
+            if health.state == OPEN and now >= health.open_until:
+                health.state = HALF_OPEN
+                health.probing = False
+            # A probe that never reported back (e.g. the client went away) is given up after one cooldown
+            if health.state == HALF_OPEN and (not health.probing or now - health.probe_started > health.cooldown):
+                health.probing = True
+                health.probe_started = now
+                return True
+            return False
+
+    def record_success(self, model: str, latency: float) -> None:
+        """Record a successful call and close the model's circuit."""
+        with self._lock:
+            health = self._health(model)
+            if health.state != CLOSED:
+                logger.info(f"Model {model} recovered, closing its circuit")
+            health.state = CLOSED
+            health.probing = False
+            health.consecutive_failures = 0
+            health.cooldown = self.base_cooldown
+            health.successes += 1
+            health.latency = latency if health.latency is None else (
+                HEALTH_EWMA_ALPHA * latency + (1 - HEALTH_EWMA_ALPHA) * health.latency
+            )
+            health.error_rate *= 1 - HEALTH_EWMA_ALPHA
+
+    def record_failure(self, model: str, error: Exception) -> None:
+        """Record a failed call, opening the circuit when the error warrants it."""
+        kind = classify_error(error)
+        now = time.monotonic()
+        with self._lock:
+            health = self._health(model)
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.error_rate = HEALTH_EWMA_ALPHA + (1 - HEALTH_EWMA_ALPHA) * health.error_rate
+            health.last_error = f"{kind}: {str(error)[:200]}"
+
+            if kind == "gone":
+                cooldown = MODEL_GONE_COOLDOWN
+            elif kind == "rate_limited":
+                cooldown = retry_after(error) or health.cooldown
+            elif health.state == HALF_OPEN:
+                # The probe failed: back off harder before the next one
+                health.cooldown = min(health.cooldown * 2, MODEL_MAX_COOLDOWN)
+                cooldown = health.cooldown
+            elif health.consecutive_failures >= self.failure_threshold:
+                cooldown = health.cooldown
+            else:
+                return
+
+            health.state = OPEN
+            health.probing = False
+            health.open_until = now + cooldown
+            logger.warning(f"Opened circuit for model {model} for {cooldown:.0f}s after {kind}")
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Return each model's state and rolling statistics."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    "state": health.state,
+                    "retry_in": max(0.0, health.open_until - now) if health.state == OPEN else 0.0,
+                    "latency": health.latency,
+                    "error_rate": health.error_rate,
+                    "successes": health.successes,
+                    "failures": health.failures,
+                    "last_error": health.last_error,
+                }
+                for model, health in self._models.items()
+            }
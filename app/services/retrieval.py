@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from app.db.session import SessionLocal
+from app.services.collections import LiveServices
+from app.services.embeddings import EmbeddingService
+from app.services.lexical import LexicalSearchService
+from app.services.vectorstore import SearchFilter, VectorStoreService
+
+logger = logging.getLogger(__name__)
+
+# Candidates pulled from each source before fusion
+HYBRID_VECTOR_K = int(os.getenv("HYBRID_VECTOR_K", 10))
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", 10))
+# Reciprocal-rank fusion constant; larger values flatten the gap between ranks
+RRF_K = int(os.getenv("RRF_K", 60))
+# Seconds each source gets before its results are dropped from the fusion
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", 4.0))
+
+
+def chunk_key(result: Dict[str, Any]) -> Any:
+    """Identity of the chunk behind a result, the same whichever source returned it."""
+    return (result.get("metadata") or {}).get("chunk_id", result["id"])
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Fuse ranked result lists by summing 1 / (k + rank) per chunk.
+
+    Results from different sources are matched on their chunk ID. Each fused
+    result keeps the metadata of its best-ranked occurrence, its `score` becomes
+    the fused score and `ranks` records its 1-based rank in every source.
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for source, results in rankings.items():
+        for rank, result in enumerate(results, start=1):
+            metadata = result.get("metadata") or {}
+            key = chunk_key(result)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {"id": result["id"], "score": 0.0, "metadata": metadata, "ranks": {}}
+            entry["score"] += 1.0 / (k + rank)
+            entry["ranks"][source] = rank
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+
+
+class QueryEmbedding:
+    """A query embedding in flight, paired with the vector store of the model computing it.
+
+    Awaiting it yields the embedding. Searches with it go to `vectorstore`
+    even if another collection has gone live in the meantime.
+    """
+
+    def __init__(self, future: "asyncio.Future[List[float]]", vectorstore: VectorStoreService):
+        self.future = future
+        self.vectorstore = vectorstore
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class HybridRetriever:
+    """Runs vector and lexical retrieval concurrently and fuses them with RRF.
+
+    Each source has its own deadline. A source that fails or misses it is left
+    out and the other source's ranking is used alone, so a slow leg never adds
+    to the request latency beyond the budget.
+    """
+
+    def __init__(
+        self,
+        services: LiveServices,
+        lexical: Optional[LexicalSearchService] = None,
+        vector_k: int = HYBRID_VECTOR_K,
+        lexical_k: int = HYBRID_LEXICAL_K,
+        timeout: float = RETRIEVAL_TIMEOUT,
+    ):
+        self.services = services
+        self.lexical = lexical or LexicalSearchService()
+        self.vector_k = vector_k
+        self.lexical_k = lexical_k
+        self.timeout = timeout
+
+    def embed_query(self, query: str) -> QueryEmbedding:
+        """Start embedding a query; the result can be passed to `retrieve` and awaited by the caller too."""
+        embedder, vectorstore = self.services.pair
+        return QueryEmbedding(asyncio.ensure_future(self._embed(embedder, query)), vectorstore)
+
+    @staticmethod
+    async def _embed(embedder: EmbeddingService, query: str) -> List[float]:
+        return (await embedder.embed_texts_async([query], input_type="search_query"))[0]
+
+    async def _vector_search(self, query_embedding: QueryEmbedding, document_ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+        # Shielded so a missed deadline does not cancel an embedding the caller may still await
+        embedding = await asyncio.shield(query_embedding.future)
+        search_filter = SearchFilter(document_ids=document_ids) if document_ids else None
+        return await query_embedding.vectorstore.query_async(embedding, top_k=self.vector_k, search_filter=search_filter)
+
+    def _lexical_search(self, query: str, document_ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+        # Own session: the leg may outlive the request if it misses its deadline
+        db = SessionLocal()
+        try:
+            return self.lexical.search(db, query, top_k=self.lexical_k, document_ids=document_ids)
+        finally:
+            db.close()
+
+    async def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        document_ids: Optional[List[int]] = None,
+        query_embedding: Optional[QueryEmbedding] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return the `top_k` fused results, optionally restricted to some documents.
+
+        `query_embedding` (from `embed_query`) reuses an embedding already in flight.
+        """
+        start = time.perf_counter()
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        legs = {
+            "vector": asyncio.ensure_future(self._vector_search(query_embedding, document_ids)),
+            "lexical": asyncio.ensure_future(asyncio.to_thread(self._lexical_search, query, document_ids)),
+        }
+        await asyncio.wait(legs.values(), timeout=self.timeout)
+
+        rankings: Dict[str, List[Dict[str, Any]]] = {}
+        for source, task in legs.items():
+            if not task.done():
+                # The lexical thread cannot be interrupted; it finishes in the background and is ignored
+                task.cancel()
+                logger.warning(f"{source} retrieval missed its {self.timeout}s deadline, using the other source alone")
+            elif task.exception() is not None:
+                logger.warning(f"{source} retrieval failed: {task.exception()}")
+            else:
+                rankings[source] = task.result()
+
+        results = reciprocal_rank_fusion(rankings)[:top_k]
+        logger.info(
+            f"Hybrid retrieval: {', '.join(f'{source}={len(hits)}' for source, hits in rankings.items()) or 'no sources'}"
+            f" -> {len(results)} results in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return results
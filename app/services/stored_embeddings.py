@@ -0,0 +1,51 @@
+from typing import List, Optional, Sequence
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Copy of each chunk's embedding kept in the database: "float16", "int8" or "none"
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float16").lower()
+
+STORE_DTYPES = ("float16", "int8")
+
+
+def encode_embedding(vector: Sequence[float], dtype: str) -> bytes:
+    """Quantize one vector for storage.
+
+    float16 keeps ~3 significant digits at half the size of float32. int8 is
+    symmetric per-vector quantization at a quarter of the size: a float32
+    scale (max |x| / 127) followed by one signed byte per dimension.
+    """
+    array = np.asarray(vector, dtype=np.float32)
+    if dtype == "float16":
+        return array.astype("<f2").tobytes()
+    if dtype == "int8":
+        peak = float(np.abs(array).max()) if array.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(array / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).astype("<f4").tobytes() + quantized.tobytes()
+    raise ValueError(f"Unknown embedding storage dtype: {dtype}")
+
+
+def decode_embedding(blob: bytes, dtype: str) -> np.ndarray:
+    """Turn a stored embedding back into a float32 vector."""
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype="<f2").astype(np.float32)
+    if dtype == "int8":
+        scale = np.frombuffer(blob[:4], dtype="<f4")[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    raise ValueError(f"Unknown embedding storage dtype: {dtype}")
+
+
+def encode_embeddings(vectors: List[List[float]], dtype: Optional[str] = EMBEDDING_STORE_DTYPE) -> List[Optional[bytes]]:
+    """Quantize a batch of vectors, or return Nones when storing embeddings is disabled."""
+    if dtype not in STORE_DTYPES:
+        return [None] * len(vectors)
+    return [encode_embedding(vector, dtype) for vector in vectors]
+
+
+if EMBEDDING_STORE_DTYPE not in STORE_DTYPES + ("none",):
+    logger.warning(f"Unknown EMBEDDING_STORE_DTYPE={EMBEDDING_STORE_DTYPE}, embeddings are not stored in the database")
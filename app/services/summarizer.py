@@ -0,0 +1,107 @@
+from typing import Dict, List
+import logging
+import os
+import re
+
+from app.services.llm import LLMService
+from app.services.memory import MemoryService
+
+logger = logging.getLogger(__name__)
+
+# Raw messages a session may hold before older ones are folded into the summary
+CHAT_SUMMARY_TRIGGER_MESSAGES = int(os.getenv("CHAT_SUMMARY_TRIGGER_MESSAGES", 20))
+# Newest raw messages left untouched by a compaction
+CHAT_SUMMARY_KEEP_MESSAGES = int(os.getenv("CHAT_SUMMARY_KEEP_MESSAGES", 6))
+# Upper bound for the stored summary, so it stays cheap to put in every prompt
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", 1500))
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant about the user's documents.
+Keep names, numbers, dates, places and decisions; leave out greetings and repetition.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+FIRST_SENTENCE = re.compile(r"^(.+?[.!?।])(\s|$)")
+
+
+def extractive_summary(summary: str, messages: List[Dict[str, str]], max_chars: int = CHAT_SUMMARY_MAX_CHARS) -> str:
+    """Summary without an LLM: user questions plus the first sentence of each answer.
+
+    When over `max_chars`, the oldest lines are dropped first.
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        text = " ".join(message["message"].split())
+        if message["role"] == "assistant":
+            match = FIRST_SENTENCE.match(text)
+            text = match.group(1) if match else text
+        lines.append(f"{message['role']}: {text[:200]}")
+
+    while len(lines) > 1 and len("\n".join(lines)) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)[-max_chars:]
+
+
+class ConversationSummarizer:
+    """Folds a session's older turns into a rolling summary stored next to its history.
+
+    Runs after a turn has been answered (as a background task), so it never
+    adds latency to the reply. Once a session holds more than the trigger
+    number of raw messages, everything but the newest few is summarized with
+    the LLM (or extractively when no provider answers) and removed from the
+    list, keeping both the prompt and Redis memory bounded.
+    """
+
+    def __init__(
+        self,
+        memory: MemoryService,
+        llm: LLMService,
+        trigger: int = CHAT_SUMMARY_TRIGGER_MESSAGES,
+        keep: int = CHAT_SUMMARY_KEEP_MESSAGES,
+    ):
+        self.memory = memory
+        self.llm = llm
+        self.trigger = trigger
+        self.keep = keep
+
+    async def compact_async(self, session_id: str) -> bool:
+        """Compact the session if it has grown past the trigger; returns whether it did."""
+        try:
+            if await self.memory.count_messages_async(session_id) <= self.trigger:
+                return False
+            if not await self.memory.acquire_compaction_lock_async(session_id):
+                return False
+        except Exception as e:
+            logger.warning(f"Could not check session {session_id} for compaction: {e}")
+            return False
+
+        try:
+            summary, older = await self.memory.get_compactable_async(session_id, self.keep)
+            if not older:
+                return False
+            new_summary = await self._summarize(summary, older)
+            await self.memory.fold_into_summary_async(session_id, len(older), new_summary)
+            logger.info(f"Folded {len(older)} messages of session {session_id} into its summary")
+            return True
+        except Exception as e:
+            logger.warning(f"Compaction of session {session_id} failed: {e}")
+            return False
+        finally:
+            await self.memory.release_compaction_lock_async(session_id)
+
+    async def _summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=CHAT_SUMMARY_MAX_CHARS // 6,
+            summary=summary or "(none yet)",
+            messages="\n".join(f"{m['role']}: {m['message']}" for m in messages),
+        )
+        response = await self.llm.complete_async(prompt)
+        if response:
+            return response.strip()[:CHAT_SUMMARY_MAX_CHARS]
+        return extractive_summary(summary, messages)
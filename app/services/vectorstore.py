@@ -1,22 +1,117 @@
-from typing import List, Dict, Any
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import PointStruct, VectorParams, Distance
+from typing import Iterator, List, Dict, Any, Optional
+from dataclasses import dataclass
+from datetime import datetime
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.http import models as rest
+from qdrant_client.http.models import PointStruct, VectorParams, Distance, PayloadSchemaType
 from qdrant_client.http.exceptions import UnexpectedResponse, ResponseHandlingException
+import asyncio
+import copy
 import logging
+import os
 import time
+import uuid
+
+from app.services.local_index import LocalVectorIndex, LOCAL_INDEX_DIR
 
 logger = logging.getLogger(__name__)
 
+# "qdrant" (default) or "local" for the embedded index only, e.g. for local development
+VECTOR_STORE = os.getenv("VECTOR_STORE", "qdrant").lower()
+# Mirror every write into the embedded index so search survives a Qdrant outage
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "true").lower() == "true"
+# After a failed connection, serve from the local index for this long before retrying Qdrant
+QDRANT_RETRY_INTERVAL = float(os.getenv("QDRANT_RETRY_INTERVAL", 30))
+# Seconds the chat path waits for Qdrant to answer a connection probe before using the local index
+QDRANT_PROBE_TIMEOUT = float(os.getenv("QDRANT_PROBE_TIMEOUT", 1.0))
+
+# Collection used before collections were versioned per embedding model
+DEFAULT_COLLECTION = "documents"
+
+_local_indexes: Dict[str, LocalVectorIndex] = {}
+
+
+def _shared_local_index(path: str = LOCAL_INDEX_DIR) -> LocalVectorIndex:
+    """One in-memory view per index directory, shared by every service instance in the process."""
+    if path not in _local_indexes:
+        _local_indexes[path] = LocalVectorIndex(path)
+    return _local_indexes[path]
+
+
+def local_index_path(collection_name: str) -> str:
+    """Directory of a collection's embedded index; the original collection keeps LOCAL_INDEX_DIR itself."""
+    if collection_name == DEFAULT_COLLECTION:
+        return LOCAL_INDEX_DIR
+    return os.path.join(LOCAL_INDEX_DIR, collection_name)
+
+# Payload fields used by SearchFilter; indexed so filtered search does not scan the collection
+PAYLOAD_INDEXES = {
+    "document_id": PayloadSchemaType.INTEGER,
+    "chunk_id": PayloadSchemaType.INTEGER,
+    "filetype": PayloadSchemaType.KEYWORD,
+    "uploaded_at": PayloadSchemaType.FLOAT,
+}
+
+# Fixed namespace so every worker derives the same point ID for a chunk
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1f3e-5b7a-4c55-9a43-2f0d8e6b9c21")
+
+
+def point_id_for(document_id: int, chunk_id: int) -> str:
+    """Deterministic Qdrant point ID for a stored chunk."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{document_id}:{chunk_id}"))
+
+
+@dataclass
+class SearchFilter:
+    """Structured filter evaluated inside Qdrant.
+
+    `uploaded_after`/`uploaded_before` match the `uploaded_at` payload field,
+    which ingest stores as a UNIX timestamp.
+    """
+
+    document_ids: Optional[List[int]] = None
+    filetype: Optional[str] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+    def to_qdrant(self) -> Optional[rest.Filter]:
+        """Build the Qdrant filter, or None when no condition is set."""
+        must = []
+        if self.document_ids:
+            must.append(rest.FieldCondition(key="document_id", match=rest.MatchAny(any=list(self.document_ids))))
+        if self.filetype:
+            must.append(rest.FieldCondition(key="filetype", match=rest.MatchValue(value=self.filetype)))
+        if self.uploaded_after or self.uploaded_before:
+            must.append(rest.FieldCondition(key="uploaded_at", range=rest.Range(
+                gte=self.uploaded_after.timestamp() if self.uploaded_after else None,
+                lte=self.uploaded_before.timestamp() if self.uploaded_before else None,
+            )))
+        return rest.Filter(must=must) if must else None
+
+
 class VectorStoreService:
-    """Handles storing and querying embeddings in Qdrant."""
+    """Handles storing and querying embeddings in Qdrant.
 
-    def __init__(self, host: str = "localhost", port: int = 6333, collection_name: str = "documents"):
+    `vector_size` is the dimension of the collection's vectors; the collection
+    is created with it, and queries of another dimension return nothing
+    rather than erroring. Without it a missing collection is not created.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6333, collection_name: str = DEFAULT_COLLECTION, vector_size: Optional[int] = None):
         self.host = host
         self.port = port
         self.collection_name = collection_name
+        self.vector_size = vector_size
         self.client = None
+        self.async_client = None
         self._collection_ensured = False
-        logger.info(f"Initialized VectorStoreService for {host}:{port}")
+        self._unavailable_until = 0.0
+        self.use_qdrant = VECTOR_STORE != "local"
+        self.local_index = _shared_local_index(local_index_path(collection_name)) if (LOCAL_INDEX_ENABLED or not self.use_qdrant) else None
+        if self.use_qdrant:
+            logger.info(f"Initialized VectorStoreService for {host}:{port}")
+        else:
+            logger.info("Initialized VectorStoreService with the local index only")
 
     def _init_client(self) -> None:
         """Initialize Qdrant client with retry logic."""
@@ -37,6 +132,27 @@ class VectorStoreService:
                     logger.error(f"Failed to connect to Qdrant after all retries. Last error: {e}")
                     self.client = None
 
+    async def _init_async_client(self) -> None:
+        """Initialize the async Qdrant client with one short probe.
+
+        This runs on the request path, so there are no retries: a failed probe
+        leaves the client unset and the caller serves from the local index
+        until QDRANT_RETRY_INTERVAL has passed.
+        """
+        client = AsyncQdrantClient(host=self.host, port=self.port)
+        try:
+            await asyncio.wait_for(client.get_collections(), timeout=QDRANT_PROBE_TIMEOUT)
+        except BaseException as e:
+            try:
+                await asyncio.shield(client.close())
+            except Exception:
+                pass
+            if isinstance(e, Exception):
+                logger.warning(f"Could not connect async client to Qdrant at {self.host}:{self.port}: {e!r}")
+            raise
+        self.async_client = client
+        logger.info(f"Successfully connected async client to Qdrant at {self.host}:{self.port}")
+
     def _ensure_collection_exists(self) -> None:
         """Ensure the collection exists, create if not."""
         if not self.client or self._collection_ensured:
@@ -47,29 +163,204 @@ class VectorStoreService:
             collection_names = [col.name for col in collections.collections]
             
             if self.collection_name not in collection_names:
-                # Create collection with appropriate vector size (384 for hash embeddings)
+                if self.vector_size is None:
+                    logger.error(f"Collection {self.collection_name} does not exist and its vector size is unknown")
+                    return
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=384, distance=Distance.COSINE),
+                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE),
                 )
-                logger.info(f"Created collection: {self.collection_name}")
-            
+                logger.info(f"Created collection: {self.collection_name} ({self.vector_size} dimensions)")
+
+            self._ensure_payload_indexes()
             self._collection_ensured = True
         except Exception as e:
             logger.error(f"Error ensuring collection exists: {e}")
 
+    def with_collection(self, collection_name: str, vector_size: int) -> "VectorStoreService":
+        """Copy of this service on another collection, e.g. when a re-embedded one goes live.
+
+        The copy shares the Qdrant clients; this service stays on its collection.
+        """
+        store = copy.copy(self)
+        store.collection_name = collection_name
+        store.vector_size = vector_size
+        store._collection_ensured = False
+        if store.local_index is not None:
+            store.local_index = _shared_local_index(local_index_path(collection_name))
+        return store
+
+    def existing_vector_size(self) -> Optional[int]:
+        """Dimension of the collection as it exists in the store, or None if it does not exist yet."""
+        if not self.use_qdrant:
+            return self.local_index.dim if self.local_index is not None else None
+        if not self._ensure_connected():
+            raise RuntimeError("Qdrant not available")
+        if self.collection_name not in {col.name for col in self.client.get_collections().collections}:
+            return None
+        return self.client.get_collection(self.collection_name).config.params.vectors.size
+
+    def point_alias(self, alias: str) -> bool:
+        """Atomically point `alias` at this collection, replacing whatever it pointed at.
+
+        Nothing is deleted: while a collection still holds the alias's name
+        (see `move_to`), the alias is left unset and False is returned.
+        """
+        if not self.use_qdrant:
+            return False
+        if not self._ensure_connected():
+            raise RuntimeError("Qdrant not available")
+        if alias in {col.name for col in self.client.get_collections().collections}:
+            logger.warning(f"Collection {alias} holds the alias's name, not pointing {alias} at {self.collection_name}")
+            return False
+        operations = []
+        if alias in {a.alias_name for a in self.client.get_aliases().aliases}:
+            operations.append(rest.DeleteAliasOperation(delete_alias=rest.DeleteAlias(alias_name=alias)))
+        operations.append(rest.CreateAliasOperation(
+            create_alias=rest.CreateAlias(collection_name=self.collection_name, alias_name=alias)
+        ))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        logger.info(f"Alias {alias} now points at {self.collection_name}")
+        return True
+
+    def move_to(self, target: "VectorStoreService", batch_size: int = 1000) -> int:
+        """Copy every point, vector and payload, into `target`, then delete this collection.
+
+        The collection is only deleted once `target` holds as many points.
+        Returns the number of points moved.
+        """
+        if not self._ensure_connected() or not target._ensure_connected():
+            raise RuntimeError("Qdrant not available")
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                target.client.upsert(
+                    collection_name=target.collection_name,
+                    points=[PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+                    wait=True,
+                )
+            if offset is None:
+                break
+        moved = self.client.count(self.collection_name, exact=True).count
+        copied = target.client.count(target.collection_name, exact=True).count
+        if copied < moved:
+            raise RuntimeError(f"Only {copied} of {moved} points reached {target.collection_name}, keeping {self.collection_name}")
+        self.client.delete_collection(self.collection_name)
+        logger.info(f"Moved {moved} points from {self.collection_name} to {target.collection_name}")
+        return moved
+
+    def iter_chunk_ids(self, batch_size: int = 1000) -> Iterator[List[int]]:
+        """Yield the chunk IDs of the stored points, a batch at a time."""
+        if self._ensure_connected():
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=["chunk_id"],
+                    with_vectors=False,
+                )
+                chunk_ids = [p.payload["chunk_id"] for p in points if p.payload and "chunk_id" in p.payload]
+                if chunk_ids:
+                    yield chunk_ids
+                if offset is None:
+                    return
+        elif self.local_index is not None:
+            chunk_ids = self.local_index.chunk_ids()
+            for start in range(0, len(chunk_ids), batch_size):
+                yield chunk_ids[start:start + batch_size]
+
+    def recreate_collection(self, vector_size: int) -> None:
+        """Drop the collection and create it empty with `vector_size` dimensions and the payload indexes."""
+        if not self._ensure_connected():
+            raise RuntimeError("Qdrant not available")
+        self.client.recreate_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+        )
+        self.vector_size = vector_size
+        self._ensure_payload_indexes()
+        self._collection_ensured = True
+        logger.info(f"Recreated collection {self.collection_name} with {vector_size} dimensions")
+
+    def _ensure_payload_indexes(self) -> None:
+        """Create payload indexes for the filterable fields; existing indexes are left alone."""
+        info = self.client.get_collection(self.collection_name)
+        existing = set((info.payload_schema or {}).keys())
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema,
+                )
+                logger.info(f"Created payload index on {field_name} for {self.collection_name}")
+
+    def _qdrant_suspended(self) -> bool:
+        """True when Qdrant is disabled or recently failed, so callers go straight to the local index."""
+        return not self.use_qdrant or time.monotonic() < self._unavailable_until
+
+    def _mark_unavailable(self) -> None:
+        self._unavailable_until = time.monotonic() + QDRANT_RETRY_INTERVAL
+
     def _ensure_connected(self) -> bool:
         """Ensure we have a working connection to Qdrant."""
+        if self._qdrant_suspended():
+            return False
         if not self.client:
             self._init_client()
+            if not self.client:
+                self._mark_unavailable()
         
         if self.client and not self._collection_ensured:
             self._ensure_collection_exists()
             
         return self.client is not None
 
+    async def _ensure_async_connected(self) -> bool:
+        """Ensure we have a working async connection to Qdrant.
+
+        Any failure, including the caller's deadline cancelling the probe,
+        suspends Qdrant for QDRANT_RETRY_INTERVAL so the next requests go
+        straight to the local index.
+        """
+        if self._qdrant_suspended():
+            return False
+        try:
+            if not self.async_client:
+                await self._init_async_client()
+
+            if not self._collection_ensured:
+                # The probe just answered, so the sync client needs no connection retries;
+                # collection creation is a one-off admin call, keep it off the event loop
+                if not self.client:
+                    self.client = QdrantClient(host=self.host, port=self.port)
+                await asyncio.to_thread(self._ensure_collection_exists)
+        except asyncio.CancelledError:
+            self._mark_unavailable()
+            raise
+        except Exception:
+            self._mark_unavailable()
+            return False
+        return True
+
+    async def aclose(self) -> None:
+        """Close the async Qdrant client."""
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
     def add_documents(self, embeddings: List[List[float]], metadatas: List[Dict[str, Any]], ids: List[int]) -> None:
         """Add documents to the vector store."""
+        self._local_write("upsert", ids, embeddings, metadatas)
         if not self._ensure_connected():
             logger.warning("Qdrant not available, skipping document addition")
             return
@@ -84,54 +375,165 @@ class VectorStoreService:
         except Exception as e:
             logger.error(f"Error adding documents to vector store: {e}")
 
-    def upsert_embeddings(self, embeddings: List[List[float]], metadatas: List[Dict[str, Any]]) -> None:
-        """Upsert embeddings with auto-generated IDs."""
+    def upsert_embeddings(
+        self, embeddings: List[List[float]], metadatas: List[Dict[str, Any]], wait: bool = True, raise_errors: bool = False
+    ) -> None:
+        """Upsert embeddings with auto-generated IDs.
+
+        With `wait=False` Qdrant acknowledges once the batch is in its write-ahead
+        log; a later upsert with `wait=True` acts as a barrier because updates
+        to a shard are applied in order. With `raise_errors`, a Qdrant failure
+        is raised instead of only logged.
+        """
+        if self.vector_size and embeddings and len(embeddings[0]) != self.vector_size:
+            # Never mix vectors of another model into the collection
+            raise RuntimeError(
+                f"Got {len(embeddings[0])}-d vectors for {self.collection_name}, which holds {self.vector_size}-d vectors"
+            )
+        # UUIDv5 of document and chunk IDs: stable across processes and collision free
+        ids = [
+            point_id_for(meta.get('document_id', 0), meta.get('chunk_id', i))
+            for i, meta in enumerate(metadatas)
+        ]
+        self._local_write("upsert", ids, embeddings, metadatas)
+
         if not self._ensure_connected():
+            if raise_errors and self.use_qdrant:
+                raise RuntimeError("Qdrant not available")
             logger.warning("Qdrant not available, skipping embedding upsert")
             return
             
         try:
-            # Use hash of metadata as unique ID to avoid collisions
-            points = []
-            for i, (emb, meta) in enumerate(zip(embeddings, metadatas)):
-                # Create a unique ID based on document and chunk info
-                doc_id = meta.get('document_id', 0)
-                chunk_id = meta.get('chunk_id', i)
-                point_id = hash(f"{doc_id}_{chunk_id}") % (2**31)  # Ensure positive 32-bit int
-                points.append(PointStruct(id=point_id, vector=emb, payload=meta))
+            points = [PointStruct(id=id_, vector=emb, payload=meta) for id_, emb, meta in zip(ids, embeddings, metadatas)]
             
-            self.client.upsert(collection_name=self.collection_name, points=points)
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
             logger.info(f"Upserted {len(points)} embeddings to vector store")
         except Exception as e:
             logger.error(f"Error upserting embeddings: {e}")
+            if raise_errors:
+                raise
 
-    def query(self, embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Query the vector store for similar documents."""
-        if not self._ensure_connected():
-            logger.warning("Qdrant not available, returning empty results")
+    def query(self, embedding: List[float], top_k: int = 5, search_filter: Optional[SearchFilter] = None) -> List[Dict[str, Any]]:
+        """Query the vector store for similar documents, optionally restricted by `search_filter`."""
+        if self._dimension_mismatch(embedding):
             return []
+        if not self._ensure_connected():
+            return self._local_search(embedding, top_k, search_filter)
             
         try:
             result = self.client.search(
                 collection_name=self.collection_name, 
                 query_vector=embedding, 
+                query_filter=search_filter.to_qdrant() if search_filter else None,
+                limit=top_k
+            )
+            logger.info(f"Retrieved {len(result)} results from vector store")
+            return [{"id": p.id, "score": p.score, "metadata": p.payload} for p in result]
+        except Exception as e:
+            logger.error(f"Error querying vector store: {e}")
+            self._mark_unavailable()
+            return self._local_search(embedding, top_k, search_filter)
+
+    async def query_async(self, embedding: List[float], top_k: int = 5, search_filter: Optional[SearchFilter] = None) -> List[Dict[str, Any]]:
+        """Query the vector store for similar documents without blocking the event loop."""
+        if self._dimension_mismatch(embedding):
+            return []
+        if not await self._ensure_async_connected():
+            return await asyncio.to_thread(self._local_search, embedding, top_k, search_filter)
+
+        try:
+            result = await self.async_client.search(
+                collection_name=self.collection_name,
+                query_vector=embedding,
+                query_filter=search_filter.to_qdrant() if search_filter else None,
                 limit=top_k
             )
             logger.info(f"Retrieved {len(result)} results from vector store")
             return [{"id": p.id, "score": p.score, "metadata": p.payload} for p in result]
+        except asyncio.CancelledError:
+            # Too slow for the retrieval deadline: answer the next requests from the local index
+            self._mark_unavailable()
+            raise
         except Exception as e:
             logger.error(f"Error querying vector store: {e}")
+            self._mark_unavailable()
+            return await asyncio.to_thread(self._local_search, embedding, top_k, search_filter)
+
+    def _dimension_mismatch(self, embedding: List[float]) -> bool:
+        """True (and logged) when a query vector cannot be compared with the collection's vectors."""
+        if self.vector_size and len(embedding) != self.vector_size:
+            logger.error(
+                f"Query vector has {len(embedding)} dimensions but {self.collection_name} holds {self.vector_size}; "
+                "returning no results"
+            )
+            return True
+        return False
+
+    def _local_search(self, embedding: List[float], top_k: int, search_filter: Optional[SearchFilter]) -> List[Dict[str, Any]]:
+        """Search the embedded index when Qdrant cannot serve the query."""
+        if self.local_index is None:
+            logger.warning("Qdrant not available, returning empty results")
             return []
+        results = self.local_index.search(embedding, top_k, search_filter)
+        logger.info(f"Retrieved {len(results)} results from local vector index")
+        return results
+
+    def _local_write(self, operation: str, *args, **kwargs) -> None:
+        """Mirror a write into the embedded index; failures there never block the Qdrant write."""
+        if self.local_index is None:
+            return
+        try:
+            getattr(self.local_index, operation)(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error writing to local vector index: {e}")
+
+    def delete_by_chunk_ids(self, chunk_ids: List[int]) -> None:
+        """Delete the vectors of specific chunks, whatever point ID scheme they were stored with."""
+        if not chunk_ids:
+            return
+        self._local_write("delete_where", chunk_ids=chunk_ids)
+        if not self._ensure_connected():
+            return
+
+        try:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=rest.FilterSelector(
+                    filter=rest.Filter(
+                        must=[rest.FieldCondition(key="chunk_id", match=rest.MatchAny(any=list(chunk_ids)))]
+                    )
+                )
+            )
+            logger.info(f"Deleted vectors for {len(chunk_ids)} chunks")
+        except Exception as e:
+            logger.error(f"Error deleting chunk vectors: {e}")
+            raise
+
+    def set_document_payload(self, document_id: int, payload: Dict[str, Any]) -> None:
+        """Overwrite payload fields on every point of a document without touching vectors."""
+        self._local_write("set_payload", document_id, payload)
+        if not self._ensure_connected():
+            return
+
+        try:
+            self.client.set_payload(
+                collection_name=self.collection_name,
+                payload=payload,
+                points=rest.Filter(
+                    must=[rest.FieldCondition(key="document_id", match=rest.MatchValue(value=document_id))]
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Error updating payload for document {document_id}: {e}")
 
     def delete_by_document_id(self, document_id: int):
         """Delete all vectors for a specific document."""
+        self._local_write("delete_where", document_id=document_id)
         if not self._ensure_connected():
             logger.warning("Qdrant not available, skipping deletion")
             return
             
         try:
-            from qdrant_client.http import models as rest
-            
             # Delete points with matching document_id in metadata
             self.client.delete(
                 collection_name=self.collection_name,
@@ -0,0 +1,102 @@
+"""
+Concurrency benchmark for the chat endpoint.
+
+Fires N concurrent chat sessions at a running backend and reports p50/p99
+latency for /api/chat/query. While the sessions run, /health is polled in the
+background: if the chat path blocks the event loop, health-check latency climbs
+together with chat latency.
+
+Run it once against the old build and once against the new one:
+
+    python benchmark_chat_concurrency.py --base-url http://localhost:8000 --sessions 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_session(client: httpx.AsyncClient, session_id: str, queries: int, latencies: List[float], errors: List[str]):
+    """Send `queries` sequential chat turns for one session."""
+    for turn in range(queries):
+        payload = {
+            "session_id": session_id,
+            "query": f"What documents are required to transfer land ownership? (turn {turn})",
+            "use_latest_document": True,
+        }
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/chat/query", json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def poll_health(client: httpx.AsyncClient, stop: asyncio.Event, latencies: List[float]):
+    """Measure /health latency until `stop` is set."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/health")
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+
+
+async def main(base_url: str, sessions: int, queries: int, timeout: float):
+    limits = httpx.Limits(max_connections=sessions + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        chat_latencies: List[float] = []
+        health_latencies: List[float] = []
+        errors: List[str] = []
+        stop = asyncio.Event()
+
+        health_task = asyncio.create_task(poll_health(client, stop, health_latencies))
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            run_session(client, f"bench_{int(started)}_{i}", queries, chat_latencies, errors)
+            for i in range(sessions)
+        ])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await health_task
+
+    print("=" * 60)
+    print(f"Chat concurrency benchmark against {base_url}")
+    print("=" * 60)
+    print(f"Sessions: {sessions}  Turns per session: {queries}  Wall time: {elapsed:.2f}s")
+    print(f"Successful requests: {len(chat_latencies)}  Errors: {len(errors)}")
+    if chat_latencies:
+        print(f"Throughput: {len(chat_latencies) / elapsed:.2f} req/s")
+        print(f"/api/chat/query  p50={percentile(chat_latencies, 50) * 1000:.0f}ms  "
+              f"p99={percentile(chat_latencies, 99) * 1000:.0f}ms  "
+              f"mean={statistics.mean(chat_latencies) * 1000:.0f}ms")
+    if health_latencies:
+        print(f"/health          p50={percentile(health_latencies, 50) * 1000:.0f}ms  "
+              f"p99={percentile(health_latencies, 99) * 1000:.0f}ms")
+    if errors:
+        print(f"First error: {errors[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent chat sessions")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of concurrent chat sessions")
+    parser.add_argument("--queries", type=int, default=3, help="Sequential turns per session")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.sessions, args.queries, args.timeout))
@@ -0,0 +1,262 @@
+"""
+Offline bulk ingester for a directory of .pdf and .txt documents.
+
+Walks the directory and ingests every supported file without going through
+the HTTP API, using the same chunking, embedding, vector store and database
+code as the upload endpoints:
+
+- PDF pages are extracted by the process pool in app/services/extraction.py
+  (PDF_EXTRACT_WORKERS), embedding requests run EMBED_MAX_IN_FLIGHT at a
+  time, and each batch's upsert overlaps the next batch's embedding.
+- Files are ingested in groups whose chunks share full-size embedding batches.
+- Per-file progress is checkpointed next to the corpus. An interrupted run
+  resumes where it stopped: finished files are skipped, and a file that was
+  cut off mid-way keeps the chunks whose vectors were written. Files changed
+  since they were ingested are updated in place, re-embedding only new chunks.
+
+    python bulk_ingest.py data/corpus --chunk-strategy sliding
+    python bulk_ingest.py data/corpus --restart    # forget the checkpoint and ingest everything again
+"""
+import argparse
+import json
+import mimetypes
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.db import models
+from app.db.session import SessionLocal, init_db
+from app.services.chunking import ChunkingService, load_tokenizer_length
+from app.services.collections import CollectionManager, LiveServices
+from app.services.embeddings import EmbeddingService
+from app.services.extraction import is_supported, open_pages
+from app.services.ingestion import IngestionService, IngestSource
+from app.services.vectorstore import VectorStoreService
+from benchmark_chat_concurrency import percentile
+
+CHECKPOINT_NAME = ".bulk_ingest_checkpoint.json"
+
+
+class Checkpoint:
+    """Per-file ingest state, written atomically after every change."""
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if not restart and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f)
+
+    def get(self, name: str) -> Dict:
+        return self.files.get(name, {})
+
+    def update(self, name: str, **fields) -> None:
+        with self._lock:
+            self.files.setdefault(name, {}).update(fields)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self.files, f, indent=1)
+            os.replace(temporary, self.path)
+
+
+class Stats:
+    """Throughput counters for the run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.failed = 0
+        self.skipped = 0
+        self.chunks_added = 0
+        self.chunks_unchanged = 0
+        self.embedded = 0
+        self.embed_latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def record_embed(self, texts: int, seconds: float) -> None:
+        with self._lock:
+            self.embedded += texts
+            self.embed_latencies.append(seconds)
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.documents} docs ({self.documents / elapsed:.2f}/s), "
+            f"{self.chunks_added} chunks added ({self.chunks_added / elapsed:.1f}/s), "
+            f"{self.failed} failed, {elapsed:.0f}s"
+        )
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        print("=" * 60)
+        print(f"Documents: {self.documents} ingested, {self.failed} failed, {self.skipped} already up to date")
+        print(f"Chunks: {self.chunks_added} added, {self.chunks_unchanged} unchanged")
+        print(f"Wall time: {elapsed:.1f}s")
+        if elapsed > 0:
+            print(f"Throughput: {self.documents / elapsed:.2f} docs/s, {self.chunks_added / elapsed:.1f} chunks/s")
+        if self.embed_latencies:
+            print(
+                f"Embedding: {len(self.embed_latencies)} batches, {self.embedded} texts, "
+                f"p50={percentile(self.embed_latencies, 50) * 1000:.0f}ms "
+                f"p95={percentile(self.embed_latencies, 95) * 1000:.0f}ms "
+                f"mean={statistics.mean(self.embed_latencies) * 1000:.0f}ms per batch"
+            )
+
+
+class TimedEmbeddingService(EmbeddingService):
+    """EmbeddingService that records the latency of every ingest batch."""
+
+    def __init__(self, stats: Stats):
+        super().__init__()
+        self.stats = stats
+
+    def embed_texts_with_models(self, texts: List[str], input_type: str = "search_document") -> Tuple[List[List[float]], List[str]]:
+        started = time.perf_counter()
+        result = super().embed_texts_with_models(texts, input_type)
+        self.stats.record_embed(len(texts), time.perf_counter() - started)
+        return result
+
+
+def find_documents(directory: str) -> List[str]:
+    """Relative paths of the supported files under `directory`, in a stable order."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if is_supported(name):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+
+def fingerprint(path: str) -> Dict[str, float]:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class BulkIngester:
+    def __init__(self, directory: str, chunk_strategy: str, incremental: bool, checkpoint: Checkpoint, stats: Stats):
+        self.directory = directory
+        self.chunk_strategy = chunk_strategy
+        self.incremental = incremental
+        self.checkpoint = checkpoint
+        self.stats = stats
+        self.chunker = ChunkingService(length_function=load_tokenizer_length())
+        services = LiveServices(TimedEmbeddingService(stats), VectorStoreService())
+        # Same model and collection as the API is serving
+        CollectionManager().bind(services)
+        self.ingestion = IngestionService(services)
+
+    def pending(self, names: List[str]) -> List[str]:
+        """Files that are new, changed, failed or unfinished according to the checkpoint."""
+        todo = []
+        for name in names:
+            entry = self.checkpoint.get(name)
+            if entry.get("status") == "done" and entry.get("fingerprint") == fingerprint(os.path.join(self.directory, name)):
+                self.stats.skipped += 1
+            else:
+                todo.append(name)
+        return todo
+
+    def ingest_group(self, names: List[str]) -> None:
+        db = SessionLocal()
+        try:
+            sources = [self._source(db, name) for name in names]
+            results = self.ingestion.ingest_many(db, sources)
+            for name, result in zip(names, results):
+                if isinstance(result, Exception):
+                    self.stats.failed += 1
+                    entry = self.checkpoint.get(name)
+                    fields = {"status": "failed", "error": str(result)[:500]}
+                    if entry.get("document_id") and db.get(models.Document, entry["document_id"]) is None:
+                        # The document was created by this run and rolled back with it
+                        fields.update(document_id=None, last_chunk_id=None)
+                    self.checkpoint.update(name, **fields)
+                    print(f"  ✗ {name}: {result}")
+                else:
+                    self.stats.documents += 1
+                    self.stats.chunks_added += result.chunks_added
+                    self.stats.chunks_unchanged += result.chunks_unchanged
+                    self.checkpoint.update(name, status="done", document_id=result.document_id, error=None)
+        finally:
+            db.close()
+
+    def _source(self, db, name: str) -> IngestSource:
+        path = os.path.join(self.directory, name)
+        entry = self.checkpoint.get(name)
+        document_id: Optional[int] = entry.get("document_id")
+        if document_id is not None and entry.get("status") != "done":
+            # Cut off mid-way last time: keep the chunks whose vectors are known to be written
+            discarded = self.ingestion.discard_unconfirmed(db, document_id, entry.get("last_chunk_id") or 0)
+            print(f"  ↻ resuming {name} (document {document_id}, {discarded} unconfirmed chunks redone)")
+        self.checkpoint.update(name, status="running", fingerprint=fingerprint(path))
+
+        def chunks() -> Iterator[str]:
+            with open(path, "rb") as source:
+                _, pages = open_pages(name, source)
+                empty = True
+                for chunk in self.chunker.iter_chunks(self.chunk_strategy, pages):
+                    empty = False
+                    yield chunk.text
+            if empty:
+                raise ValueError("File is empty.")
+
+        def on_progress(document_id: int, chunks_indexed: int, last_chunk_id: int) -> None:
+            self.checkpoint.update(name, document_id=document_id, last_chunk_id=last_chunk_id, chunks_indexed=chunks_indexed)
+
+        return IngestSource(
+            filename=name,
+            filetype=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            chunks=chunks(),
+            incremental=self.incremental,
+            # A file ingested before is updated in place, so only changed chunks are embedded again
+            document_id=document_id,
+            on_progress=on_progress,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of .pdf and .txt documents")
+    parser.add_argument("directory")
+    parser.add_argument("--chunk-strategy", choices=("sentence", "sliding"), default="sliding")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update the latest document with the same path instead of creating new ones")
+    parser.add_argument("--files-per-group", type=int, default=32,
+                        help="Files whose chunks share embedding batches and upserts")
+    parser.add_argument("--checkpoint", help=f"Checkpoint file (default: <directory>/{CHECKPOINT_NAME})")
+    parser.add_argument("--restart", action="store_true", help="Ignore the existing checkpoint")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    init_db()
+    stats = Stats()
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.directory, CHECKPOINT_NAME), restart=args.restart)
+    ingester = BulkIngester(args.directory, args.chunk_strategy, args.incremental, checkpoint, stats)
+
+    names = find_documents(args.directory)
+    todo = ingester.pending(names)
+    print(f"Found {len(names)} documents, {len(todo)} to ingest ({stats.skipped} up to date)")
+
+    try:
+        for start in range(0, len(todo), args.files_per_group):
+            ingester.ingest_group(todo[start:start + args.files_per_group])
+            print(f"[{min(start + args.files_per_group, len(todo))}/{len(todo)}] {stats.line()}")
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume.")
+        stats.report()
+        sys.exit(130)
+    except Exception as e:
+        # Embedding or vector store failures affect the whole group; the checkpoint lets a rerun resume it
+        print(f"\n❌ Error: {e}\nRun the same command again to resume.")
+        stats.report()
+        sys.exit(1)
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,16 @@ export const chatAPI = {
     return response.data;
   },
 
+  // Get a page of documents, newest first; pass the previous page's nextCursor for the next one
+  getDocumentPage: async (cursor = null, limit = 50) => {
+    const params = { limit };
+    if (cursor) {
+      params.cursor = cursor;
+    }
+    const response = await api.get('/api/chat/documents', { params });
+    return { documents: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+  },
+
   // Delete a document
   deleteDocument: async (documentId) => {
     const response = await api.delete(`/api/chat/documents/${documentId}`);
@@ -46,7 +56,7 @@ export const chatAPI = {
 
 // Document Ingestion API
 export const ingestAPI = {
-  // Upload a document
+  // Upload a document and wait until its ingestion job has finished
   uploadDocument: async (file, chunkStrategy = 'sentence') => {
     const formData = new FormData();
     formData.append('file', file);
@@ -57,6 +67,21 @@ export const ingestAPI = {
         'Content-Type': 'multipart/form-data',
       },
     });
+
+    let job = await ingestAPI.getJob(response.data.job_id);
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      job = await ingestAPI.getJob(job.job_id);
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Document processing failed');
+    }
+    return job;
+  },
+
+  // Get the stage and progress of an ingestion job
+  getJob: async (jobId) => {
+    const response = await api.get(`/api/ingest/jobs/${jobId}`);
     return response.data;
   },
 };
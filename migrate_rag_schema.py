@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Migration script for the RAG schema (documents / document_chunks).
+
+`init_db()` only creates missing tables, so columns and indexes added to
+app/db/models.py after a database was first created are applied here.
+Every step checks the live schema first, so the script is safe to re-run.
+"""
+from sqlalchemy import inspect, text
+
+from app.db.session import engine, init_db
+
+
+def add_column(table: str, column: str, ddl: str):
+    """Add a column if the table does not have it yet."""
+    columns = {col["name"] for col in inspect(engine).get_columns(table)}
+    if column in columns:
+        print(f"✓ {table}.{column} already exists")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    print(f"✅ Added {table}.{column}")
+
+
+def create_index(table: str, name: str, ddl: str, dialect: str = None):
+    """Create an index if it does not exist yet, optionally only on one database dialect."""
+    if dialect and engine.dialect.name != dialect:
+        print(f"- {name} skipped (only for {dialect})")
+        return
+    indexes = {index["name"] for index in inspect(engine).get_indexes(table)}
+    if name in indexes:
+        print(f"✓ {name} already exists")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+    print(f"✅ Created index {name}")
+
+
+def migrate():
+    """Apply all pending schema changes."""
+    # Creates any table that does not exist yet (with its current columns and indexes)
+    init_db()
+
+    add_column("document_chunks", "content_hash", "VARCHAR(64)")
+    add_column("document_chunks", "embedding", "BYTEA" if engine.dialect.name == "postgresql" else "BLOB")
+    add_column("document_chunks", "embedding_dtype", "VARCHAR(8)")
+    add_column("document_chunks", "embedding_model", "VARCHAR(128)")
+    add_column("ingest_jobs", "batch_id", "VARCHAR(36)")
+    create_index("ingest_jobs", "ix_ingest_jobs_batch_id", "CREATE INDEX IF NOT EXISTS ix_ingest_jobs_batch_id ON ingest_jobs (batch_id)")
+    create_index(
+        "documents",
+        "ix_documents_uploaded_at_id",
+        "CREATE INDEX IF NOT EXISTS ix_documents_uploaded_at_id ON documents (uploaded_at, id)",
+    )
+    create_index(
+        "document_chunks",
+        "ix_document_chunks_document_id",
+        "CREATE INDEX IF NOT EXISTS ix_document_chunks_document_id ON document_chunks (document_id)",
+    )
+    create_index(
+        "document_chunks",
+        "ix_document_chunks_fts",
+        "CREATE INDEX IF NOT EXISTS ix_document_chunks_fts ON document_chunks USING gin (to_tsvector('english', chunk_text))",
+        dialect="postgresql",
+    )
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("RAG Schema Migration Script")
+    print("=" * 60)
+    try:
+        migrate()
+        print("\n✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
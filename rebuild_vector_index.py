@@ -0,0 +1,126 @@
+"""
+Rebuild the vector store from the embeddings stored in the database.
+
+Streams the quantized copy of every chunk's vector (see EMBEDDING_STORE_DTYPE)
+out of document_chunks together with its payload, and upserts it in large
+batches while the next batch is read, so a lost Qdrant volume or a recreated
+collection is restored at I/O speed without a single embedding API call.
+
+Only vectors from one model go into a collection (by default the live
+collection and its model, see app/services/collections.py). Chunks stored
+without a vector, ingested before vectors were kept or with
+EMBEDDING_STORE_DTYPE=none, are counted and skipped; re-ingest their
+documents to index them.
+
+    python rebuild_vector_index.py --recreate
+    python rebuild_vector_index.py --collection documents --model cohere:embed-english-v3.0 --batch-size 1024
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from app.db import models
+from app.db.session import SessionLocal, init_db
+from app.services.collections import CollectionManager, chunk_payload, iter_stored_chunks
+from app.services.stored_embeddings import decode_embedding
+from app.services.vectorstore import VectorStoreService
+
+Batch = Tuple[List[List[float]], List[Dict]]
+
+
+def stored_vector_counts(db) -> Dict[Optional[str], int]:
+    """Number of chunks per embedding model; None counts chunks stored without a vector."""
+    rows = (
+        db.query(models.DocumentChunk.embedding_model, func.count(models.DocumentChunk.id))
+        .group_by(models.DocumentChunk.embedding_model)
+        .all()
+    )
+    return {model: count for model, count in rows}
+
+
+def iter_batches(db, model: str, batch_size: int) -> Iterator[Batch]:
+    """Yield (vectors, payloads) for the chunks embedded by `model`, in chunk ID order."""
+    for rows in iter_stored_chunks(db, batch_size=batch_size, model_id=model):
+        vectors = [decode_embedding(row.embedding, row.embedding_dtype).tolist() for row in rows]
+        yield vectors, [chunk_payload(row) for row in rows]
+
+
+def rebuild(vectorstore: VectorStoreService, batches: Iterator[Batch], recreate: bool) -> int:
+    """Upsert every batch, one in flight while the next is read; returns the number of points written."""
+    written = 0
+    dim: Optional[int] = None
+    in_flight: Optional[Future] = None
+    started = time.perf_counter()
+
+    batch = next(batches, None)
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        while batch is not None:
+            next_batch = next(batches, None)
+            vectors, payloads = batch
+            if dim is None:
+                dim = len(vectors[0])
+                if recreate and vectorstore.use_qdrant:
+                    vectorstore.recreate_collection(dim)
+            if any(len(vector) != dim for vector in vectors):
+                raise ValueError(f"Stored vectors of mixed dimensions (expected {dim}) near chunk {payloads[0]['chunk_id']}")
+
+            if in_flight is not None:
+                in_flight.result()
+            # The last batch waits for Qdrant to apply every write before the run reports success
+            in_flight = writer.submit(
+                vectorstore.upsert_embeddings, vectors, payloads, wait=next_batch is None, raise_errors=True
+            )
+            written += len(vectors)
+            elapsed = time.perf_counter() - started
+            print(f"  {written} points ({written / elapsed:.0f}/s)", end="\r", flush=True)
+            batch = next_batch
+
+        if in_flight is not None:
+            in_flight.result()
+    print()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", help="Qdrant collection to fill (default: the live one)")
+    parser.add_argument("--model", help="Embedding model ID to restore (default: the live collection's)")
+    parser.add_argument("--batch-size", type=int, default=512, help="Points per upsert request")
+    parser.add_argument("--recreate", action="store_true", help="Drop and recreate the collection first")
+    args = parser.parse_args()
+
+    init_db()
+    live_collection, live_spec = CollectionManager().live()
+    collection = args.collection or live_collection
+    model = args.model or live_spec.model_id
+    vectorstore = VectorStoreService(collection_name=collection, vector_size=live_spec.dim if model == live_spec.model_id else None)
+
+    db = SessionLocal()
+    try:
+        counts = stored_vector_counts(db)
+        available = counts.get(model, 0)
+        print(f"Stored vectors for {model}: {available}")
+        for other, count in sorted(counts.items(), key=lambda item: -item[1]):
+            if other != model:
+                print(f"  skipped: {count} chunks " + (f"embedded by {other}" if other else "without a stored vector"))
+        if not available:
+            print("Nothing to restore.")
+            return
+
+        started = time.perf_counter()
+        written = rebuild(vectorstore, iter_batches(db, model, args.batch_size), args.recreate)
+        elapsed = time.perf_counter() - started
+        print(f"✅ Restored {written} vectors into {collection} in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f}/s)")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Failure handling tests for the background ingest jobs (app/services/ingest_jobs.py)
+
+    python -m pytest test_ingest_jobs.py
+"""
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import models
+from app.services import ingestion
+from app.services.chunking import ChunkingService
+from app.services.collections import LiveServices
+from app.services.embeddings import EmbeddingService
+from app.services.ingest_jobs import FAILED, INGEST_MAX_ATTEMPTS, QUEUED, IngestJobQueue
+from app.services.ingestion import IngestionService
+from app.services.local_index import LocalVectorIndex
+from app.services.vectorstore import VectorStoreService
+
+
+class FlakyEmbeddingService(EmbeddingService):
+    """Embeds the first batch of every attempt, then fails as if the provider went down."""
+
+    def __init__(self):
+        super().__init__(provider="hash", dimension=16)
+        self.calls = 0
+
+    def embed_texts_with_models(self, texts, input_type="search_document"):
+        self.calls += 1
+        if self.calls % 2 == 0:
+            raise RuntimeError("embedding provider unavailable")
+        return super().embed_texts_with_models(texts, input_type)
+
+
+def test_job_failing_for_good_leaves_no_document(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "INGEST_BATCH_SIZE", 4)
+    engine = create_engine(f"sqlite:///{tmp_path / 'rag.db'}")
+    models.Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    vectorstore = VectorStoreService(vector_size=16)
+    vectorstore.use_qdrant = False
+    vectorstore.local_index = LocalVectorIndex(str(tmp_path / "index"))
+    service = IngestionService(LiveServices(FlakyEmbeddingService(), vectorstore))
+    jobs = IngestJobQueue(service, ChunkingService(), session_factory=session_factory, spool_dir=str(tmp_path))
+
+    spool_path = tmp_path / "upload.txt"
+    spool_path.write_text(" ".join(f"Sentence number {i} about the mountains." for i in range(400)))
+    db = session_factory()
+    db.add(models.IngestJob(
+        id="job-1", filename="upload.txt", filetype="txt", chunk_strategy="sliding", spool_path=str(spool_path)
+    ))
+    db.commit()
+
+    for attempt in range(1, INGEST_MAX_ATTEMPTS + 1):
+        jobs._run("job-1")
+        if attempt < INGEST_MAX_ATTEMPTS:
+            # Retried: the partly written document stays for the next attempt to resume
+            db.expire_all()
+            assert db.get(models.IngestJob, "job-1").status == QUEUED
+            assert db.query(models.Document).count() == 1
+            assert db.query(models.DocumentChunk).count() == 4
+            assert len(vectorstore.local_index) == 4
+
+    db.expire_all()
+    job = db.get(models.IngestJob, "job-1")
+    assert job.status == FAILED
+    assert job.document_created
+    assert db.query(models.Document).count() == 0
+    assert db.query(models.DocumentChunk).count() == 0
+    assert len(vectorstore.local_index) == 0
+    assert not os.path.exists(spool_path)
+    db.close()
@@ -0,0 +1,79 @@
+"""
+Crash recovery tests for the embedded vector index (app/services/local_index.py)
+
+    python -m pytest test_local_index.py
+"""
+import json
+import os
+
+import numpy as np
+
+from app.services.local_index import LocalVectorIndex
+
+DIM = 8
+
+
+def vector(seed: int) -> list:
+    return np.random.default_rng(seed).standard_normal(DIM).tolist()
+
+
+def payload(chunk_id: int) -> dict:
+    return {"document_id": 1, "chunk_id": chunk_id, "text": f"chunk {chunk_id}"}
+
+
+def top_id(index: LocalVectorIndex, seed: int):
+    hits = index.search(vector(seed), top_k=1)
+    assert hits and hits[0]["score"] > 0.999
+    return hits[0]["id"]
+
+
+def test_unlogged_rows_are_cut_before_the_next_write(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(["a"], [vector(1)], [payload(1)])
+
+    # A writer died after appending its vectors but before logging them
+    with open(index._file("vectors.f32"), "ab") as f:
+        f.write(np.ones((3, DIM), dtype=np.float32).tobytes())
+
+    index.upsert(["b"], [vector(2)], [payload(2)])
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert top_id(reopened, 1) == "a"
+    assert top_id(reopened, 2) == "b"
+    assert os.path.getsize(index._file("vectors.f32")) == 2 * DIM * 4
+
+
+def test_truncated_log_replays_and_is_repaired(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(["a", "b"], [vector(1), vector(2)], [payload(1), payload(2)])
+
+    # A writer died part-way through its vectors and log line
+    with open(index._file("vectors.f32"), "ab") as f:
+        f.write(np.ones(DIM // 2, dtype=np.float32).tobytes())
+    with open(index._file("log.jsonl"), "a") as f:
+        f.write('{"op": "add", "id": "c", "ro')
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert len(reopened) == 2
+    reopened.upsert(["d"], [vector(4)], [payload(4)])
+
+    replayed = LocalVectorIndex(str(tmp_path))
+    assert len(replayed) == 3
+    assert [top_id(replayed, seed) for seed in (1, 2, 4)] == ["a", "b", "d"]
+    with open(index._file("log.jsonl")) as f:
+        assert all(json.loads(line) for line in f)
+
+
+def test_log_without_row_offsets_still_replays(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(["a", "b"], [vector(1), vector(2)], [payload(1), payload(2)])
+
+    # Logs written before rows were recorded explicitly
+    with open(index._file("log.jsonl")) as f:
+        entries = [json.loads(line) for line in f]
+    with open(index._file("log.jsonl"), "w") as f:
+        for entry in entries:
+            entry.pop("row")
+            f.write(json.dumps(entry) + "\n")
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert [top_id(reopened, seed) for seed in (1, 2)] == ["a", "b"]